@@ -1,31 +1,51 @@
 from fastapi import APIRouter, HTTPException, Depends, status
 from fastapi.security import OAuth2PasswordRequestForm
 from schemas.schemas import Token, UserCreate, UserOut, UserUpdate
-from manager.auth_manager import create_user, get_user_by_email, update_user_profile, delete_user_by_id
+from manager.auth_manager import create_user, get_user_by_email, update_user_profile, delete_user_by_id, update_password_hash
 from services.security import get_current_user, create_access_token, create_refresh_token
-from utils.password_utils import verify_password
-from services.sns_notify import subscribe_user_to_topic  # ✅ NEW IMPORT
+from utils.password_utils import verify_password_async, PasswordPoolBusy
+from services.sns_notify import queue_subscription  # ✅ NEW IMPORT
 
 router = APIRouter(prefix="/auth", tags=["Authentication"])
 
+# Returned when the bcrypt pool is saturated, so a login burst sheds load
+# instead of queueing without bound.
+pool_busy_exception = HTTPException(
+    status_code=503,
+    detail="Too many authentication requests, please retry shortly",
+    headers={"Retry-After": "1"},
+)
+
 @router.post("/register", response_model=UserOut, status_code=status.HTTP_201_CREATED)
 async def register(user: UserCreate):
-    existing_user = await get_user_by_email(user.email)
-    if existing_user:
-        raise HTTPException(status_code=400, detail="User with this email already exists")
-
-    new_user = await create_user(user)
+    # create_user rejects an already-registered email atomically (400)
+    try:
+        new_user = await create_user(user)
+    except PasswordPoolBusy:
+        raise pool_busy_exception
 
-    # ✅ Subscribe user to SNS topic (confirmation mail will be sent)
-    subscribe_user_to_topic(user.email)
+    # ✅ Subscribe user to SNS topic via the outbox (confirmation mail will be sent)
+    try:
+        await queue_subscription(user.email)
+    except Exception as e:
+        print(f"[SNS ERROR] Could not queue subscription for {user.email}: {e}")
 
     return new_user
 
 @router.post("/login", response_model=Token)
 async def login(form_data: OAuth2PasswordRequestForm = Depends()):
     user = await get_user_by_email(form_data.username)
-    if not user or not verify_password(form_data.password, user.get("hashed_password", "")):
+    if not user or not user.get("hashed_password"):
+        raise HTTPException(status_code=401, detail="Invalid email or password")
+    try:
+        valid, new_hash = await verify_password_async(form_data.password, user["hashed_password"])
+    except PasswordPoolBusy:
+        raise pool_busy_exception
+    if not valid:
         raise HTTPException(status_code=401, detail="Invalid email or password")
+    if new_hash:
+        # Stored hash used an old cost factor; upgrade it now that we know the password
+        await update_password_hash(user["id"], new_hash)
     return Token(
         access_token=create_access_token(user_id=user["id"], email=user["email"]),
         refresh_token=create_refresh_token(user_id=user["id"], email=user["email"]),
@@ -1,142 +1,145 @@
 import os
+import json
 import asyncio
 from uuid import uuid4
-from fastapi import APIRouter, Depends, HTTPException, BackgroundTasks,Path
+from datetime import datetime, timezone
+from typing import Optional
+from fastapi import APIRouter, Depends, HTTPException, Path, Query, Request, Response, status
+from fastapi.responses import StreamingResponse
 from elasticsearch import AsyncElasticsearch, NotFoundError
+from search.connection import get_es
 
 from services.security import get_current_user
-from schemas.schemas import ChallengeCreate, ChallengeOut
-from services.dify_agents import (
-    trigger_agent_1,
-    trigger_agent_2_breakdown,
-    trigger_agent_3_testcases,
+from schemas.schemas import ChallengeCreate, ChallengeOut, ChallengeGenerationStatus
+from manager.challenge_manager import (
+    get_generation_status,
+    start_challenge,
+    retry_challenge_generation,
+    retry_repo_provisioning,
+    get_challenge_repos,
 )
-from utils.es_utils import save_challenge
-from services.sns_notify import notify_member_of_new_repo
-from services.github_service import create_challenge_repository_and_invite
-from manager.group_manager_es import get_group_members_es
-from manager.auth_manager import get_user_by_id
+from manager.submission_manager import SUMMARY_INDEX, load_recent_feedback
+from utils.es_utils import get_challenge_meta, delete_challenge
+from utils.pagination import search_page
 
 CHALLENGE_INDEX = "challenges"
 BREAKDOWN_INDEX = "breakdowns"
 SUBMISSION_INDEX = "submissions"
 
 TESTCASE_INDEX = "testcases"
-ELASTICSEARCH_URL = os.getenv("ELASTICSEARCH_URL", "http://localhost:9200")
+# Fields the challenge history shows; problem statements stay out of list pages
+CHALLENGE_LIST_FIELDS = ["id", "Topic", "topic", "difficulty", "group_id", "created_by", "created_at", "status"]
+
+CHALLENGE_EVENTS_POLL_SECONDS = float(os.getenv("CHALLENGE_EVENTS_POLL_SECONDS", "1"))
 
-es = AsyncElasticsearch(ELASTICSEARCH_URL)
 router = APIRouter(prefix="/challenges", tags=["Challenges"])
 
-# --- Background Task ---
-async def setup_challenge_repos_for_group(
-    challenge_id: str,
-    group_id: str,
-    challenge_topic: str,
-    api_description: str = ""  # ✅ NEW PARAM
+@router.post("/", response_model=ChallengeOut, status_code=202)
+async def create_challenge(
+    challenge: ChallengeCreate,
+    current_user=Depends(get_current_user)
 ):
     """
-    Creates a unique, private GitHub repo for each member of a group.
-    Sends SNS email with API info.
+    Creates a challenge from the pre-generated pool when possible (status
+    `ready`); otherwise stores it as `generating` and queues generation.
+    Repos are created once content is ready. Poll /challenges/{id}/status
+    or stream /challenges/{id}/events for progress.
     """
-    print(f"🚀 Starting background task: Create repos for challenge {challenge_id}")
-    
-    member_ids = await get_group_members_es(group_id)
-    if not member_ids:
-        print(f"[WARN] No members found for group {group_id}.")
-        return
-
-    for user_id in member_ids:
-        user = await get_user_by_id(user_id)
-        if not user:
-            print(f"[WARN] User {user_id} not found. Skipping.")
-            continue
-
-        email = user.get("email")
-        github_username = user.get("github_username")
-
-        if not email or not github_username:
-            print(f"[WARN] User {user_id} missing email or GitHub username. Skipping.")
-            continue
-
-        print(f"Creating repo for challenge '{challenge_id}' for user '{github_username}'...")
-
-        repo_details = create_challenge_repository_and_invite(
-            challenge_id=challenge_id,
-            user_id=user_id,
-            collaborator_username=github_username
-        )
+    doc = challenge.dict()
+    doc["id"] = str(uuid4())
+    doc["created_by"] = current_user["id"]
+    doc["created_at"] = datetime.now(timezone.utc)
 
-        if not repo_details:
-            print(f"❌ Repo creation failed for user {user_id}.")
-            continue
-
-        # ✅ Notify user with API description from Agent 2
-        notify_member_of_new_repo(
-            email=email,
-            challenge_title=challenge_topic,
-            repo_name=repo_details["repo_name"],
-            clone_url=repo_details["clone_url"],
-            api_description=api_description
-        )
-        await asyncio.sleep(2)  # Avoid rate limit
+    try:
+        doc = await start_challenge(doc, current_user["id"])
+    except Exception as e:
+        print(f"❌ Could not start challenge {doc['id']}: {e}")
+        raise HTTPException(status_code=503, detail=f"Could not create challenge: {e}")
+    return ChallengeOut(**doc)
+
+
+@router.get("/{challenge_id}/status", response_model=ChallengeGenerationStatus)
+async def get_challenge_status(
+    challenge_id: str = Path(..., title="Challenge ID"),
+    current_user=Depends(get_current_user)
+):
+    """
+    Generation progress per agent step, plus repo provisioning state.
+    """
+    status_doc = await get_generation_status(challenge_id)
+    if not status_doc:
+        raise HTTPException(status_code=404, detail=f"Challenge with ID '{challenge_id}' not found.")
+    return status_doc
 
-    print(f"✅ Repo setup completed for challenge {challenge_id}")
 
+@router.post("/{challenge_id}/retry", response_model=ChallengeGenerationStatus, status_code=202)
+async def retry_challenge(
+    challenge_id: str = Path(..., title="Challenge ID"),
+    current_user=Depends(get_current_user)
+):
+    """
+    Resumes a failed generation from its first unfinished step. Only the creator may retry.
+    """
+    await retry_challenge_generation(challenge_id, current_user["id"])
+    return await get_generation_status(challenge_id)
 
-@router.post("/", response_model=ChallengeOut, status_code=202)
-async def create_challenge(
-    challenge: ChallengeCreate,
-    background_tasks: BackgroundTasks,
+
+@router.get("/{challenge_id}/repos")
+async def list_challenge_repos(
+    challenge_id: str = Path(..., title="Challenge ID"),
     current_user=Depends(get_current_user)
 ):
     """
-    Creates a challenge, generates content via agents, and schedules repo creation.
+    Per-member repo provisioning results (created / failed / skipped, notified).
     """
-    challenge_id = str(uuid4())
-    doc = challenge.dict()
-    doc["id"] = challenge_id
-    doc["created_by"] = current_user["id"]
+    return await get_challenge_repos(challenge_id)
 
-    try:
-        print(f"[{challenge_id}] Triggering agents for topic: {challenge.Topic}")
-        problem_statement = await trigger_agent_1(Topic=challenge.Topic, difficulty=challenge.difficulty, user_id=current_user["id"])
-        doc["problem_statement"] = problem_statement.get("data", {}).get("outputs", {}).get("answer", "").strip()
-        if not doc["problem_statement"]:
-            raise ValueError("Agent 1 (Problem Statement) returned empty.")
 
-        breakdown_result = await trigger_agent_2_breakdown(statement=doc["problem_statement"], user_id=current_user["id"])
-        breakdown_text = breakdown_result.get("data", {}).get("outputs", {}).get("answer", {}).get("api", "")
-        api_description = breakdown_text  # ✅ Needed in background task
+@router.post("/{challenge_id}/repos/retry", response_model=ChallengeGenerationStatus, status_code=202)
+async def retry_challenge_repos(
+    challenge_id: str = Path(..., title="Challenge ID"),
+    current_user=Depends(get_current_user)
+):
+    """
+    Re-runs provisioning for members whose repo or email failed. Only the creator may retry.
+    """
+    await retry_repo_provisioning(challenge_id, current_user["id"])
+    return await get_generation_status(challenge_id)
+
 
-        test_result = await trigger_agent_3_testcases(prompt=doc["problem_statement"], user_id=current_user["id"])
-        test_cases_text = test_result.get("data", {}).get("outputs", {}).get("answer", {}).get("raw_text_from_previous_step", "")
+@router.get("/{challenge_id}/events")
+async def stream_challenge_status(
+    request: Request,
+    challenge_id: str = Path(..., title="Challenge ID"),
+    current_user=Depends(get_current_user)
+):
+    """
+    Server-sent events: one `progress` event whenever the generation status
+    changes, ending once the challenge is ready (or failed).
+    """
+    status_doc = await get_generation_status(challenge_id)
+    if not status_doc:
+        raise HTTPException(status_code=404, detail=f"Challenge with ID '{challenge_id}' not found.")
 
-        await save_challenge(doc)
-        await es.index(index=BREAKDOWN_INDEX, id=challenge_id, document={"challenge_id": challenge_id, "breakdown": breakdown_text})
-        await es.index(index=TESTCASE_INDEX, id=challenge_id, document={"challenge_id": challenge_id, "testcases": test_cases_text})
-        print(f"[{challenge_id}] ✅ Agent generation complete.")
+    async def events():
+        current, last = status_doc, None
+        while True:
+            if current != last:
+                yield f"event: progress\ndata: {json.dumps(current, default=str)}\n\n"
+                last = current
+            if current["status"] != "generating" or await request.is_disconnected():
+                return
+            await asyncio.sleep(CHALLENGE_EVENTS_POLL_SECONDS)
+            current = await get_generation_status(challenge_id) or {**last, "status": "deleted"}
 
-    except Exception as e:
-        print(f"❌ Exception during agent orchestration: {e}")
-        raise HTTPException(status_code=503, detail=f"Agent failure: {e}")
-
-    # ✅ Schedule background task and pass Agent 2 breakdown
-    background_tasks.add_task(
-        setup_challenge_repos_for_group,
-        challenge_id=challenge_id,
-        group_id=challenge.group_id,
-        challenge_topic=challenge.Topic,
-        api_description=api_description  # ✅ Passed here
-    )
-
-    print(f"[{challenge_id}] ✅ Background task for repo setup scheduled.")
-    return ChallengeOut(**doc)
+    return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
 
 
 @router.get("/{challenge_id}", response_model=ChallengeOut)
 async def get_challenge_by_id(
     challenge_id: str = Path(..., title="Challenge ID"),
-    current_user=Depends(get_current_user)
+    current_user=Depends(get_current_user),
+    es: AsyncElasticsearch = Depends(get_es)
 ):
     """
     Retrieve a challenge by its ID.
@@ -152,8 +155,27 @@ async def get_challenge_by_id(
         raise HTTPException(status_code=404, detail=f"Challenge with ID '{challenge_id}' not found.")
     
 
+@router.delete("/{challenge_id}", status_code=status.HTTP_204_NO_CONTENT)
+async def delete_challenge_by_id(
+    challenge_id: str = Path(..., title="Challenge ID"),
+    current_user=Depends(get_current_user)
+):
+    """
+    Deletes a challenge with its breakdown and test cases. Only the creator may delete it.
+    """
+    challenge_meta = await get_challenge_meta(challenge_id)
+    if not challenge_meta:
+        raise HTTPException(status_code=404, detail=f"Challenge with ID '{challenge_id}' not found.")
+    if challenge_meta.get("created_by") != current_user["id"]:
+        raise HTTPException(status_code=403, detail="Only the challenge creator can delete it.")
+
+    if not await delete_challenge(challenge_id):
+        raise HTTPException(status_code=404, detail=f"Challenge with ID '{challenge_id}' not found.")
+    return
+
+
 @router.get("/groups/{group_id}")
-async def get_group(group_id: str):
+async def get_group(group_id: str, es: AsyncElasticsearch = Depends(get_es)):
     response = await es.get(index="groups", id=group_id, ignore=[404])
     if not response["found"]:
         raise HTTPException(status_code=404, detail="Group not found")
@@ -161,24 +183,41 @@ async def get_group(group_id: str):
 
 
 @router.get("/group/{group_id}/previous")
-async def get_previous_challenges(group_id: str, current_user=Depends(get_current_user)):
+async def get_previous_challenges(
+    group_id: str,
+    response: Response,
+    limit: int = Query(20, ge=1, le=100),
+    after: Optional[str] = None,
+    current_user=Depends(get_current_user)
+):
     """
-    Returns all previous challenges created in the given group.
+    Returns previous challenges created in the given group, newest first,
+    without their problem statements. Pass the X-Next-Cursor header value as
+    `after` to fetch older ones.
     """
     try:
         query = {
             "bool": {
-                "must": [
-                    { "match": { "group_id": group_id } }
+                "filter": [
+                    { "term": { "group_id": group_id } }
                 ]
             }
         }
 
-        results = await es.search(index=CHALLENGE_INDEX, query=query, size=100)
-        challenges = [hit["_source"] for hit in results["hits"]["hits"]]
-
-        return challenges
+        hits, next_cursor = await search_page(
+            CHALLENGE_INDEX,
+            query=query,
+            sort=[{"created_at": {"order": "desc", "unmapped_type": "date"}}],
+            limit=limit,
+            after=after,
+            source_includes=CHALLENGE_LIST_FIELDS,
+        )
+        if next_cursor:
+            response.headers["X-Next-Cursor"] = next_cursor
+        return [hit["_source"] for hit in hits]
 
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         print(f"❌ Error fetching previous challenges for group {group_id}: {e}")
         raise HTTPException(status_code=500, detail="Failed to fetch previous challenges")
@@ -188,39 +227,13 @@ async def get_previous_challenges(group_id: str, current_user=Depends(get_curren
 @router.get("/feedback/{user_id}")
 async def get_recent_feedback(user_id: str):
     """
-    Returns last 2 feedbacks for a user based on submissions.
+    Returns last 2 feedbacks for a user, found through their submission summaries.
     """
     try:
-        query = {
-            "bool": {
-                "must": [
-                    {"match": {"user_id": user_id}},
-                    {"match": {"status": "completed"}}
-                ]
-            }
-        }
-
-        results = await es.search(
-            index=SUBMISSION_INDEX,
-            query=query,
-            size=2,
-            sort=[{"processed_at": {"order": "desc"}}]
-        )
-
-        feedbacks = []
-        for hit in results["hits"]["hits"]:
-            src = hit["_source"]
-            feedbacks.append({
-                "challenge_id": src.get("challenge_id"),
-                "score": src.get("score"),
-                "feedback": src.get("feedback"),
-                "processed_at": src.get("processed_at")
-            })
-
-        return feedbacks
+        return await load_recent_feedback(user_id)
 
     except NotFoundError:
-        print(f"❌ Submissions index '{SUBMISSION_INDEX}' not found.")
+        print(f"❌ Index '{SUMMARY_INDEX}' or '{SUBMISSION_INDEX}' not found.")
         raise HTTPException(status_code=500, detail="Submission index not found.")
     except Exception as e:
         print(f"❌ Error fetching feedback for user {user_id}: {e}")
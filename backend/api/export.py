@@ -0,0 +1,43 @@
+from datetime import datetime, timezone
+from typing import Optional
+from fastapi import APIRouter, Depends, HTTPException, Path
+from fastapi.responses import StreamingResponse
+from services.security import get_admin_user
+from manager.export_manager import build_export_query, export_ndjson, gzip_stream
+
+router = APIRouter(prefix="/admin/export", tags=["Admin Export"])
+
+
+@router.get("/{kind}")
+async def export_collection(
+    kind: str = Path(..., description="submissions, challenges or leaderboard"),
+    group_id: Optional[str] = None,
+    challenge_id: Optional[str] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    compress: bool = True,
+    admin=Depends(get_admin_user)
+):
+    """
+    Streams every matching document as NDJSON (gzip-compressed unless
+    compress=false). `since` is inclusive and `until` exclusive; neither
+    applies to the leaderboard. Memory use does not grow with the export.
+    """
+    try:
+        query = await build_export_query(kind, group_id, challenge_id, since, until)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    stamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+    body = export_ndjson(kind, query)
+    if compress:
+        return StreamingResponse(
+            gzip_stream(body),
+            media_type="application/gzip",
+            headers={"Content-Disposition": f'attachment; filename="{kind}-{stamp}.ndjson.gz"'},
+        )
+    return StreamingResponse(
+        body,
+        media_type="application/x-ndjson",
+        headers={"Content-Disposition": f'attachment; filename="{kind}-{stamp}.ndjson"'},
+    )
@@ -1,5 +1,5 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from typing import List
+from fastapi import APIRouter, Depends, HTTPException, Query, Response, status
+from typing import List, Optional
 from fastapi import BackgroundTasks
 from schemas.schemas import GroupCreate, GroupOut
 
@@ -11,6 +11,7 @@ from manager.group_manager_es import (
     get_group_es,
     join_group_es,
     get_group_members_es,
+    get_group_member_profiles_es,
     delete_group_es
 )
 
@@ -26,8 +27,18 @@ async def create_group(
     return GroupOut(**group_data)
 
 @router.get("/", response_model=List[GroupOut])
-async def list_groups():
-    groups = await list_groups_es()
+async def list_groups(
+    response: Response,
+    limit: int = Query(100, ge=1, le=500),
+    after: Optional[str] = None
+):
+    """
+    One page of groups. Pass the X-Next-Cursor header value as `after` to
+    fetch the next page.
+    """
+    groups, next_cursor = await list_groups_es(limit=limit, after=after)
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
     return [GroupOut(**g) for g in groups]
 
 @router.get("/{group_id}", response_model=GroupOut)
@@ -52,8 +63,19 @@ async def join_group(
     return group_data
 
 @router.get("/{group_id}/members")
-async def get_group_members(group_id: str):
-    members = await get_group_members_es(group_id)
+async def get_group_members(
+    group_id: str,
+    details: bool = False,
+    current_user=Depends(get_current_user)
+):
+    """
+    Member ids, or with ?details=true (members only) their usernames and
+    GitHub usernames.
+    """
+    if details:
+        members = await get_group_member_profiles_es(group_id, current_user["id"])
+    else:
+        members = await get_group_members_es(group_id)
     return {"group_id": group_id, "members": members}
 
 
@@ -1,10 +1,12 @@
-from fastapi import APIRouter, Depends
-from typing import List
+from fastapi import APIRouter, Depends, Query, Response
+from typing import List, Optional
 from services.security import get_current_user
-from schemas.schemas import LeaderboardEntry, GroupLeaderboardEntry
+from schemas.schemas import LeaderboardEntry, GroupLeaderboardEntry, LeaderboardPosition
 from manager.leaderboard import (
     get_global_leaderboard_es,
     get_group_leaderboard_es,
+    get_global_position,
+    get_group_position,
 )
 
 router = APIRouter(prefix="/leaderboard", tags=["Leaderboard"])
@@ -12,11 +14,41 @@ router = APIRouter(prefix="/leaderboard", tags=["Leaderboard"])
 
 # ---------------- Global Leaderboard ----------------
 @router.get("/global", response_model=List[LeaderboardEntry])
-async def get_global_leaderboard(current_user=Depends(get_current_user)):
-    return await get_global_leaderboard_es()
+async def get_global_leaderboard(
+    response: Response,
+    limit: int = Query(50, ge=1, le=200),
+    after: Optional[str] = None,
+    current_user=Depends(get_current_user)
+):
+    """
+    Global XP ranking. Pass the X-Next-Cursor header value as `after` to
+    fetch the next page.
+    """
+    entries, next_cursor = await get_global_leaderboard_es(limit=limit, after=after)
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return entries
 
 
 # ---------------- Group Leaderboard ----------------
 @router.get("/group/{group_id}", response_model=List[GroupLeaderboardEntry])
 async def get_group_leaderboard(group_id: str, current_user=Depends(get_current_user)):
     return await get_group_leaderboard_es(group_id)
+
+
+# ---------------- My Rank ----------------
+@router.get("/global/me", response_model=LeaderboardPosition)
+async def get_my_global_rank(
+    radius: int = Query(5, ge=0, le=50),
+    current_user=Depends(get_current_user)
+):
+    return get_global_position(current_user["id"], radius)
+
+
+@router.get("/group/{group_id}/me", response_model=LeaderboardPosition)
+async def get_my_group_rank(
+    group_id: str,
+    radius: int = Query(5, ge=0, le=50),
+    current_user=Depends(get_current_user)
+):
+    return get_group_position(group_id, current_user["id"], radius)
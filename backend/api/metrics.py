@@ -0,0 +1,102 @@
+from fastapi import APIRouter
+from search.connection import get_pool_stats
+from manager.leaderboard_engine import leaderboard_engine
+from manager.challenge_pool import challenge_pool
+from utils.cache import cache_stats
+from utils.password_utils import password_pool_stats
+from utils.git_utils import git_mirror_stats, code_extraction_stats
+from services.job_queue import queue_stats
+from services.dify_agents import dify_stats
+from services.github_service import github_stats
+from manager.webhook_manager import webhook_stats
+
+router = APIRouter(prefix="/metrics", tags=["Metrics"])
+
+
+@router.get("/es")
+async def es_pool_metrics():
+    """
+    Per-node Elasticsearch connection pool stats (in-flight, waiting, wait time).
+    """
+    return get_pool_stats()
+
+
+@router.get("/leaderboard")
+async def leaderboard_engine_metrics():
+    """
+    State of the in-memory leaderboard engine (readiness, size, last reconciliation).
+    """
+    return leaderboard_engine.stats()
+
+
+@router.get("/caches")
+async def cache_metrics():
+    """
+    Size and hit/miss counters for every in-process cache.
+    """
+    return cache_stats()
+
+
+@router.get("/password-pool")
+async def password_pool_metrics():
+    """
+    bcrypt worker pool size, queue limit and current queue depth.
+    """
+    return password_pool_stats()
+
+
+@router.get("/git-mirrors")
+async def git_mirror_metrics():
+    """
+    Bare-mirror cache hits, fetches, fallbacks to fresh clones, evictions and size.
+    """
+    return git_mirror_stats()
+
+
+@router.get("/code-extraction")
+async def code_extraction_metrics():
+    """
+    Files scanned/kept/skipped and bytes kept across all submission checkouts.
+    """
+    return code_extraction_stats()
+
+
+@router.get("/queues")
+async def queue_metrics():
+    """
+    Depth, running/dead counts, oldest queued job age and worker counters per job queue.
+    """
+    return await queue_stats()
+
+
+@router.get("/dify")
+async def dify_metrics():
+    """
+    Per-agent Dify call, retry and error counters, latency and circuit breaker state.
+    """
+    return dify_stats()
+
+
+@router.get("/challenge-pool")
+async def challenge_pool_metrics():
+    """
+    Pre-generated challenge pool: hit rate, ready entries per pair and refill lag.
+    """
+    return challenge_pool.stats()
+
+
+@router.get("/github")
+async def github_metrics():
+    """
+    GitHub write token bucket, last seen rate-limit budget and back-off pauses.
+    """
+    return github_stats()
+
+
+@router.get("/webhooks")
+async def webhook_metrics():
+    """
+    GitHub webhook acknowledgement latency (p50/p99 over recent deliveries)
+    and accepted / duplicate / ignored / submitted counts.
+    """
+    return webhook_stats()
@@ -1,17 +1,29 @@
-from fastapi import APIRouter, Depends, HTTPException
-from elasticsearch import AsyncElasticsearch
+from typing import Dict, List, Optional
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
 from services.security import get_current_user
-from schemas.schemas import SubmissionOut
+from schemas.schemas import SubmissionOut, SubmissionSummary
+from manager.submission_manager import get_submission_summaries
 from utils.es_utils import get_submission_by_id
+from utils.pagination import search_page
 
 SUBMISSION_INDEX = "submissions"
-es = AsyncElasticsearch("http://localhost:9200")
+# SubmissionOut without the (large) feedback text
+SUBMISSION_LIST_FIELDS = [
+    "id", "challenge_id", "user_id", "repo_name", "clone_url", "commit_hash", "status", "score", "superseded_by",
+]
 router = APIRouter(prefix="/submissions", tags=["Submissions"])
 
 @router.get("/", response_model=list[SubmissionOut])
-async def get_my_submissions(user=Depends(get_current_user)):
+async def get_my_submissions(
+    response: Response,
+    limit: int = Query(50, ge=1, le=200),
+    after: Optional[str] = None,
+    user=Depends(get_current_user)
+):
     """
-    Gets all submissions for the currently authenticated user from Elasticsearch.
+    Gets the currently authenticated user's submissions, newest first, one
+    page at a time. Pass the X-Next-Cursor header value as `after` to fetch
+    the next page. Feedback text is left out; fetch a submission by id for it.
     """
     # --- FIX: Added a query to filter by the current user's ID ---
     # Note: The 'user_id' in the submission doc is the GitHub username.
@@ -24,8 +36,33 @@ async def get_my_submissions(user=Depends(get_current_user)):
         }
     }
     
-    res = await es.search(index=SUBMISSION_INDEX, query=query, size=100)
-    return [SubmissionOut(**hit["_source"]) for hit in res["hits"]["hits"]]
+    try:
+        hits, next_cursor = await search_page(
+            SUBMISSION_INDEX,
+            query=query,
+            sort=[{"created_at": {"order": "desc", "unmapped_type": "date"}}],
+            limit=limit,
+            after=after,
+            source_includes=SUBMISSION_LIST_FIELDS,
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return [SubmissionOut(**hit["_source"]) for hit in hits]
+
+
+@router.get("/progress", response_model=Dict[str, SubmissionSummary])
+async def get_my_progress(
+    challenge_id: List[str] = Query(..., description="Repeat for each challenge"),
+    user=Depends(get_current_user)
+):
+    """
+    The current user's attempts, best score and last result per challenge,
+    read from the submission summaries in one mget. Challenges without an
+    evaluation are left out.
+    """
+    return await get_submission_summaries(user["id"], challenge_id)
 
 
 @router.get("/{submission_id}", response_model=SubmissionOut)
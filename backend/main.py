@@ -1,13 +1,60 @@
+import asyncio
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, Request
 from fastapi.responses import JSONResponse
 import os
 from fastapi.middleware.cors import CORSMiddleware
-from api import auth, submission, groups, testcases, leaderboard, challenges, webhooks
+from api import auth, submission, groups, testcases, leaderboard, challenges, webhooks, metrics, export
+from search.connection import init_es, close_es
+from manager.leaderboard_engine import leaderboard_engine
+from manager.submission_manager import submission_queue
+from manager.challenge_manager import challenge_queue, provisioning_queue
+from services.sns_notify import notification_queue
+from manager.webhook_manager import webhook_queue
+from manager.challenge_pool import challenge_pool
+from services.dify_agents import close_dify_clients
 from dotenv import load_dotenv
 load_dotenv()
 
 
-app = FastAPI(title="DOJO Backend")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # One shared Elasticsearch client pool for the whole worker
+    app.state.es = await init_es()
+
+    # Warm the in-memory leaderboards; endpoints fall back to ES until ready
+    try:
+        await leaderboard_engine.rebuild()
+        print(f"[LEADERBOARD] Warmed {leaderboard_engine.stats()['users']} users.")
+    except Exception as e:
+        print(f"[LEADERBOARD ERROR] Warm-up failed, serving from Elasticsearch: {e}")
+    reconciler = asyncio.create_task(leaderboard_engine.run_reconciler())
+
+    # Durable submission evaluation, challenge generation and repo setup workers
+    await submission_queue.start()
+    await challenge_queue.start()
+    await provisioning_queue.start()
+    await notification_queue.start()
+    await webhook_queue.start()
+    # Keeps pre-generated challenges ready for popular topics (no-op unless configured)
+    pool_refiller = asyncio.create_task(challenge_pool.run_refiller())
+
+    yield
+
+    await submission_queue.stop()
+    await challenge_queue.stop()
+    await provisioning_queue.stop()
+    await notification_queue.stop()
+    await webhook_queue.stop()
+    reconciler.cancel()
+    pool_refiller.cancel()
+    # Let a running rebuild or refill unwind before the ES client is closed
+    await asyncio.gather(reconciler, pool_refiller, return_exceptions=True)
+    await close_dify_clients()
+    await close_es()
+
+
+app = FastAPI(title="DOJO Backend", lifespan=lifespan)
 
 
 # Call this function right at the top, before anything else.
@@ -27,6 +74,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"], # Allow all methods
     allow_headers=["*"], # Allow all headers
+    expose_headers=["X-Next-Cursor"], # Cursor for paginated list endpoints
 )
 
 @app.exception_handler(Exception)
@@ -47,6 +95,8 @@ app.include_router(leaderboard.router)
 app.include_router(challenges.router)
 app.include_router(webhooks.router)
 app.include_router(submission.router)
+app.include_router(metrics.router)
+app.include_router(export.router)
 
 @app.get("/")
 def root():
@@ -1,16 +1,54 @@
-from elasticsearch import AsyncElasticsearch, NotFoundError
+import os
+import asyncio
+from typing import Dict, Iterable, List
+from fastapi import HTTPException
+from elasticsearch import NotFoundError, ConflictError
+from search.connection import get_es
 from uuid import uuid4
 from schemas.schemas import UserCreate, UserUpdate
-from utils.password_utils import hash_password
+from utils.password_utils import hash_password_async
+from services.security import invalidate_user_cache
 from datetime import datetime
 
-es = AsyncElasticsearch("http://localhost:9200")
 USER_INDEX = "users"
+# email -> user_id lookup documents, keyed by the normalized email
+USER_EMAIL_INDEX = "user_emails"
+
+# Until utils/migrate_user_emails.py has been run, users without a lookup
+# document are still found by searching the users index.
+USER_EMAIL_SEARCH_FALLBACK = os.getenv("USER_EMAIL_SEARCH_FALLBACK", "true").lower() in ("1", "true", "yes")
+
+# Ids per mget request when loading users in bulk
+USER_MGET_BATCH_SIZE = int(os.getenv("USER_MGET_BATCH_SIZE", "500"))
+# What group-wide operations need; never the password hash
+USER_PROFILE_FIELDS = ["id", "username", "email", "github_username"]
+
+def email_key(email: str) -> str:
+    """Document ID of an email's lookup document."""
+    return email.strip().lower()
 
 # --- Create User ---
 async def create_user(user: UserCreate) -> dict:
+    """
+    Claims the email with an op_type=create lookup document before writing the
+    user, so concurrent registrations with the same email cannot both succeed.
+    Raises 400 if the email is taken.
+    """
+    es = get_es()
     user_id = str(uuid4())
-    hashed_pw = hash_password(user.password)
+    hashed_pw = await hash_password_async(user.password)
+
+    if USER_EMAIL_SEARCH_FALLBACK and await _search_user_by_email(user.email):
+        raise HTTPException(status_code=400, detail="User with this email already exists")
+    try:
+        await es.create(
+            index=USER_EMAIL_INDEX,
+            id=email_key(user.email),
+            document={"user_id": user_id, "email": user.email}
+        )
+    except ConflictError:
+        raise HTTPException(status_code=400, detail="User with this email already exists")
+
     doc = {
         "id": user_id,
         "username": user.username,
@@ -19,11 +57,30 @@ async def create_user(user: UserCreate) -> dict:
         "github_username": None,
         "created_at": datetime.utcnow().isoformat()
     }
-    await es.index(index=USER_INDEX, id=user_id, document=doc)
+    try:
+        await es.index(index=USER_INDEX, id=user_id, document=doc)
+    except Exception:
+        # Release the email so the user can retry
+        await es.delete(index=USER_EMAIL_INDEX, id=email_key(user.email))
+        raise
     return {"id": user_id, "username": user.username, "email": user.email}
 
 # --- Get User by Email ---
 async def get_user_by_email(email: str) -> dict | None:
+    """
+    Resolves the email through its lookup document, then gets the user by ID.
+    Both are real-time gets, so this never waits on an index refresh.
+    """
+    try:
+        lookup = await get_es().get(index=USER_EMAIL_INDEX, id=email_key(email))
+        return await get_user_by_id(lookup["_source"]["user_id"])
+    except NotFoundError:
+        pass
+    if USER_EMAIL_SEARCH_FALLBACK:
+        return await _search_user_by_email(email)
+    return None
+
+async def _search_user_by_email(email: str) -> dict | None:
     query = {
         "query": {
             "term": {
@@ -31,18 +88,38 @@ async def get_user_by_email(email: str) -> dict | None:
             }
         }
     }
-    response = await es.search(index=USER_INDEX, body=query)
+    response = await get_es().search(index=USER_INDEX, body=query)
     hits = response["hits"]["hits"]
     return hits[0]["_source"] if hits else None
 
 # --- Get User by ID ---
 async def get_user_by_id(user_id: str) -> dict | None:
     try:
-        response = await es.get(index=USER_INDEX, id=user_id)
+        response = await get_es().get(index=USER_INDEX, id=user_id)
         return response["_source"]
     except NotFoundError:
         return None
 
+# --- Get Users by ID (batched) ---
+async def get_users_by_ids(user_ids: Iterable[str], fields: List[str] = USER_PROFILE_FIELDS) -> Dict[str, dict]:
+    """
+    Loads many users with one mget per USER_MGET_BATCH_SIZE ids, returning
+    only `fields` of each. Keyed by user_id; unknown ids are left out.
+    """
+    unique_ids = list(dict.fromkeys(user_id for user_id in user_ids if user_id))
+    if not unique_ids:
+        return {}
+    batches = [unique_ids[i:i + USER_MGET_BATCH_SIZE] for i in range(0, len(unique_ids), USER_MGET_BATCH_SIZE)]
+    responses = await asyncio.gather(*(
+        get_es().mget(index=USER_INDEX, ids=batch, source_includes=fields) for batch in batches
+    ))
+    return {
+        doc["_id"]: doc["_source"]
+        for response in responses
+        for doc in response["docs"]
+        if doc.get("found")
+    }
+
 # --- Update User Profile ---
 async def update_user_profile(user_id: str, user_update: UserUpdate) -> dict | None:
     script = {
@@ -53,20 +130,35 @@ async def update_user_profile(user_id: str, user_update: UserUpdate) -> dict | N
         }
     }
     try:
-        await es.update(index=USER_INDEX, id=user_id, script=script)
+        await get_es().update(index=USER_INDEX, id=user_id, script=script)
+        invalidate_user_cache(user_id)
         updated_user = await get_user_by_id(user_id)
         return updated_user
     except NotFoundError:
         return None
 
+# --- Replace Password Hash ---
+async def update_password_hash(user_id: str, hashed_password: str):
+    """Stores a rehashed password (e.g. after the bcrypt cost factor changed)."""
+    await get_es().update(index=USER_INDEX, id=user_id, doc={"hashed_password": hashed_password})
+    invalidate_user_cache(user_id)
+
 # --- NEW: Delete User ---
 async def delete_user_by_id(user_id: str) -> bool:
     """
     Deletes a user from Elasticsearch by their ID.
     Returns True if deletion is successful, False if user not found.
     """
+    user = await get_user_by_id(user_id)
+    if not user:
+        return False
     try:
-        await es.delete(index=USER_INDEX, id=user_id)
-        return True
+        await get_es().delete(index=USER_INDEX, id=user_id)
+        invalidate_user_cache(user_id)
     except NotFoundError:
         return False
+    try:
+        await get_es().delete(index=USER_EMAIL_INDEX, id=email_key(user["email"]))
+    except NotFoundError:
+        pass
+    return True
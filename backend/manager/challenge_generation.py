@@ -0,0 +1,130 @@
+import os
+import time
+import asyncio
+from typing import Any, Awaitable, Callable, NamedTuple, Optional
+from services.dify_agents import (
+    trigger_agent_1,
+    trigger_agent_2_breakdown,
+    trigger_agent_3_testcases,
+)
+
+# Upper bound for one agent step, including the Dify client's own retries
+CHALLENGE_STEP_TIMEOUT_SECONDS = float(os.getenv("CHALLENGE_STEP_TIMEOUT_SECONDS", "180"))
+
+# Step names, in the order a client should display them
+GENERATION_STEPS = ("problem_statement", "breakdown", "testcases")
+
+
+class AgentNode(NamedTuple):
+    """One step of a generation graph; `run` receives the results of finished steps."""
+    name: str
+    run: Callable[[dict], Awaitable[Any]]
+    deps: tuple[str, ...] = ()
+    timeout: float = CHALLENGE_STEP_TIMEOUT_SECONDS
+
+
+class AgentStepError(RuntimeError):
+    def __init__(self, step: str, message: str):
+        super().__init__(f"{step}: {message}")
+        self.step = step
+
+
+async def run_agent_graph(
+    nodes: list[AgentNode],
+    on_step: Optional[Callable[[str, str], Awaitable[None]]] = None,
+    completed: Optional[dict] = None,
+    checkpoint: Optional[Callable[[str, Any], Awaitable[None]]] = None,
+) -> dict:
+    """
+    Runs each node as soon as its dependencies have finished, so independent
+    agents overlap. Nodes must be listed after their dependencies. When a
+    node fails its dependents are skipped, but nodes that do not depend on it
+    run on and checkpoint their results; the first failure is then raised as
+    AgentStepError.
+
+    on_step(name, state) is awaited as each node goes running -> done | failed.
+    Nodes already in `completed` are not run again; checkpoint(name, result)
+    is awaited to persist each new result before the node counts as done.
+    """
+    results: dict[str, Any] = dict(completed or {})
+    tasks: dict[str, asyncio.Task] = {}
+    failures: list[AgentStepError] = []
+
+    async def report(name: str, state: str):
+        if on_step is None:
+            return
+        try:
+            await on_step(name, state)
+        except Exception as e:
+            # Progress reporting must never fail the generation itself
+            print(f"[GENERATION WARN] Could not record {name} -> {state}: {e}")
+
+    async def run_node(node: AgentNode):
+        if node.name in results:
+            return
+        if node.deps:
+            # Raises the dependency's AgentStepError, so this node never starts
+            await asyncio.gather(*(tasks[dep] for dep in node.deps))
+        await report(node.name, "running")
+        started = time.perf_counter()
+        try:
+            result = await asyncio.wait_for(node.run(results), timeout=node.timeout)
+            if checkpoint is not None:
+                await checkpoint(node.name, result)
+            results[node.name] = result
+        except asyncio.TimeoutError:
+            failures.append(AgentStepError(node.name, f"timed out after {node.timeout:.0f}s"))
+            await report(node.name, "failed")
+            raise failures[-1]
+        except Exception as e:
+            failures.append(AgentStepError(node.name, str(e)))
+            await report(node.name, "failed")
+            raise failures[-1] from e
+        print(f"[GENERATION] {node.name} finished in {time.perf_counter() - started:.1f}s")
+        await report(node.name, "done")
+
+    for node in nodes:
+        missing = [dep for dep in node.deps if dep not in tasks]
+        if missing:
+            raise ValueError(f"Step '{node.name}' depends on unknown or later steps: {missing}")
+        tasks[node.name] = asyncio.create_task(run_node(node))
+
+    try:
+        outcomes = await asyncio.gather(*tasks.values(), return_exceptions=True)
+    except BaseException:
+        # Cancelled from outside: stop every node
+        for task in tasks.values():
+            task.cancel()
+        await asyncio.gather(*tasks.values(), return_exceptions=True)
+        raise
+    if failures:
+        raise failures[0]
+    for outcome in outcomes:
+        if isinstance(outcome, BaseException):
+            raise outcome
+    return results
+
+
+def challenge_generation_graph(topic: str, difficulty: str, user_id: str) -> list[AgentNode]:
+    """Agent 1 writes the statement; Agents 2 and 3 both only need the statement."""
+
+    async def problem_statement(_: dict) -> str:
+        result = await trigger_agent_1(Topic=topic, difficulty=difficulty, user_id=user_id)
+        statement = result.get("data", {}).get("outputs", {}).get("answer", "").strip()
+        if not statement:
+            raise ValueError("Agent 1 (Problem Statement) returned empty.")
+        return statement
+
+    async def breakdown(results: dict) -> str:
+        result = await trigger_agent_2_breakdown(statement=results["problem_statement"], user_id=user_id)
+        return result.get("data", {}).get("outputs", {}).get("answer", {}).get("api", "")
+
+    async def testcases(results: dict) -> str:
+        result = await trigger_agent_3_testcases(prompt=results["problem_statement"], user_id=user_id)
+        return result.get("data", {}).get("outputs", {}).get("answer", {}).get("raw_text_from_previous_step", "")
+
+    return [
+        AgentNode("problem_statement", problem_statement),
+        AgentNode("breakdown", breakdown, deps=("problem_statement",)),
+        AgentNode("testcases", testcases, deps=("problem_statement",)),
+    ]
@@ -0,0 +1,345 @@
+import os
+from typing import List
+from datetime import datetime, timezone
+from fastapi import HTTPException
+from elasticsearch import ConflictError, NotFoundError
+from search.connection import get_es
+from manager.challenge_generation import GENERATION_STEPS, run_agent_graph, challenge_generation_graph
+from manager.challenge_pool import challenge_pool
+from manager.group_manager_es import get_group_members_es
+from manager.repo_provisioning import setup_challenge_repos_for_group, get_provisioning_results
+from manager.testcase_manager import TESTCASE_INDEX, save_testcases
+from services.job_queue import JobQueue
+from utils.es_utils import (
+    CHALLENGE_INDEX,
+    BREAKDOWN_INDEX,
+    finish_generated_challenge,
+    get_challenge_by_id,
+    save_challenge,
+    save_generated_challenge,
+)
+
+CHALLENGE_GENERATION_WORKERS = int(os.getenv("CHALLENGE_GENERATION_WORKERS", "2"))
+CHALLENGE_GENERATION_MAX_ATTEMPTS = int(os.getenv("CHALLENGE_GENERATION_MAX_ATTEMPTS", "3"))
+CHALLENGE_GENERATION_VISIBILITY_TIMEOUT = float(os.getenv("CHALLENGE_GENERATION_VISIBILITY_TIMEOUT", "600"))
+REPO_PROVISIONING_WORKERS = int(os.getenv("REPO_PROVISIONING_WORKERS", "1"))
+REPO_PROVISIONING_MAX_ATTEMPTS = int(os.getenv("REPO_PROVISIONING_MAX_ATTEMPTS", "4"))
+
+# Fields the status endpoint reads instead of the whole challenge
+STATUS_FIELDS = ["status", "generation_steps", "generation_error", "repos_status"]
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def new_generation_steps() -> dict:
+    return {step: {"status": "pending", "updated_at": None} for step in GENERATION_STEPS}
+
+
+async def get_generation_status(challenge_id: str) -> dict | None:
+    try:
+        res = await get_es().get(index=CHALLENGE_INDEX, id=challenge_id, source_includes=STATUS_FIELDS)
+    except NotFoundError:
+        return None
+    source = res.get("_source", {})
+    return {
+        "id": challenge_id,
+        # Challenges created before background generation have no status
+        "status": source.get("status", "ready"),
+        "steps": source.get("generation_steps", {}),
+        "error": source.get("generation_error"),
+        "repos_status": source.get("repos_status"),
+    }
+
+
+async def _update_challenge(challenge_id: str, fields: dict):
+    # Agents 2 and 3 report progress concurrently on the same document
+    await get_es().update(index=CHALLENGE_INDEX, id=challenge_id, doc=fields, retry_on_conflict=5)
+
+
+# --- Generation ---
+async def _load_checkpoints(challenge: dict) -> dict:
+    """
+    Outputs of steps marked done by an earlier run. A step whose output is
+    missing is treated as not done and runs again.
+    """
+    steps = challenge.get("generation_steps") or {}
+    done = {step for step, info in steps.items() if info.get("status") == "done"}
+    completed = {}
+    if "problem_statement" in done and challenge.get("problem_statement"):
+        completed["problem_statement"] = challenge["problem_statement"]
+
+    wanted = [(index, step, field) for index, step, field in (
+        (BREAKDOWN_INDEX, "breakdown", "breakdown"),
+        (TESTCASE_INDEX, "testcases", "testcases"),
+    ) if step in done]
+    if wanted:
+        res = await get_es().mget(docs=[{"_index": index, "_id": challenge["id"]} for index, _, _ in wanted])
+        for (_, step, field), doc in zip(wanted, res["docs"]):
+            if doc.get("found"):
+                completed[step] = doc["_source"].get(field, "")
+    return completed
+
+
+async def _checkpoint(challenge_id: str, step: str, result: str):
+    """Persists one step's output where the finished challenge keeps it."""
+    if step == "problem_statement":
+        await _update_challenge(challenge_id, {"problem_statement": result})
+    elif step == "breakdown":
+        await get_es().index(index=BREAKDOWN_INDEX, id=challenge_id, document={"challenge_id": challenge_id, "breakdown": result})
+    elif step == "testcases":
+        await save_testcases(challenge_id, result)
+
+
+async def _flush_checkpoints(challenge_id: str, outputs: dict):
+    """Keeps the outputs of a failed or interrupted run for the retry."""
+    for step, result in outputs.items():
+        try:
+            await _checkpoint(challenge_id, step, result)
+        except Exception as e:
+            print(f"[GENERATION WARN] Could not checkpoint {step} for {challenge_id}: {e}")
+
+
+async def run_generation_job(payload: dict):
+    """
+    Queue handler: runs the agent graph for a `generating` challenge, resuming
+    after the steps an earlier attempt already checkpointed, then queues repo setup.
+    The statement is checkpointed at once, since both other agents need it;
+    a successful run writes the rest with the finished challenge in one _bulk.
+    """
+    challenge_id = payload["challenge_id"]
+    challenge = await get_challenge_by_id(challenge_id)
+    if not challenge:
+        print(f"⚠ Challenge {challenge_id} no longer exists. Skipping generation.")
+        return
+
+    if challenge.get("status") == "generating":
+        async def record_step(step: str, state: str):
+            await _update_challenge(challenge_id, {
+                "generation_steps": {step: {"status": state, "updated_at": _now()}}
+            })
+
+        outputs: dict = {}
+
+        async def checkpoint(step: str, result: str):
+            if step == "problem_statement":
+                await _checkpoint(challenge_id, step, result)
+            else:
+                outputs[step] = result
+
+        completed = await _load_checkpoints(challenge)
+        if completed:
+            print(f"[{challenge_id}] Resuming generation; already done: {', '.join(completed)}")
+        finished = {
+            "status": "ready",
+            "generation_error": None,
+            "generated_at": _now(),
+            "repos_status": "pending",
+        }
+        try:
+            results = await run_agent_graph(
+                challenge_generation_graph(challenge["Topic"], challenge["difficulty"], payload["user_id"]),
+                on_step=record_step,
+                completed=completed,
+                checkpoint=checkpoint,
+            )
+            await finish_generated_challenge(challenge_id, finished, results["breakdown"], results["testcases"])
+        except BaseException:
+            await _flush_checkpoints(challenge_id, outputs)
+            raise
+        challenge.update(finished)
+        print(f"[{challenge_id}] ✅ Agent generation complete.")
+
+    # Also reached when a redelivered job finds generation already saved
+    if challenge.get("status") == "ready" and challenge.get("repos_status") == "pending":
+        await enqueue_repo_provisioning(challenge_id)
+
+
+async def mark_generation_failed(payload: dict, error: str):
+    """Dead-letter callback for generation jobs."""
+    await _update_challenge(payload["challenge_id"], {"status": "failed", "generation_error": error})
+    print(f"❌ Challenge {payload['challenge_id']} generation failed: {error}")
+
+
+challenge_queue = JobQueue(
+    "challenges",
+    handler=run_generation_job,
+    workers=CHALLENGE_GENERATION_WORKERS,
+    visibility_timeout=CHALLENGE_GENERATION_VISIBILITY_TIMEOUT,
+    max_attempts=CHALLENGE_GENERATION_MAX_ATTEMPTS,
+    on_dead_letter=mark_generation_failed,
+)
+
+
+async def enqueue_challenge_generation(challenge_id: str, user_id: str, run: int = 1) -> str:
+    # One job per run: the dead-lettered job of a failed run keeps its id
+    return await challenge_queue.enqueue(
+        {"challenge_id": challenge_id, "user_id": user_id},
+        job_id=f"challenge:{challenge_id}:{run}",
+    )
+
+
+async def start_challenge(doc: dict, user_id: str) -> dict:
+    """
+    Saves a new challenge. Content comes from the pre-generated pool when it
+    has an entry for the topic and difficulty; otherwise generation is queued.
+    If saving pooled content fails, the entry goes back to the pool and the
+    challenge is generated live. Returns the stored document.
+    """
+    try:
+        pooled = await challenge_pool.claim(doc["Topic"], doc["difficulty"], challenge_id=doc["id"])
+    except Exception as e:
+        print(f"[POOL WARN] Claim failed, generating live: {e}")
+        pooled = None
+
+    if pooled:
+        now = _now()
+        ready = {
+            **doc,
+            "problem_statement": pooled["problem_statement"],
+            "status": "ready",
+            "generation_steps": {step: {"status": "done", "updated_at": now} for step in GENERATION_STEPS},
+            "generation_run": 0,
+            "generation_error": None,
+            "generated_at": now,
+            "repos_status": "pending",
+            "pool_entry": pooled["id"],
+        }
+        try:
+            await save_generated_challenge(ready, pooled["breakdown"], pooled["testcases"])
+        except Exception as e:
+            print(f"[POOL WARN] Could not save pooled challenge {doc['id']}, generating live: {e}")
+            await challenge_pool.unclaim(pooled)
+        else:
+            await challenge_pool.release(pooled["id"])
+            await enqueue_repo_provisioning(doc["id"])
+            print(f"[{doc['id']}] ✅ Served from the challenge pool (entry {pooled['id']}).")
+            return ready
+
+    doc.update({
+        "status": "generating",
+        "generation_steps": new_generation_steps(),
+        "generation_run": 1,
+    })
+    await save_challenge(doc)
+    await enqueue_challenge_generation(doc["id"], user_id)
+    print(f"[{doc['id']}] Generation queued for topic: {doc['Topic']}")
+    return doc
+
+
+async def retry_challenge_generation(challenge_id: str, user_id: str):
+    """
+    Re-queues a failed challenge. Steps checkpointed by the failed run are
+    kept, so only the missing agents are called again.
+    """
+    try:
+        res = await get_es().get(index=CHALLENGE_INDEX, id=challenge_id)
+    except NotFoundError:
+        raise HTTPException(status_code=404, detail=f"Challenge with ID '{challenge_id}' not found.")
+    challenge = res["_source"]
+    if challenge.get("created_by") != user_id:
+        raise HTTPException(status_code=403, detail="Only the challenge creator can retry it.")
+    if challenge.get("status") != "failed":
+        raise HTTPException(status_code=409, detail=f"Challenge is {challenge.get('status', 'ready')}, not failed.")
+
+    run = challenge.get("generation_run", 1) + 1
+    steps = {
+        step: info if info.get("status") == "done" else {"status": "pending", "updated_at": _now()}
+        for step, info in (challenge.get("generation_steps") or new_generation_steps()).items()
+    }
+    try:
+        # if_seq_no: of two concurrent retries, only one re-queues
+        await get_es().update(
+            index=CHALLENGE_INDEX, id=challenge_id,
+            doc={"status": "generating", "generation_error": None, "generation_run": run, "generation_steps": steps},
+            if_seq_no=res["_seq_no"], if_primary_term=res["_primary_term"],
+        )
+    except ConflictError:
+        raise HTTPException(status_code=409, detail="Challenge is already being retried.")
+    await enqueue_challenge_generation(challenge_id, user_id, run=run)
+    print(f"[{challenge_id}] Generation retry #{run - 1} queued.")
+
+
+# --- Repo provisioning ---
+async def enqueue_repo_provisioning(challenge_id: str, run: int = 1) -> str:
+    return await provisioning_queue.enqueue({"challenge_id": challenge_id}, job_id=f"provision:{challenge_id}:{run}")
+
+
+async def run_provisioning_job(payload: dict):
+    """
+    Queue handler: provisions every member, raising while some still failed so
+    the queue retries them. Members already done are skipped on each attempt.
+    """
+    challenge_id = payload["challenge_id"]
+    challenge = await get_challenge_by_id(challenge_id)
+    if not challenge or challenge.get("repos_status") not in ("pending", "provisioning"):
+        return
+    try:
+        breakdown = (await get_es().get(index=BREAKDOWN_INDEX, id=challenge_id))["_source"].get("breakdown", "")
+    except NotFoundError:
+        breakdown = ""
+
+    await _update_challenge(challenge_id, {"repos_status": "provisioning"})
+    summary = await setup_challenge_repos_for_group(
+        challenge_id=challenge_id,
+        group_id=challenge["group_id"],
+        challenge_topic=challenge["Topic"],
+        api_description=breakdown
+    )
+    incomplete = summary.get("failed", 0) + summary.get("unnotified", 0)
+    if incomplete:
+        raise RuntimeError(f"{incomplete} member(s) not provisioned yet: {summary}")
+    await _update_challenge(challenge_id, {"repos_status": "provisioned"})
+
+
+async def mark_provisioning_failed(payload: dict, error: str):
+    await _update_challenge(payload["challenge_id"], {"repos_status": "failed"})
+
+
+provisioning_queue = JobQueue(
+    "repo_provisioning",
+    handler=run_provisioning_job,
+    workers=REPO_PROVISIONING_WORKERS,
+    visibility_timeout=CHALLENGE_GENERATION_VISIBILITY_TIMEOUT,
+    max_attempts=REPO_PROVISIONING_MAX_ATTEMPTS,
+    backoff_base=30.0,
+    on_dead_letter=mark_provisioning_failed,
+)
+
+
+async def retry_repo_provisioning(challenge_id: str, user_id: str):
+    """Re-queues provisioning for the members whose repo or email failed. Creator only."""
+    try:
+        res = await get_es().get(index=CHALLENGE_INDEX, id=challenge_id)
+    except NotFoundError:
+        raise HTTPException(status_code=404, detail=f"Challenge with ID '{challenge_id}' not found.")
+    challenge = res["_source"]
+    if challenge.get("created_by") != user_id:
+        raise HTTPException(status_code=403, detail="Only the challenge creator can retry provisioning.")
+    if challenge.get("repos_status") != "failed":
+        raise HTTPException(status_code=409, detail=f"Repo provisioning is {challenge.get('repos_status')}, not failed.")
+
+    run = challenge.get("repos_run", 1) + 1
+    try:
+        await get_es().update(
+            index=CHALLENGE_INDEX, id=challenge_id,
+            doc={"repos_status": "pending", "repos_run": run},
+            if_seq_no=res["_seq_no"], if_primary_term=res["_primary_term"],
+        )
+    except ConflictError:
+        raise HTTPException(status_code=409, detail="Provisioning is already being retried.")
+    await enqueue_repo_provisioning(challenge_id, run=run)
+
+
+async def get_challenge_repos(challenge_id: str) -> List[dict]:
+    """Per-member provisioning results for a challenge's group."""
+    challenge = await get_challenge_by_id(challenge_id)
+    if not challenge:
+        raise HTTPException(status_code=404, detail=f"Challenge with ID '{challenge_id}' not found.")
+    member_ids = await get_group_members_es(challenge["group_id"])
+    results = await get_provisioning_results(challenge_id, member_ids)
+    return [
+        results.get(user_id, {"challenge_id": challenge_id, "user_id": user_id, "status": "pending"})
+        for user_id in member_ids
+    ]
@@ -0,0 +1,269 @@
+import os
+import time
+import random
+import asyncio
+from datetime import datetime, timezone
+from typing import Dict, Optional
+from elasticsearch import ConflictError, NotFoundError
+from search.connection import get_es
+from manager.challenge_generation import run_agent_graph, challenge_generation_graph
+from utils.es_utils import CHALLENGE_INDEX
+
+CHALLENGE_POOL_INDEX = "challenge_pool"
+
+# "Topic:difficulty" pairs to keep pre-generated, e.g. "Arrays:Easy,Graphs:Medium"
+CHALLENGE_POOL_TOPICS = os.getenv("CHALLENGE_POOL_TOPICS", "")
+CHALLENGE_POOL_SIZE = int(os.getenv("CHALLENGE_POOL_SIZE", "2"))
+CHALLENGE_POOL_REFILL_SECONDS = float(os.getenv("CHALLENGE_POOL_REFILL_SECONDS", "300"))
+# A claimed entry not released within this long belongs to a crashed request;
+# it is deleted if its challenge was saved and made claimable again otherwise
+CHALLENGE_POOL_CLAIM_TTL_SECONDS = float(os.getenv("CHALLENGE_POOL_CLAIM_TTL_SECONDS", "3600"))
+# Dify `user` for agent calls that no request is waiting on
+POOL_AGENT_USER = "challenge-pool"
+
+CHALLENGE_POOL_MAPPING = {
+    "pool_key": {"type": "keyword"},
+    "Topic": {"type": "keyword"},
+    "difficulty": {"type": "keyword"},
+    "status": {"type": "keyword"},  # ready | claimed
+    "problem_statement": {"type": "text", "index": False},
+    "breakdown": {"type": "text", "index": False},
+    "testcases": {"type": "text", "index": False},
+    "created_at": {"type": "date"},
+    "claimed_at": {"type": "date"},
+    "claimed_by": {"type": "keyword"},  # id of the challenge the entry is copied into
+}
+
+
+def pool_key(topic: str, difficulty: str) -> str:
+    return f"{topic.strip().lower()}|{difficulty.strip().lower()}"
+
+
+def _parse_pairs(raw: str) -> list[tuple[str, str]]:
+    pairs = []
+    for item in raw.split(","):
+        topic, sep, difficulty = item.strip().rpartition(":")
+        if sep and topic.strip() and difficulty.strip():
+            pairs.append((topic.strip(), difficulty.strip()))
+        elif item.strip():
+            print(f"[POOL WARN] Ignoring malformed CHALLENGE_POOL_TOPICS entry: {item!r}")
+    return pairs
+
+
+class ChallengePool:
+    """
+    Keeps CHALLENGE_POOL_SIZE fully generated challenges (statement, breakdown,
+    test cases) ready per configured (Topic, difficulty) pair, in the
+    `challenge_pool` index.
+
+    A create request claims an entry with an optimistic-concurrency update
+    (if_seq_no), so two requests never get the same one, and deletes it once
+    copied, or returns it to `ready` if the copy failed. Each process runs a refiller; with several processes the pool can
+    briefly overshoot its size by one entry per process.
+    """
+
+    def __init__(self, pairs: list[tuple[str, str]], size: int):
+        self.pairs = pairs
+        self.size = size
+        self.keys = {pool_key(topic, difficulty) for topic, difficulty in pairs}
+        self.ready: Dict[str, int] = {}
+        self.counters = {"hits": 0, "misses": 0, "unpooled": 0, "generated": 0, "generation_failures": 0, "reaped": 0, "reclaimed": 0}
+        self.last_refill_lag: Dict[str, float] = {}
+        self._short_since: Dict[str, float] = {}  # pool_key -> when it dropped below size
+        self._wake = asyncio.Event()
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.pairs) and self.size > 0
+
+    def _mark_short(self, key: str):
+        self._short_since.setdefault(key, time.monotonic())
+        self._wake.set()
+
+    # --- Claiming ---
+    async def claim(self, topic: str, difficulty: str, challenge_id: Optional[str] = None) -> Optional[Dict]:
+        """Atomically takes a ready entry for the pair for challenge_id, or returns None."""
+        key = pool_key(topic, difficulty)
+        if not self.enabled or key not in self.keys:
+            self.counters["unpooled"] += 1
+            return None
+
+        try:
+            res = await get_es().search(
+                index=CHALLENGE_POOL_INDEX,
+                query={"bool": {"filter": [{"term": {"pool_key": key}}, {"term": {"status": "ready"}}]}},
+                size=5, seq_no_primary_term=True,
+            )
+        except NotFoundError:
+            res = {"hits": {"hits": []}}
+        hits = res["hits"]["hits"]
+        random.shuffle(hits)  # concurrent claims for one pair rarely collide
+
+        for hit in hits:
+            try:
+                await get_es().update(
+                    index=CHALLENGE_POOL_INDEX, id=hit["_id"],
+                    doc={"status": "claimed", "claimed_at": datetime.now(timezone.utc), "claimed_by": challenge_id},
+                    if_seq_no=hit["_seq_no"], if_primary_term=hit["_primary_term"],
+                )
+            except (ConflictError, NotFoundError):
+                continue
+            self.counters["hits"] += 1
+            self.ready[key] = max(0, self.ready.get(key, 1) - 1)
+            self._mark_short(key)
+            return {**hit["_source"], "id": hit["_id"]}
+
+        self.counters["misses"] += 1
+        self._mark_short(key)
+        return None
+
+    async def release(self, entry_id: str):
+        """Deletes a claimed entry once its content lives in a real challenge."""
+        try:
+            await get_es().delete(index=CHALLENGE_POOL_INDEX, id=entry_id)
+        except NotFoundError:
+            pass
+
+    async def unclaim(self, entry: Dict):
+        """Makes a claimed entry ready again, e.g. when saving its challenge failed."""
+        try:
+            await get_es().update(
+                index=CHALLENGE_POOL_INDEX, id=entry["id"],
+                doc={"status": "ready", "claimed_at": None, "claimed_by": None},
+            )
+        except Exception as e:
+            print(f"[POOL WARN] Could not return entry {entry['id']} to the pool: {e}")
+            return
+        self.ready[entry["pool_key"]] = self.ready.get(entry["pool_key"], 0) + 1
+
+    # --- Refilling ---
+    async def _count_ready(self, key: str) -> int:
+        res = await get_es().count(
+            index=CHALLENGE_POOL_INDEX,
+            query={"bool": {"filter": [{"term": {"pool_key": key}}, {"term": {"status": "ready"}}]}},
+        )
+        return res["count"]
+
+    async def _generate(self, topic: str, difficulty: str):
+        results = await run_agent_graph(challenge_generation_graph(topic, difficulty, POOL_AGENT_USER))
+        await get_es().index(
+            index=CHALLENGE_POOL_INDEX,
+            document={
+                "pool_key": pool_key(topic, difficulty),
+                "Topic": topic,
+                "difficulty": difficulty,
+                "status": "ready",
+                "problem_statement": results["problem_statement"],
+                "breakdown": results["breakdown"],
+                "testcases": results["testcases"],
+                "created_at": datetime.now(timezone.utc),
+                "claimed_at": None,
+            },
+            refresh="wait_for",  # claimable as soon as it is counted
+        )
+
+    async def refill(self):
+        """Tops every configured pair up to the pool size, one generation at a time."""
+        for topic, difficulty in self.pairs:
+            key = pool_key(topic, difficulty)
+            ready = await self._count_ready(key)
+            self.ready[key] = ready
+            if ready < self.size:
+                self._short_since.setdefault(key, time.monotonic())
+            while ready < self.size:
+                try:
+                    await self._generate(topic, difficulty)
+                except Exception as e:
+                    self.counters["generation_failures"] += 1
+                    print(f"[POOL ERROR] Could not generate '{topic}' ({difficulty}): {e}")
+                    break
+                ready += 1
+                self.ready[key] = ready
+                self.counters["generated"] += 1
+            if ready >= self.size and key in self._short_since:
+                self.last_refill_lag[key] = round(time.monotonic() - self._short_since.pop(key), 1)
+        await self._reap_stale_claims()
+
+    async def _reap_stale_claims(self):
+        """
+        Settles claims older than CHALLENGE_POOL_CLAIM_TTL_SECONDS: the entry is
+        deleted if its challenge was saved from it, and made ready otherwise, so
+        generated content is never thrown away.
+        """
+        es = get_es()
+        res = await es.search(
+            index=CHALLENGE_POOL_INDEX,
+            query={"bool": {"filter": [
+                {"term": {"status": "claimed"}},
+                {"range": {"claimed_at": {"lte": f"now-{int(CHALLENGE_POOL_CLAIM_TTL_SECONDS)}s"}}},
+            ]}},
+            size=100, seq_no_primary_term=True, source_includes=["claimed_by"],
+        )
+        hits = res["hits"]["hits"]
+        owners = [hit["_source"].get("claimed_by") for hit in hits if hit["_source"].get("claimed_by")]
+        saved = set()
+        if owners:
+            docs = await es.mget(index=CHALLENGE_INDEX, ids=owners, source_includes=["pool_entry"])
+            saved = {doc["_source"].get("pool_entry") for doc in docs["docs"] if doc.get("found")}
+
+        for hit in hits:
+            try:
+                if hit["_id"] in saved:
+                    await es.delete(
+                        index=CHALLENGE_POOL_INDEX, id=hit["_id"],
+                        if_seq_no=hit["_seq_no"], if_primary_term=hit["_primary_term"],
+                    )
+                    self.counters["reaped"] += 1
+                else:
+                    await es.update(
+                        index=CHALLENGE_POOL_INDEX, id=hit["_id"],
+                        doc={"status": "ready", "claimed_at": None, "claimed_by": None},
+                        if_seq_no=hit["_seq_no"], if_primary_term=hit["_primary_term"],
+                    )
+                    self.counters["reclaimed"] += 1
+            except (ConflictError, NotFoundError):
+                continue  # released or reclaimed meanwhile
+
+    async def run_refiller(self, interval: float = CHALLENGE_POOL_REFILL_SECONDS):
+        """Background loop started from the app lifespan; claims wake it early."""
+        if not self.enabled:
+            return
+        es = get_es()
+        if not await es.indices.exists(index=CHALLENGE_POOL_INDEX):
+            try:
+                await es.indices.create(index=CHALLENGE_POOL_INDEX, mappings={"properties": CHALLENGE_POOL_MAPPING})
+            except Exception as e:
+                print(f"[POOL] Could not create '{CHALLENGE_POOL_INDEX}' index: {e}")
+        while True:
+            self._wake.clear()
+            try:
+                await self.refill()
+            except Exception as e:
+                print(f"[POOL ERROR] Refill failed: {e}")
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=interval)
+            except asyncio.TimeoutError:
+                pass
+
+    def stats(self) -> Dict:
+        lookups = self.counters["hits"] + self.counters["misses"]
+        now = time.monotonic()
+        pairs = {}
+        for key in sorted(self.keys):
+            short_since = self._short_since.get(key)
+            pairs[key] = {
+                "ready": self.ready.get(key),
+                # How long the pair has been below size, and how long its last refill took
+                "short_for_seconds": round(now - short_since, 1) if short_since else 0.0,
+                "last_refill_lag_seconds": self.last_refill_lag.get(key),
+            }
+        return {
+            "enabled": self.enabled,
+            "size": self.size,
+            "hit_rate": round(self.counters["hits"] / lookups, 3) if lookups else None,
+            **self.counters,
+            "pairs": pairs,
+        }
+
+
+challenge_pool = ChallengePool(_parse_pairs(CHALLENGE_POOL_TOPICS), CHALLENGE_POOL_SIZE)
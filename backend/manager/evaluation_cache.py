@@ -0,0 +1,41 @@
+import os
+import hashlib
+from typing import Dict, Optional
+from utils.cache import TTLCache
+
+# Agent 4 results keyed by what was evaluated: the extracted code plus the
+# challenge's test cases. A re-push of identical code (revert, empty commit,
+# README-only tweak) reuses the earlier score instead of another LLM call.
+# Changed test cases hash to new keys, and writers also drop the old entries.
+evaluation_cache = TTLCache(
+    "evaluations",
+    maxsize=int(os.getenv("EVAL_CACHE_SIZE", "5000")),
+    ttl=float(os.getenv("EVAL_CACHE_TTL", str(7 * 24 * 3600))),
+)
+
+
+def evaluation_key(challenge_id: str, user_code: str, testcases: Optional[str]) -> str:
+    digest = hashlib.sha256()
+    for part in (challenge_id, testcases or "", user_code):
+        encoded = part.encode("utf-8", errors="surrogatepass")
+        digest.update(len(encoded).to_bytes(8, "big"))  # length-prefixed, no ambiguity
+        digest.update(encoded)
+    return digest.hexdigest()
+
+
+def get_cached_evaluation(key: str) -> Optional[Dict]:
+    return evaluation_cache.get(key)
+
+
+def cache_evaluation(key: str, challenge_id: str, submission_id: str, score: float, feedback: str):
+    evaluation_cache.set(key, {
+        "challenge_id": challenge_id,
+        "submission_id": submission_id,
+        "score": score,
+        "feedback": feedback,
+    })
+
+
+def invalidate_challenge_evaluations(challenge_id: str) -> int:
+    """Drops cached results for a challenge whose test cases changed or were deleted."""
+    return evaluation_cache.invalidate_where(lambda _, entry: entry["challenge_id"] == challenge_id)
@@ -0,0 +1,95 @@
+import os
+import json
+import zlib
+from datetime import datetime
+from typing import AsyncIterator, Dict, List, Optional
+from utils.pagination import scan_pit
+from utils.es_utils import CHALLENGE_INDEX, SUBMISSION_INDEX, LEADERBOARD_INDEX
+
+# Documents read per search_after page
+EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", "1000"))
+# Compressed bytes buffered before a chunk is sent
+EXPORT_CHUNK_BYTES = 64 * 1024
+# Cap on challenge ids resolved for a group filter on submissions
+EXPORT_MAX_GROUP_CHALLENGES = 10_000
+
+# kind -> index, field for the time range (None: not filterable by time)
+EXPORTS: Dict[str, Dict[str, Optional[str]]] = {
+    "submissions": {"index": SUBMISSION_INDEX, "time_field": "created_at"},
+    "challenges": {"index": CHALLENGE_INDEX, "time_field": "created_at"},
+    "leaderboard": {"index": LEADERBOARD_INDEX, "time_field": None},
+}
+
+
+async def _group_challenge_ids(group_id: str) -> List[str]:
+    ids = []
+    query = {"bool": {"filter": [{"term": {"group_id": group_id}}]}}
+    async for hit in scan_pit(CHALLENGE_INDEX, query, batch_size=EXPORT_BATCH_SIZE, source_includes=["id"]):
+        ids.append(hit["_id"])
+        if len(ids) > EXPORT_MAX_GROUP_CHALLENGES:
+            raise ValueError(f"Group {group_id} has more than {EXPORT_MAX_GROUP_CHALLENGES} challenges; filter by challenge")
+    return ids
+
+
+async def build_export_query(
+    kind: str,
+    group_id: Optional[str] = None,
+    challenge_id: Optional[str] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+) -> dict:
+    """
+    The Elasticsearch query for an export. Raises ValueError for an unknown
+    kind or a filter the kind does not support, before anything is streamed.
+    """
+    if kind not in EXPORTS:
+        raise ValueError(f"Unknown export '{kind}'; expected one of {', '.join(EXPORTS)}")
+    time_field = EXPORTS[kind]["time_field"]
+    filters = []
+
+    if group_id:
+        if kind == "submissions":
+            # Submissions carry no group_id; match the group's challenges instead
+            filters.append({"terms": {"challenge_id": await _group_challenge_ids(group_id)}})
+        else:
+            filters.append({"term": {"group_id": group_id}})
+
+    if challenge_id:
+        if kind == "submissions":
+            filters.append({"term": {"challenge_id": challenge_id}})
+        elif kind == "challenges":
+            filters.append({"ids": {"values": [challenge_id]}})
+        else:
+            raise ValueError("The leaderboard export cannot be filtered by challenge")
+
+    if since or until:
+        if not time_field:
+            raise ValueError(f"The {kind} export cannot be filtered by time")
+        bounds = {}
+        if since:
+            bounds["gte"] = since.isoformat()
+        if until:
+            bounds["lt"] = until.isoformat()
+        filters.append({"range": {time_field: bounds}})
+
+    return {"bool": {"filter": filters}} if filters else {"match_all": {}}
+
+
+async def export_ndjson(kind: str, query: dict) -> AsyncIterator[bytes]:
+    """One JSON document per line (with its `_id`), read a page at a time."""
+    async for hit in scan_pit(EXPORTS[kind]["index"], query, batch_size=EXPORT_BATCH_SIZE):
+        line = json.dumps({"_id": hit["_id"], **hit["_source"]}, separators=(",", ":"), default=str)
+        yield line.encode() + b"\n"
+
+
+async def gzip_stream(chunks: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+    """Gzip-compresses a byte stream on the fly, emitting ~EXPORT_CHUNK_BYTES pieces."""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits 31: gzip header and trailer
+    pending = bytearray()
+    async for chunk in chunks:
+        pending += compressor.compress(chunk)
+        if len(pending) >= EXPORT_CHUNK_BYTES:
+            yield bytes(pending)
+            pending.clear()
+    pending += compressor.flush()
+    yield bytes(pending)
@@ -1,12 +1,17 @@
 from fastapi import HTTPException
-from elasticsearch import AsyncElasticsearch, NotFoundError
+from elasticsearch import NotFoundError
+from search.connection import get_es
 from uuid import uuid4
 from datetime import datetime
+from typing import Optional
 from schemas.schemas import GroupCreate
+from utils.es_utils import invalidate_group_challenges
+from utils.pagination import search_page
+from manager.auth_manager import get_users_by_ids
 
-# Use the async client, consistent with the rest of the application
-es = AsyncElasticsearch("http://localhost:9200")
 GROUP_INDEX = "groups"
+# What the group list needs (GroupOut)
+GROUP_LIST_FIELDS = ["name", "description", "created_by", "members"]
 
 async def create_group_es(group_data: GroupCreate, user_id: str) -> dict:
     """
@@ -22,18 +27,29 @@ async def create_group_es(group_data: GroupCreate, user_id: str) -> dict:
         "created_at": datetime.utcnow().isoformat(),
         "members": [user_id]  # Creator auto-joins
     }
-    await es.index(index=GROUP_INDEX, id=group_id, document=doc)
+    await get_es().index(index=GROUP_INDEX, id=group_id, document=doc)
     return doc
 
-async def list_groups_es() -> list[dict]:
+async def list_groups_es(limit: int = 100, after: Optional[str] = None) -> tuple[list[dict], Optional[str]]:
     """
-    Retrieves all groups from Elasticsearch. This version ensures the
-    document ID is included in the returned data.
+    Retrieves one page of groups, oldest first, and the cursor for the next
+    page. Only the fields the group list shows are loaded. This version
+    ensures the document ID is included in the returned data.
     """
-    response = await es.search(index=GROUP_INDEX, query={"match_all": {}}, size=1000)
-    
+    try:
+        hits, next_cursor = await search_page(
+            GROUP_INDEX,
+            query={"match_all": {}},
+            sort=[{"created_at": {"order": "asc", "unmapped_type": "date"}}],
+            limit=limit,
+            after=after,
+            source_includes=GROUP_LIST_FIELDS,
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
     groups_list = []
-    for hit in response["hits"]["hits"]:
+    for hit in hits:
         group_data = hit["_source"]
         # --- FIX: Manually add the document's unique ID to the dictionary ---
         # The 'id' field in _source might be missing in older documents, 
@@ -41,14 +57,14 @@ async def list_groups_es() -> list[dict]:
         group_data["id"] = hit["_id"]
         groups_list.append(group_data)
         
-    return groups_list
+    return groups_list, next_cursor
 
 async def get_group_es(group_id: str) -> dict | None:
     """
     Retrieves a single group by its ID.
     """
     try:
-        response = await es.get(index=GROUP_INDEX, id=group_id)
+        response = await get_es().get(index=GROUP_INDEX, id=group_id)
         group_data = response["_source"]
         group_data["id"] = response["_id"] # Also add the ID here for consistency
         return group_data
@@ -65,7 +81,7 @@ async def join_group_es(group_id: str, user_id: str) -> dict:
             "lang": "painless",
             "params": {"user_id": user_id}
         }
-        await es.update(index=GROUP_INDEX, id=group_id, script=script)
+        await get_es().update(index=GROUP_INDEX, id=group_id, script=script)
         return {"message": "Successfully joined group"}
     except NotFoundError:
         raise HTTPException(status_code=404, detail="Group not found")
@@ -84,9 +100,25 @@ async def get_group_members_es(group_id: str) -> list[str]:
 
 
 
+async def get_group_member_profiles_es(group_id: str, requester_id: str) -> list[dict]:
+    """
+    The group's members with their public profile fields, loaded in one
+    batched mget instead of a get per member. Only visible to members.
+    """
+    member_ids = await get_group_members_es(group_id)
+    if requester_id not in member_ids:
+        raise HTTPException(status_code=403, detail="Only group members can see member details")
+    users = await get_users_by_ids(member_ids, fields=["username", "github_username"])
+    return [
+        {"id": user_id, "username": users.get(user_id, {}).get("username"), "github_username": users.get(user_id, {}).get("github_username")}
+        for user_id in member_ids
+    ]
+
+
 async def delete_group_es(group_id: str) -> bool:
     try:
-        await es.delete(index="groups", id=group_id)
+        await get_es().delete(index=GROUP_INDEX, id=group_id)
+        invalidate_group_challenges(group_id)
         return True
     except NotFoundError:
         return False
\ No newline at end of file
@@ -1,32 +1,71 @@
-from typing import List
-from collections import defaultdict
-from schemas.schemas import LeaderboardEntry, GroupLeaderboardEntry
-from utils.es_utils import get_leaderboard
+from typing import List, Optional
+from fastapi import HTTPException
+from schemas.schemas import LeaderboardEntry, GroupLeaderboardEntry, LeaderboardPosition
+from utils.es_utils import get_leaderboard, get_global_leaderboard
+from utils.pagination import encode_cursor, decode_cursor
+from manager.leaderboard_engine import leaderboard_engine, RankedBoard
+from manager.auth_manager import get_users_by_ids
+
+
+async def _fill_usernames(rows: List[dict]) -> List[dict]:
+    """
+    Leaderboard docs fall back to the user_id when no username was known at
+    scoring time; resolve those with one batched user load. Only needed while
+    the engine warms up: its boards are resolved when they are built.
+    """
+    missing = [row["user_id"] for row in rows if not row.get("username") or row["username"] == row["user_id"]]
+    if not missing:
+        return rows
+    try:
+        users = await get_users_by_ids(missing, fields=["username"])
+    except Exception as e:
+        print(f"[LEADERBOARD WARN] Could not load usernames: {e}")
+        return rows
+    for row in rows:
+        username = users.get(row["user_id"], {}).get("username")
+        if username and (not row.get("username") or row["username"] == row["user_id"]):
+            row["username"] = username
+    return rows
 
 
 # manager/leaderboard.py
-async def get_global_leaderboard_es() -> List[LeaderboardEntry]:
-    all_entries = await get_leaderboard(group_id=None)
-    user_score_aggregator = defaultdict(lambda: {"xp":0.0, "username": "Unknown"}) # Change score to xp
+async def get_global_leaderboard_es(
+    limit: int = 50,
+    after: Optional[str] = None
+) -> tuple[List[LeaderboardEntry], Optional[str]]:
+    """
+    Returns one page of the global leaderboard (XP summed across groups in
+    Elasticsearch) and the cursor for the next page, or None on the last page.
+    """
+    offset = 0
+    if after:
+        try:
+            offset = int(decode_cursor(after).get("offset", 0))
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid leaderboard cursor")
 
-    for entry in all_entries:
-        user_id = entry.get("user_id")
-        if user_id:
-            user_score_aggregator[user_id]["xp"] += entry.get("xp", 0.0) # Change score to xp
-            if user_score_aggregator[user_id]["username"] == "Unknown":
-                user_score_aggregator[user_id]["username"] = entry.get("username", "Unknown")
-
-    global_leaderboard = [
-        LeaderboardEntry(
-            user_id=user_id,
-            username=data["username"],
-            xp=data["xp"] # Change score to xp
-        )
-        for user_id, data in user_score_aggregator.items()
-    ]
-    return sorted(global_leaderboard, key=lambda x: x.xp, reverse=True) # Change score to xp
+    offset = max(offset, 0)
+    if leaderboard_engine.ready:
+        board = leaderboard_engine.global_board
+        rows = board.page(offset, limit)
+        has_more = offset + limit < len(board)
+    else:
+        rows, has_more = await get_global_leaderboard(limit=limit, offset=offset)
+        rows = await _fill_usernames(rows)
+    global_leaderboard = [LeaderboardEntry(**row) for row in rows]
+
+    next_cursor = encode_cursor({"offset": offset + limit}) if has_more else None
+    return global_leaderboard, next_cursor
 
 async def get_group_leaderboard_es(group_id: str) -> List[GroupLeaderboardEntry]:
+    if leaderboard_engine.ready:
+        board = leaderboard_engine.group(group_id)
+        rows = board.page() if board else []
+        return [
+            GroupLeaderboardEntry(user_id=row["user_id"], username=row["username"], xp=row["xp"], group_id=group_id)
+            for row in rows
+        ]
+
     try:
         raw_data = await get_leaderboard(group_id=group_id)
     except Exception as e:
@@ -34,7 +73,7 @@ async def get_group_leaderboard_es(group_id: str) -> List[GroupLeaderboardEntry]
         return []
 
     group_leaderboard = []
-    for entry in raw_data:
+    for entry in await _fill_usernames([entry for entry in raw_data if entry.get("user_id")]):
         # Safely fetch values with fallback
         user_id = entry.get("user_id")
         username = entry.get("username", "Unknown")
@@ -52,4 +91,25 @@ async def get_group_leaderboard_es(group_id: str) -> List[GroupLeaderboardEntry]
             )
         )
 
-    return sorted(group_leaderboard, key=lambda x: x.xp, reverse=True)
\ No newline at end of file
+    return sorted(group_leaderboard, key=lambda x: x.xp, reverse=True)
+
+
+def _position(board: Optional[RankedBoard], user_id: str, radius: int) -> LeaderboardPosition:
+    if not leaderboard_engine.ready:
+        raise HTTPException(status_code=503, detail="Leaderboard is warming up, try again shortly")
+    if board is None or board.rank(user_id) is None:
+        return LeaderboardPosition(user_id=user_id)
+    return LeaderboardPosition(
+        user_id=user_id,
+        rank=board.rank(user_id),
+        xp=board.xp_of(user_id),
+        around=board.around(user_id, radius),
+    )
+
+def get_global_position(user_id: str, radius: int = 5) -> LeaderboardPosition:
+    """Rank on the global board plus `radius` users either side."""
+    return _position(leaderboard_engine.global_board, user_id, radius)
+
+def get_group_position(group_id: str, user_id: str, radius: int = 5) -> LeaderboardPosition:
+    """Rank on a group's board plus `radius` users either side."""
+    return _position(leaderboard_engine.group(group_id), user_id, radius)
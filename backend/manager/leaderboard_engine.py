@@ -0,0 +1,207 @@
+import os
+import asyncio
+from bisect import bisect_left, insort
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+from elasticsearch import NotFoundError
+from elasticsearch.helpers import async_scan
+from search.connection import get_es
+from manager.auth_manager import get_users_by_ids
+
+LEADERBOARD_INDEX = "leaderboard"
+RECONCILE_INTERVAL_SECONDS = float(os.getenv("LEADERBOARD_RECONCILE_SECONDS", "300"))
+
+
+class RankedBoard:
+    """
+    One leaderboard kept as a sorted array of (-xp, user_id) keys, so rank
+    lookups are a bisect and ties break on user_id like the ES aggregation.
+    """
+
+    def __init__(self):
+        self._order: list[tuple[float, str]] = []
+        self._entries: dict[str, tuple[float, str]] = {}  # user_id -> (xp, username)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @classmethod
+    def from_entries(cls, entries: dict[str, tuple[float, str]]) -> "RankedBoard":
+        """Builds a board in one sort instead of n inserts."""
+        board = cls()
+        board._entries = dict(entries)
+        board._order = sorted((-xp, user_id) for user_id, (xp, _) in entries.items())
+        return board
+
+    def set(self, user_id: str, xp: float, username: Optional[str] = None):
+        current = self._entries.get(user_id)
+        if current is not None:
+            del self._order[bisect_left(self._order, (-current[0], user_id))]
+            # Mirror the index: the username is only written on first insert
+            username = current[1]
+        insort(self._order, (-xp, user_id))
+        self._entries[user_id] = (xp, username or user_id)
+
+    def add(self, user_id: str, delta: float, username: Optional[str] = None):
+        current = self._entries.get(user_id)
+        self.set(user_id, (current[0] if current else 0.0) + delta, username)
+
+    def xp_of(self, user_id: str) -> Optional[float]:
+        current = self._entries.get(user_id)
+        return current[0] if current else None
+
+    def rank(self, user_id: str) -> Optional[int]:
+        """1-based rank, or None if the user has no XP on this board."""
+        current = self._entries.get(user_id)
+        if current is None:
+            return None
+        return bisect_left(self._order, (-current[0], user_id)) + 1
+
+    def page(self, offset: int = 0, limit: Optional[int] = None) -> List[Dict]:
+        end = len(self._order) if limit is None else offset + limit
+        return [self._row(i) for i in range(offset, min(end, len(self._order)))]
+
+    def around(self, user_id: str, radius: int = 5) -> List[Dict]:
+        rank = self.rank(user_id)
+        if rank is None:
+            return []
+        start = max(rank - 1 - radius, 0)
+        return self.page(start, 2 * radius + 1)
+
+    def _row(self, index: int) -> Dict:
+        _, user_id = self._order[index]
+        xp, username = self._entries[user_id]
+        return {"rank": index + 1, "user_id": user_id, "username": username, "xp": xp}
+
+
+class LeaderboardEngine:
+    """
+    In-process per-group and global leaderboards. Warmed from the leaderboard
+    index at startup, updated incrementally from update_leaderboard_xp, and
+    periodically rebuilt from the index to correct drift (e.g. XP written by
+    another worker). Each rebuild also resolves entries whose username fell
+    back to the user_id, so requests never look usernames up.
+    """
+
+    def __init__(self):
+        self.groups: dict[str, RankedBoard] = {}
+        self.global_board = RankedBoard()
+        self.ready = False
+        self.last_reconciled_at: Optional[datetime] = None
+        self.last_drift = 0
+        self._rebuilding = False
+        self._dirty: set[tuple[str, str]] = set()
+
+    def group(self, group_id: str) -> Optional[RankedBoard]:
+        return self.groups.get(group_id)
+
+    def apply_xp(self, group_id: str, user_id: str, xp: float, username: Optional[str] = None):
+        """Applies an XP delta that has already been written to the index."""
+        if self._rebuilding:
+            self._dirty.add((group_id, user_id))
+        self.groups.setdefault(group_id, RankedBoard()).add(user_id, xp, username)
+        self.global_board.add(user_id, xp, username)
+
+    async def rebuild(self):
+        """Reloads every leaderboard document and swaps in fresh boards."""
+        self._rebuilding = True
+        self._dirty = set()
+        try:
+            state = await self._load()
+            await self._resolve_usernames(state)
+            # Entries updated while we were scanning may have been read stale;
+            # re-read them (get is real-time) until no new updates arrive.
+            while self._dirty:
+                dirty, self._dirty = self._dirty, set()
+                await self._refresh(state, dirty)
+                await self._resolve_usernames(state, dirty)
+        finally:
+            self._rebuilding = False
+
+        groups, global_board = self._build(state)
+        if self.ready:
+            self.last_drift = sum(
+                1 for group_id, users in state.items()
+                for user_id, (xp, _) in users.items()
+                if group_id not in self.groups or self.groups[group_id].xp_of(user_id) != xp
+            )
+        self.groups, self.global_board = groups, global_board
+        self.ready = True
+        self.last_reconciled_at = datetime.now(timezone.utc)
+
+    async def run_reconciler(self, interval: float = RECONCILE_INTERVAL_SECONDS):
+        """Background loop started from the app lifespan."""
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.rebuild()
+                if self.last_drift:
+                    print(f"[LEADERBOARD] Reconciled {self.last_drift} drifted entries.")
+            except Exception as e:
+                print(f"[LEADERBOARD ERROR] Reconciliation failed: {e}")
+
+    def stats(self) -> Dict:
+        return {
+            "ready": self.ready,
+            "groups": len(self.groups),
+            "users": len(self.global_board),
+            "last_reconciled_at": self.last_reconciled_at,
+            "last_drift": self.last_drift,
+        }
+
+    async def _load(self) -> dict[str, dict[str, tuple[float, str]]]:
+        state: dict[str, dict[str, tuple[float, str]]] = {}
+        try:
+            async for hit in async_scan(get_es(), index=LEADERBOARD_INDEX, query={"query": {"match_all": {}}}):
+                self._put(state, hit["_source"])
+        except NotFoundError:
+            print(f"[LEADERBOARD] Index '{LEADERBOARD_INDEX}' not found; starting empty.")
+        return state
+
+    async def _refresh(self, state: dict, keys: set[tuple[str, str]]):
+        docs = [{"_id": f"{group_id}_{user_id}"} for group_id, user_id in keys]
+        res = await get_es().mget(index=LEADERBOARD_INDEX, docs=docs)
+        for doc in res["docs"]:
+            if doc.get("found"):
+                self._put(state, doc["_source"])
+
+    async def _resolve_usernames(self, state: dict, keys: Optional[set[tuple[str, str]]] = None):
+        """Replaces user_id fallbacks in `state` (or just its `keys`) with usernames, in one batched load."""
+        if keys is None:
+            keys = {(group_id, user_id) for group_id, users in state.items() for user_id in users}
+        missing = [
+            (group_id, user_id) for group_id, user_id in keys
+            if user_id in state.get(group_id, {}) and state[group_id][user_id][1] == user_id
+        ]
+        if not missing:
+            return
+        try:
+            users = await get_users_by_ids({user_id for _, user_id in missing}, fields=["username"])
+        except Exception as e:
+            print(f"[LEADERBOARD WARN] Could not load usernames: {e}")
+            return
+        for group_id, user_id in missing:
+            username = users.get(user_id, {}).get("username")
+            if username:
+                state[group_id][user_id] = (state[group_id][user_id][0], username)
+
+    @staticmethod
+    def _put(state: dict, src: Dict):
+        group_id, user_id = src.get("group_id"), src.get("user_id")
+        if group_id and user_id:
+            state.setdefault(group_id, {})[user_id] = (float(src.get("xp", 0.0)), src.get("username") or user_id)
+
+    @staticmethod
+    def _build(state: dict) -> tuple[dict[str, RankedBoard], RankedBoard]:
+        groups: dict[str, RankedBoard] = {}
+        totals: dict[str, tuple[float, str]] = {}
+        for group_id, users in state.items():
+            groups[group_id] = RankedBoard.from_entries(users)
+            for user_id, (xp, username) in users.items():
+                total, name = totals.get(user_id, (0.0, username))
+                totals[user_id] = (total + xp, name)
+        return groups, RankedBoard.from_entries(totals)
+
+
+# Shared engine for this worker
+leaderboard_engine = LeaderboardEngine()
@@ -0,0 +1,191 @@
+import asyncio
+from datetime import datetime, timezone
+from typing import Dict, List
+from elasticsearch import ConflictError, NotFoundError
+from search.connection import get_es
+from manager.group_manager_es import get_group_members_es
+from manager.auth_manager import get_users_by_ids
+from services.github_service import GITHUB_CONCURRENCY, provision_challenge_repo
+from services.sns_notify import queue_repo_notification
+from utils.es_utils import CHALLENGE_INDEX
+
+# One document per (challenge, member): id "challenge_id:user_id"
+PROVISIONING_INDEX = "repo_provisioning"
+
+PROVISIONING_INDEX_MAPPING = {
+    "challenge_id": {"type": "keyword"},
+    "user_id": {"type": "keyword"},
+    "status": {"type": "keyword"},  # created | failed | skipped
+    "repo_name": {"type": "keyword"},
+    "clone_url": {"type": "keyword", "index": False},
+    "notified": {"type": "boolean"},
+    "attempts": {"type": "integer"},
+    "error": {"type": "text", "index": False},
+    "updated_at": {"type": "date"},
+}
+
+
+def _result_id(challenge_id: str, user_id: str) -> str:
+    return f"{challenge_id}:{user_id}"
+
+
+async def get_provisioning_results(challenge_id: str, member_ids: List[str]) -> Dict[str, dict]:
+    """Stored per-member results for the given members, keyed by user_id."""
+    if not member_ids:
+        return {}
+    res = await get_es().mget(
+        index=PROVISIONING_INDEX,
+        ids=[_result_id(challenge_id, user_id) for user_id in member_ids],
+    )
+    return {doc["_source"]["user_id"]: doc["_source"] for doc in res["docs"] if doc.get("found")}
+
+
+async def _save_result(result: dict):
+    result["updated_at"] = datetime.now(timezone.utc)
+    await get_es().index(
+        index=PROVISIONING_INDEX,
+        id=_result_id(result["challenge_id"], result["user_id"]),
+        document=result,
+    )
+
+
+async def _provision_member(
+    challenge_id: str,
+    user_id: str,
+    user: dict | None,
+    previous: dict | None,
+    challenge_topic: str,
+    api_description: str,
+    slots: asyncio.Semaphore,
+) -> dict:
+    # Created and notified on an earlier run: nothing left to do
+    if previous and previous["status"] == "created" and previous.get("notified"):
+        return previous
+
+    result = {
+        "challenge_id": challenge_id,
+        "user_id": user_id,
+        "status": "failed",
+        "repo_name": None,
+        "clone_url": None,
+        "notified": False,
+        "attempts": (previous or {}).get("attempts", 0) + 1,
+        "error": None,
+    }
+    if previous and previous["status"] == "created":
+        # Repo exists, only the email failed last time
+        result.update(status="created", repo_name=previous["repo_name"], clone_url=previous["clone_url"])
+
+    email = user.get("email") if user else None
+    github_username = user.get("github_username") if user else None
+    if not email or not github_username:
+        print(f"[WARN] User {user_id} missing email or GitHub username. Skipping.")
+        result.update(status="skipped", error="User not found or missing email / GitHub username")
+        await _save_result(result)
+        return result
+
+    if result["status"] != "created":
+        print(f"Creating repo for challenge '{challenge_id}' for user '{github_username}'...")
+        try:
+            async with slots:
+                repo_details = await provision_challenge_repo(
+                    challenge_id=challenge_id,
+                    user_id=user_id,
+                    collaborator_username=github_username
+                )
+        except Exception as e:
+            repo_details = None
+            result["error"] = str(e)
+        if not repo_details:
+            print(f"❌ Repo creation failed for user {user_id}.")
+            result["error"] = result["error"] or "GitHub API error"
+            await _save_result(result)
+            return result
+        result.update(status="created", repo_name=repo_details["repo_name"], clone_url=repo_details["clone_url"])
+
+    # ✅ Notify user with API description from Agent 2 (sent by the SNS outbox)
+    try:
+        result["notified"] = await queue_repo_notification(
+            challenge_id=challenge_id,
+            user_id=user_id,
+            email=email,
+            challenge_title=challenge_topic,
+            repo_name=result["repo_name"],
+            clone_url=result["clone_url"],
+            api_description=api_description,
+            attempt=result["attempts"]
+        )
+    except Exception as e:
+        print(f"[SNS ERROR] Could not queue notification for user {user_id}: {e}")
+    if not result["notified"]:
+        result["error"] = "Notification failed"
+    await _save_result(result)
+    return result
+
+
+async def mark_notification_failed(challenge_id: str, user_id: str, attempt: int, error: str):
+    """
+    Called when the outbox gives up on a repo email: the member goes back to
+    unnotified and the challenge to failed, so /repos/retry sends it again.
+    """
+    es = get_es()
+    try:
+        res = await es.get(index=PROVISIONING_INDEX, id=_result_id(challenge_id, user_id))
+        if res["_source"].get("attempts") != attempt:
+            return  # a later provisioning run already handled this member
+        await es.update(
+            index=PROVISIONING_INDEX, id=_result_id(challenge_id, user_id),
+            doc={"notified": False, "error": f"Notification failed: {error}", "updated_at": datetime.now(timezone.utc)},
+            if_seq_no=res["_seq_no"], if_primary_term=res["_primary_term"],
+        )
+        res = await es.get(index=CHALLENGE_INDEX, id=challenge_id, _source_includes=["repos_status"])
+        # A pending or running provisioning job picks the member up by itself
+        if res["_source"].get("repos_status") == "provisioned":
+            await es.update(
+                index=CHALLENGE_INDEX, id=challenge_id, doc={"repos_status": "failed"},
+                if_seq_no=res["_seq_no"], if_primary_term=res["_primary_term"],
+            )
+    except (ConflictError, NotFoundError):
+        return
+    print(f"[SNS ERROR] Repo email for user {user_id} on challenge {challenge_id} was not sent; retry provisioning to resend.")
+
+
+async def setup_challenge_repos_for_group(
+    challenge_id: str,
+    group_id: str,
+    challenge_topic: str,
+    api_description: str = ""
+) -> Dict[str, int]:
+    """
+    Creates a unique, private GitHub repo for each member of a group and
+    queues an SNS email with API info. Members are provisioned concurrently
+    (GITHUB_CONCURRENCY at a time, paced by the GitHub rate limiter), and
+    each member's outcome is stored, so re-running only redoes what failed.
+    Returns the number of members per outcome.
+    """
+    print(f"🚀 Provisioning repos for challenge {challenge_id}")
+
+    member_ids = await get_group_members_es(group_id)
+    if not member_ids:
+        print(f"[WARN] No members found for group {group_id}.")
+        return {}
+
+    users, previous = await asyncio.gather(
+        get_users_by_ids(member_ids, fields=["email", "github_username"]),
+        get_provisioning_results(challenge_id, member_ids),
+    )
+    slots = asyncio.Semaphore(GITHUB_CONCURRENCY)
+    results = await asyncio.gather(*(
+        _provision_member(
+            challenge_id, user_id, users.get(user_id), previous.get(user_id),
+            challenge_topic, api_description, slots
+        )
+        for user_id in member_ids
+    ))
+
+    summary: Dict[str, int] = {}
+    for result in results:
+        outcome = result["status"] if result["status"] != "created" or result["notified"] else "unnotified"
+        summary[outcome] = summary.get(outcome, 0) + 1
+    print(f"✅ Repo setup for challenge {challenge_id}: {summary}")
+    return summary
@@ -0,0 +1,352 @@
+import os
+from datetime import datetime, timezone
+from elasticsearch import ConflictError, NotFoundError
+from search.connection import get_es
+from manager.testcase_manager import get_testcases_by_challenge
+from manager.evaluation_cache import evaluation_key, get_cached_evaluation, cache_evaluation
+from services.dify_agents import trigger_agent_4_evaluation
+from services.job_queue import JobQueue
+from utils.es_utils import update_leaderboard_xp
+from utils.git_utils import get_code_from_repo
+
+SUBMISSION_INDEX = "submissions"
+
+SUBMISSION_WORKERS = int(os.getenv("SUBMISSION_WORKERS", "4"))
+SUBMISSION_MAX_ATTEMPTS = int(os.getenv("SUBMISSION_MAX_ATTEMPTS", "4"))
+# Must comfortably exceed one clone + Agent 4 round trip; the lease is renewed while running
+SUBMISSION_VISIBILITY_TIMEOUT = float(os.getenv("SUBMISSION_VISIBILITY_TIMEOUT", "300"))
+# Pushes to one repo within this window collapse into one evaluation of the newest commit
+SUBMISSION_DEBOUNCE_SECONDS = float(os.getenv("SUBMISSION_DEBOUNCE_SECONDS", "10"))
+
+# Submissions in these states are never evaluated (again)
+FINAL_STATUSES = ("completed", "error", "superseded")
+
+# One document per (challenge, user): id "challenge_id:user_id"
+SUMMARY_INDEX = "submission_summaries"
+# Completed evaluations after which further pushes to a challenge are ignored
+MAX_EVALUATIONS_PER_CHALLENGE = 3
+# Submission ids of the latest evaluations kept for the feedback page
+RECENT_FEEDBACK_SIZE = 2
+
+SUMMARY_INDEX_MAPPING = {
+    "challenge_id": {"type": "keyword"},
+    "user_id": {"type": "keyword"},
+    "attempts": {"type": "integer"},  # evaluations that finished, completed or error
+    "completed": {"type": "integer"},
+    "best_score": {"type": "float"},
+    "last_status": {"type": "keyword"},
+    "last_score": {"type": "float"},
+    "last_submission_id": {"type": "keyword"},
+    "last_commit": {"type": "keyword"},
+    "last_processed_at": {"type": "date"},
+    "last_completed_at": {"type": "date"},  # like last_processed_at, completed evaluations only
+    "recent_feedback": {"type": "keyword"},  # newest first
+}
+
+# Runs atomically on the summary document; re-applying the same submission is a no-op
+_SUMMARY_SCRIPT = """
+if (ctx._source.last_submission_id == params.submission_id) { ctx.op = 'noop'; return; }
+if (ctx._source.attempts == null) {
+  ctx._source.challenge_id = params.challenge_id;
+  ctx._source.user_id = params.user_id;
+  ctx._source.attempts = 0;
+  ctx._source.completed = 0;
+  ctx._source.recent_feedback = [];
+}
+ctx._source.attempts += 1;
+ctx._source.last_status = params.status;
+ctx._source.last_submission_id = params.submission_id;
+ctx._source.last_commit = params.commit_hash;
+ctx._source.last_processed_at = params.processed_at;
+if (params.status == 'completed') {
+  ctx._source.completed += 1;
+  ctx._source.last_score = params.score;
+  ctx._source.last_completed_at = params.processed_at;
+  if (ctx._source.best_score == null || params.score > ctx._source.best_score) {
+    ctx._source.best_score = params.score;
+  }
+  ctx._source.recent_feedback.add(0, params.submission_id);
+  while (ctx._source.recent_feedback.size() > params.recent_size) {
+    ctx._source.recent_feedback.remove(ctx._source.recent_feedback.size() - 1);
+  }
+}
+"""
+
+
+async def _set_submission_status(submission_id: str, fields: dict):
+    await get_es().update(index=SUBMISSION_INDEX, id=submission_id, doc=fields)
+
+
+def summary_id(challenge_id: str, user_id: str) -> str:
+    return f"{challenge_id}:{user_id}"
+
+
+async def record_evaluation(submission_doc: dict, status: str, score: float | None, processed_at: datetime):
+    """Folds a finished evaluation into the (challenge, user) summary document."""
+    await get_es().update(
+        index=SUMMARY_INDEX,
+        id=summary_id(submission_doc["challenge_id"], submission_doc["user_id"]),
+        script={
+            "source": _SUMMARY_SCRIPT,
+            "lang": "painless",
+            "params": {
+                "challenge_id": submission_doc["challenge_id"],
+                "user_id": submission_doc["user_id"],
+                "submission_id": submission_doc["id"],
+                "commit_hash": submission_doc.get("commit_hash"),
+                "status": status,
+                "score": score,
+                "processed_at": processed_at.isoformat(),
+                "recent_size": RECENT_FEEDBACK_SIZE,
+            },
+        },
+        upsert={},
+        scripted_upsert=True,
+        retry_on_conflict=5,
+    )
+
+
+async def get_submission_summary(challenge_id: str, user_id: str) -> dict | None:
+    try:
+        res = await get_es().get(index=SUMMARY_INDEX, id=summary_id(challenge_id, user_id))
+        return res["_source"]
+    except NotFoundError:
+        return None
+
+
+async def get_submission_summaries(user_id: str, challenge_ids: list[str]) -> dict[str, dict]:
+    """The user's summaries for the given challenges in one mget, keyed by challenge_id."""
+    if not challenge_ids:
+        return {}
+    try:
+        res = await get_es().mget(
+            index=SUMMARY_INDEX, ids=[summary_id(cid, user_id) for cid in challenge_ids]
+        )
+    except NotFoundError:
+        return {}
+    return {doc["_source"]["challenge_id"]: doc["_source"] for doc in res["docs"] if doc.get("found")}
+
+
+async def load_recent_feedback(user_id: str, size: int = RECENT_FEEDBACK_SIZE) -> list[dict]:
+    """
+    The user's latest `size` completed evaluations: the summaries completed
+    most recently hold pointers to them, which are loaded with one mget.
+    """
+    es = get_es()
+    res = await es.search(
+        index=SUMMARY_INDEX,
+        query={"bool": {"filter": [{"term": {"user_id": user_id}}, {"range": {"completed": {"gt": 0}}}]}},
+        sort=[{"last_completed_at": {"order": "desc", "unmapped_type": "date"}}],
+        size=size, _source=["recent_feedback"],
+    )
+    submission_ids = [sid for hit in res["hits"]["hits"] for sid in hit["_source"].get("recent_feedback", [])]
+    if not submission_ids:
+        return []
+    docs = await es.mget(
+        index=SUBMISSION_INDEX, ids=submission_ids,
+        source_includes=["challenge_id", "score", "feedback", "processed_at"],
+    )
+    found = [doc["_source"] for doc in docs["docs"] if doc.get("found")]
+    found.sort(key=lambda src: src.get("processed_at") or "", reverse=True)
+    return found[:size]
+
+
+async def process_submission(submission_doc: dict, testcases_str: str):
+    """
+    Checks out the pushed commit, evaluates it with Agent 4 and stores the
+    result. Raises on failure so the queue can retry.
+    """
+    submission_id = submission_doc["id"]
+    print(f"🚀 Starting evaluation for submission: {submission_id}")
+
+    print(f"📥 Cloning repo: {submission_doc['clone_url']} at commit {submission_doc['commit_hash']}")
+    user_code_str = await get_code_from_repo(
+        clone_url=submission_doc["clone_url"],
+        commit_hash=submission_doc["commit_hash"],
+        repo_name=submission_doc.get("repo_name")
+    )
+    print(f"✅ Repo cloned")
+
+    cache_key = evaluation_key(submission_doc["challenge_id"], user_code_str, testcases_str)
+    cached = get_cached_evaluation(cache_key)
+    if cached:
+        # Same code against the same test cases: reuse the earlier verdict
+        score, feedback = cached["score"], cached["feedback"]
+        print(f"♻ Reusing evaluation of submission {cached['submission_id']} for {submission_id}")
+    else:
+        print(f"🤖 Triggering Agent 4 evaluation...")
+        result = await trigger_agent_4_evaluation(
+            user_code=user_code_str,
+            test_cases=testcases_str,
+            user_id=submission_doc["user_id"]
+        )
+        print(f"✅ Agent 4 triggered")
+
+        # ✅ Fixed parsing logic
+        outputs = result.get("data", {}).get("outputs", {})
+        score = float(outputs.get("score", 0.0))
+        feedback = outputs.get("feedback", "")
+        # One bounded line per evaluation; the feedback itself is stored, not logged
+        print(f"📦 Agent 4 answer: score={score}, feedback={len(feedback or '')} chars, keys={sorted(outputs)}")
+        cache_evaluation(cache_key, submission_doc["challenge_id"], submission_id, score, feedback)
+    print(f"✅ Evaluation complete for {submission_id}. Score: {score}")
+
+    # Status is written before XP so a redelivered job sees "completed"
+    # and cannot award the XP twice.
+    processed_at = datetime.now(timezone.utc)
+    await _set_submission_status(submission_id, {
+        "status": "completed",
+        "score": score,
+        "feedback": feedback,
+        "evaluated_from": cached["submission_id"] if cached else submission_id,
+        "processed_at": processed_at
+    })
+    print(f"✅ Submission saved to Elasticsearch with status: completed")
+
+    if score > 0:
+        await update_leaderboard_xp(
+            user_id=submission_doc["user_id"],
+            challenge_id=submission_doc["challenge_id"],
+            xp_to_add=int(score),
+            username=submission_doc.get("username", submission_doc["user_id"])
+        )
+
+    # Last and non-fatal: a retry would skip the completed submission, so a
+    # failure here must not stop the XP above. The backfill script rebuilds it.
+    try:
+        await record_evaluation(submission_doc, "completed", score, processed_at)
+    except Exception as e:
+        print(f"[WARN] Could not update submission summary for {submission_id}: {e}")
+
+
+def _same_repo_query(submission_doc: dict, extra: list) -> dict:
+    return {"bool": {"filter": [
+        {"term": {"challenge_id": submission_doc["challenge_id"]}},
+        {"term": {"user_id": submission_doc["user_id"]}},
+        {"term": {"source": "webhook"}},
+        *extra,
+    ]}}
+
+
+async def _supersede(hit: dict, newer_id: str) -> bool:
+    """pending -> superseded, only if nobody claimed the submission meanwhile."""
+    try:
+        await get_es().update(
+            index=SUBMISSION_INDEX, id=hit["_id"],
+            doc={"status": "superseded", "superseded_by": newer_id, "processed_at": datetime.now(timezone.utc)},
+            if_seq_no=hit["_seq_no"], if_primary_term=hit["_primary_term"],
+        )
+    except (ConflictError, NotFoundError):
+        return False
+    await submission_queue.cancel(f"submission:{hit['_id']}")
+    print(f"⏭ Submission {hit['_id']} superseded by {newer_id}")
+    return True
+
+
+async def supersede_older_submissions(submission_doc: dict) -> int:
+    """
+    Marks pending webhook submissions of the same repo pushed before this one
+    as superseded and cancels their queued evaluations. Returns how many.
+    """
+    res = await get_es().search(
+        index=SUBMISSION_INDEX,
+        query=_same_repo_query(submission_doc, [
+            {"term": {"status": "pending"}},
+            {"range": {"pushed_at": {"lt": submission_doc["pushed_at"]}}},
+        ]),
+        size=50, seq_no_primary_term=True, _source=False,
+    )
+    superseded = 0
+    for hit in res["hits"]["hits"]:
+        if hit["_id"] != submission_doc["id"] and await _supersede(hit, submission_doc["id"]):
+            superseded += 1
+    return superseded
+
+
+async def _newer_submission_id(submission_doc: dict) -> str | None:
+    """A later push to the same repo that is still going to be evaluated, if any."""
+    res = await get_es().search(
+        index=SUBMISSION_INDEX,
+        query=_same_repo_query(submission_doc, [
+            {"range": {"pushed_at": {"gt": submission_doc["pushed_at"]}}},
+        ]),
+        size=1, sort=[{"pushed_at": "desc"}], _source=["status"],
+    )
+    for hit in res["hits"]["hits"]:
+        if hit["_source"].get("status") != "superseded":
+            return hit["_id"]
+    return None
+
+
+async def run_submission_job(payload: dict):
+    """
+    Queue handler: pending -> running -> completed (errors are retried by the
+    queue). A webhook submission with a newer push to the same repo is marked
+    superseded instead of being cloned and evaluated.
+    """
+    submission_id = payload["submission_id"]
+    try:
+        res = await get_es().get(index=SUBMISSION_INDEX, id=submission_id)
+    except NotFoundError:
+        print(f"⚠ Submission {submission_id} no longer exists. Skipping.")
+        return
+    submission_doc = res["_source"]
+    if submission_doc.get("status") in FINAL_STATUSES:
+        print(f"⚠ Submission {submission_id} already {submission_doc['status']}. Skipping.")
+        return
+
+    if submission_doc.get("pushed_at") and submission_doc.get("status") == "pending":
+        newer_id = await _newer_submission_id(submission_doc)
+        if newer_id:
+            await _supersede({**res, "_id": submission_id}, newer_id)
+            return
+
+    testcases_str = await get_testcases_by_challenge(submission_doc["challenge_id"])
+    try:
+        # Conditional, so a concurrent supersede and this claim cannot both win
+        await get_es().update(
+            index=SUBMISSION_INDEX, id=submission_id,
+            doc={"status": "running", "started_at": datetime.now(timezone.utc)},
+            if_seq_no=res["_seq_no"], if_primary_term=res["_primary_term"],
+        )
+    except ConflictError:
+        # Changed since we read it (superseded, or a redelivered job); retry re-reads it
+        raise RuntimeError(f"Submission {submission_id} changed while starting; retrying")
+    await process_submission(submission_doc, testcases_str)
+
+
+async def mark_submission_failed(payload: dict, error: str):
+    """Dead-letter callback: the submission will not be retried again."""
+    processed_at = datetime.now(timezone.utc)
+    await _set_submission_status(payload["submission_id"], {
+        "status": "error",
+        "score": 0.0,
+        "feedback": None,
+        "error": error,
+        "processed_at": processed_at
+    })
+    print(f"❌ Submission {payload['submission_id']} marked as error: {error}")
+    try:
+        res = await get_es().get(index=SUBMISSION_INDEX, id=payload["submission_id"])
+        await record_evaluation({**res["_source"], "id": payload["submission_id"]}, "error", None, processed_at)
+    except Exception as e:
+        print(f"[WARN] Could not update submission summary for {payload['submission_id']}: {e}")
+
+
+# ValueError covers "no code files found" and misconfigured agents; retrying won't help
+submission_queue = JobQueue(
+    "submissions",
+    handler=run_submission_job,
+    workers=SUBMISSION_WORKERS,
+    visibility_timeout=SUBMISSION_VISIBILITY_TIMEOUT,
+    max_attempts=SUBMISSION_MAX_ATTEMPTS,
+    permanent_errors=(ValueError,),
+    on_dead_letter=mark_submission_failed,
+)
+
+
+async def enqueue_submission(submission_id: str, delay: float = 0.0) -> str:
+    """Durably queues a pending submission for evaluation (idempotent per submission)."""
+    return await submission_queue.enqueue(
+        {"submission_id": submission_id}, job_id=f"submission:{submission_id}", delay=delay
+    )
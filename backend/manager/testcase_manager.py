@@ -1,8 +1,21 @@
-from elasticsearch import AsyncElasticsearch, NotFoundError
+from elasticsearch import NotFoundError
+from search.connection import get_es
+from manager.evaluation_cache import invalidate_challenge_evaluations
 
-es = AsyncElasticsearch("http://localhost:9200")
 TESTCASE_INDEX = "testcases"
 
+async def save_testcases(challenge_id: str, testcases: str):
+    """
+    Writes a challenge's test cases and drops cached evaluations made
+    against the previous version.
+    """
+    await get_es().index(
+        index=TESTCASE_INDEX,
+        id=challenge_id,
+        document={"challenge_id": challenge_id, "testcases": testcases}
+    )
+    invalidate_challenge_evaluations(challenge_id)
+
 async def get_testcases_by_challenge(challenge_id: str) -> str | None:
     """
     Fetches the test cases document for a specific challenge from Elasticsearch.
@@ -11,7 +24,7 @@ async def get_testcases_by_challenge(challenge_id: str) -> str | None:
     """
     try:
         # The document ID for test cases is the challenge_id
-        res = await es.get(index=TESTCASE_INDEX, id=challenge_id)
+        res = await get_es().get(index=TESTCASE_INDEX, id=challenge_id)
         return res["_source"]["testcases"]
     except NotFoundError:
         print(f"No test cases found for challenge_id: {challenge_id}")
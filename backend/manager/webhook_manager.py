@@ -0,0 +1,190 @@
+import os
+import re
+import json
+import time
+import hashlib
+from collections import deque
+from uuid import uuid5, NAMESPACE_URL
+from datetime import datetime, timezone
+from typing import Dict, Optional
+from elasticsearch import ConflictError
+from search.connection import get_es
+from services.job_queue import JobQueue
+from manager.auth_manager import get_user_by_id
+from manager.submission_manager import (
+    MAX_EVALUATIONS_PER_CHALLENGE,
+    SUBMISSION_DEBOUNCE_SECONDS,
+    enqueue_submission,
+    get_submission_summary,
+    supersede_older_submissions,
+)
+from utils.cache import TTLCache
+
+SUBMISSION_INDEX = "submissions"
+
+WEBHOOK_WORKERS = int(os.getenv("WEBHOOK_WORKERS", "2"))
+WEBHOOK_MAX_ATTEMPTS = int(os.getenv("WEBHOOK_MAX_ATTEMPTS", "5"))
+# GitHub redelivers within minutes; this catches most repeats without an ES call
+WEBHOOK_SEEN_TTL_SECONDS = float(os.getenv("WEBHOOK_SEEN_TTL_SECONDS", "3600"))
+# Finished delivery jobs are purged after this; GitHub only redelivers the last 3 days
+WEBHOOK_DEDUPE_RETENTION_SECONDS = float(os.getenv("WEBHOOK_DEDUPE_RETENTION_SECONDS", str(3 * 24 * 3600)))
+# Acknowledgement latencies kept for the percentile metrics
+WEBHOOK_LATENCY_SAMPLES = 2048
+
+_seen_deliveries = TTLCache("webhook_deliveries", maxsize=10_000, ttl=WEBHOOK_SEEN_TTL_SECONDS)
+_ack_latencies_ms: deque = deque(maxlen=WEBHOOK_LATENCY_SAMPLES)
+counters = {"accepted": 0, "duplicates": 0, "ignored": 0, "submitted": 0, "superseded": 0}
+
+REPO_NAME_PATTERN = re.compile(r"/dojo-([a-f0-9\-]{36})-([^/]+)")
+
+
+def delivery_key(delivery_id: Optional[str], body: bytes) -> str:
+    """X-GitHub-Delivery, or a hash of the body when the header is missing."""
+    return delivery_id or "sha256-" + hashlib.sha256(body).hexdigest()
+
+
+async def record_delivery(delivery_id: str, event: str, body: bytes) -> bool:
+    """
+    Durably appends the raw event as a webhook job, unless this delivery was
+    already recorded. Returns False for a duplicate.
+    """
+    if _seen_deliveries.get(delivery_id):
+        counters["duplicates"] += 1
+        return False
+    created = await webhook_queue.enqueue_once(
+        {
+            "delivery_id": delivery_id,
+            "event": event,
+            "body": body.decode("utf-8", errors="replace"),
+            "received_at": datetime.now(timezone.utc).isoformat(),
+        },
+        job_id=f"webhook:{delivery_id}",
+    )
+    _seen_deliveries.set(delivery_id, True)
+    counters["accepted" if created else "duplicates"] += 1
+    return created
+
+
+def record_ack_latency(started: float):
+    _ack_latencies_ms.append((time.perf_counter() - started) * 1000)
+
+
+def _ignore(reason: str) -> Dict:
+    print(f"⚠ {reason}")
+    counters["ignored"] += 1
+    return {"status": "ignored", "reason": reason}
+
+
+async def process_webhook_event(job: dict) -> Dict:
+    """
+    Turns a recorded push event into a pending submission and queues its
+    evaluation after the debounce window, superseding older pending pushes to
+    the same repo. The submission id is derived from the delivery id, so a
+    retried job never creates a second submission.
+    """
+    payload = json.loads(job["body"])  # ValueError: dead-lettered, retrying cannot help
+
+    if 'pusher' not in payload:
+        return _ignore("Ignored non-push event")
+
+    head_commit = payload.get("head_commit") or {}
+    changed_files = head_commit.get("modified", []) + head_commit.get("added", [])
+    changed_files = [f.lower() for f in changed_files]
+
+    if changed_files and all(f == "readme.md" for f in changed_files):
+        return _ignore("Skipping evaluation: only README.md was changed.")
+
+    if payload.get("deleted", False):
+        return _ignore("Ignoring branch deletion event")
+
+    repo_name = payload.get("repository", {}).get("full_name") or ""
+    print(f"📁 Repo Name: {repo_name}")
+
+    match = REPO_NAME_PATTERN.search(repo_name)
+    if not match:
+        return _ignore(f"Repo name '{repo_name}' does not match expected format.")
+
+    challenge_id = match.group(1)
+    github_user_id = match.group(2)
+    print(f"🧠 Challenge ID: {challenge_id}, GitHub User: {github_user_id}")
+
+    user_doc = await get_user_by_id(github_user_id)
+    if not user_doc:
+        return _ignore(f"User '{github_user_id}' not found in DOJO system.")
+
+    actual_user_id_for_db = user_doc.get("id", github_user_id)
+    actual_username_for_display = user_doc.get("username", github_user_id)
+
+    summary = await get_submission_summary(challenge_id, actual_user_id_for_db)
+    if summary and summary.get("completed", 0) >= MAX_EVALUATIONS_PER_CHALLENGE:
+        return _ignore(f"Duplicate submission blocked for user={actual_user_id_for_db}, challenge={challenge_id}")
+
+    submission_id = str(uuid5(NAMESPACE_URL, f"github-delivery:{job['delivery_id']}"))
+    doc = {
+        "id": submission_id,
+        "challenge_id": challenge_id,
+        "user_id": actual_user_id_for_db,
+        "username": actual_username_for_display,
+        "repo_name": repo_name,
+        "clone_url": payload["repository"]["clone_url"],
+        "commit_hash": payload["after"],
+        "commit_message": head_commit.get("message", ""),
+        "source": "webhook",
+        "delivery_id": job["delivery_id"],
+        "pushed_at": job["received_at"],
+        "status": "pending",
+        "created_at": datetime.now(timezone.utc)
+    }
+    es = get_es()
+    try:
+        # Searchable before the supersede checks of later pushes run
+        await es.create(index=SUBMISSION_INDEX, id=submission_id, document=doc, refresh="wait_for")
+        counters["submitted"] += 1
+    except ConflictError:
+        print(f"[WEBHOOK] Submission {submission_id} already created by an earlier attempt.")
+    counters["superseded"] += await supersede_older_submissions(doc)
+    # Durable hand-off: the evaluation survives a worker restart. The delay
+    # lets quick follow-up pushes supersede this one before it is cloned.
+    await enqueue_submission(submission_id, delay=SUBMISSION_DEBOUNCE_SECONDS)
+    print(f"✅ Submission created and queued for evaluation: {submission_id}")
+    return {"status": "submitted", "submission_id": submission_id}
+
+
+async def _handle_webhook_job(job: dict):
+    await process_webhook_event(job)
+
+
+async def _log_dead_webhook(job: dict, error: str):
+    print(f"[WEBHOOK ERROR] Dropped delivery {job.get('delivery_id')}: {error}")
+
+
+webhook_queue = JobQueue(
+    "webhooks",
+    _handle_webhook_job,
+    workers=WEBHOOK_WORKERS,
+    visibility_timeout=120,
+    max_attempts=WEBHOOK_MAX_ATTEMPTS,
+    permanent_errors=(ValueError, KeyError),
+    keep_completed=True,  # the job id is the delivery id, so finished jobs keep deduplicating
+    completed_retention=WEBHOOK_DEDUPE_RETENTION_SECONDS,
+    on_dead_letter=_log_dead_webhook,
+)
+
+
+def webhook_stats() -> Dict:
+    latencies = sorted(_ack_latencies_ms)
+
+    def pct(p: float) -> Optional[float]:
+        if not latencies:
+            return None
+        return round(latencies[min(len(latencies) - 1, int(len(latencies) * p))], 2)
+
+    return {
+        "ack_latency_ms": {
+            "samples": len(latencies),
+            "p50": pct(0.50),
+            "p99": pct(0.99),
+            "max": round(latencies[-1], 2) if latencies else None,
+        },
+        **counters,
+    }
@@ -1,5 +1,5 @@
 from pydantic import BaseModel, EmailStr
-from typing import Optional, List
+from typing import Any, Dict, Optional, List
 from datetime import datetime
 
 # ==================================
@@ -65,6 +65,15 @@ class ChallengeOut(BaseModel):
     group_id: str
     created_by: str
     problem_statement: Optional[str] = None
+    status: str = "ready"  # generating | ready | failed
+
+class ChallengeGenerationStatus(BaseModel):
+    """Progress of a challenge's background generation."""
+    id: str
+    status: str
+    steps: Dict[str, Dict[str, Any]] = {}
+    error: Optional[str] = None
+    repos_status: Optional[str] = None
 
 # ==================================
 # Submission Schemas
@@ -83,6 +92,22 @@ class SubmissionOut(BaseModel):
     status: str
     score: Optional[float] = None
     feedback: Optional[str] = None
+    superseded_by: Optional[str] = None
+
+
+class SubmissionSummary(BaseModel):
+    """A user's evaluation progress on one challenge."""
+    challenge_id: str
+    user_id: str
+    attempts: int = 0
+    completed: int = 0
+    best_score: Optional[float] = None
+    last_status: Optional[str] = None
+    last_score: Optional[float] = None
+    last_submission_id: Optional[str] = None
+    last_commit: Optional[str] = None
+    last_processed_at: Optional[datetime] = None
+    last_completed_at: Optional[datetime] = None
 
 # ==================================
 # Leaderboard Schemas
@@ -98,5 +123,15 @@ class GroupLeaderboardEntry(BaseModel):
     xp: float # Change from score to xp
     group_id: str
 
+class RankedLeaderboardEntry(LeaderboardEntry):
+    rank: int
+
+class LeaderboardPosition(BaseModel):
+    """A user's rank on a leaderboard and the users ranked around them."""
+    user_id: str
+    rank: Optional[int] = None # None if the user has no XP on this board
+    xp: float = 0.0
+    around: List[RankedLeaderboardEntry] = []
+
 
     
\ No newline at end of file
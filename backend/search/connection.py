@@ -1,10 +1,118 @@
-from elasticsearch import Elasticsearch
-from elasticsearch_dsl import connections
+import os
+import time
+import asyncio
+from elasticsearch import AsyncElasticsearch
+from elastic_transport import AiohttpHttpNode
+from dotenv import load_dotenv
 
-ES_URL = "http://localhost:9200"
+load_dotenv()
 
-# Clients
-es = Elasticsearch(ES_URL)
-connections.create_connection(hosts=[ES_URL])
+# --- Configuration ---
+# ELASTICSEARCH_URL wins, ES_HOST is kept for older .env files.
+ES_URL = os.getenv("ELASTICSEARCH_URL") or os.getenv("ES_HOST", "http://localhost:9200")
+ES_MAX_CONNECTIONS = int(os.getenv("ES_MAX_CONNECTIONS", "25"))
+ES_REQUEST_TIMEOUT = float(os.getenv("ES_REQUEST_TIMEOUT", "10"))
+ES_MAX_RETRIES = int(os.getenv("ES_MAX_RETRIES", "3"))
+ES_RETRY_ON_TIMEOUT = os.getenv("ES_RETRY_ON_TIMEOUT", "true").lower() in ("1", "true", "yes")
 
-# Don’t check on import – let FastAPI lifecycle handle it
+# Per-node pool stats, keyed by node base URL
+_pool_stats: dict[str, dict] = {}
+
+# The one client shared by every manager and router
+_client: AsyncElasticsearch | None = None
+
+
+class InstrumentedNode(AiohttpHttpNode):
+    """
+    aiohttp node that caps concurrent requests at the pool size and records
+    how many requests are in flight and how long callers waited for a slot.
+    """
+
+    def __init__(self, config):
+        super().__init__(config)
+        self._slots = asyncio.Semaphore(config.connections_per_node)
+        self._stats = _pool_stats.setdefault(self.base_url, {
+            "pool_size": config.connections_per_node,
+            "in_flight": 0,
+            "waiting": 0,
+            "requests": 0,
+            "errors": 0,
+            "total_wait_ms": 0.0,
+            "max_wait_ms": 0.0,
+            "total_request_ms": 0.0,
+        })
+
+    async def perform_request(self, *args, **kwargs):
+        stats = self._stats
+        stats["waiting"] += 1
+        queued_at = time.perf_counter()
+        async with self._slots:
+            waited_ms = (time.perf_counter() - queued_at) * 1000
+            stats["waiting"] -= 1
+            stats["total_wait_ms"] += waited_ms
+            stats["max_wait_ms"] = max(stats["max_wait_ms"], waited_ms)
+            stats["in_flight"] += 1
+            started_at = time.perf_counter()
+            try:
+                return await super().perform_request(*args, **kwargs)
+            except Exception:
+                stats["errors"] += 1
+                raise
+            finally:
+                stats["in_flight"] -= 1
+                stats["requests"] += 1
+                stats["total_request_ms"] += (time.perf_counter() - started_at) * 1000
+
+
+def create_es_client() -> AsyncElasticsearch:
+    """Builds an AsyncElasticsearch client from the ES_* environment settings."""
+    return AsyncElasticsearch(
+        ES_URL,
+        node_class=InstrumentedNode,
+        connections_per_node=ES_MAX_CONNECTIONS,
+        request_timeout=ES_REQUEST_TIMEOUT,
+        max_retries=ES_MAX_RETRIES,
+        retry_on_timeout=ES_RETRY_ON_TIMEOUT,
+    )
+
+
+async def init_es() -> AsyncElasticsearch:
+    """Creates the shared client. Called once from the FastAPI lifespan."""
+    global _client
+    if _client is None:
+        _client = create_es_client()
+        print(f"[ES] Client pool ready: {ES_URL} (max {ES_MAX_CONNECTIONS} connections)")
+    return _client
+
+
+async def close_es():
+    """Closes the shared client and its connection pool on shutdown."""
+    global _client
+    if _client is not None:
+        await _client.close()
+        _client = None
+        print("[ES] Client pool closed.")
+
+
+def get_es() -> AsyncElasticsearch:
+    """
+    Returns the shared client. Usable as a FastAPI dependency or called
+    directly from managers; scripts outside the app get a lazily created client.
+    """
+    global _client
+    if _client is None:
+        _client = create_es_client()
+    return _client
+
+
+def get_pool_stats() -> dict:
+    """Snapshot of the per-node connection pool stats."""
+    snapshot = {}
+    for node, stats in _pool_stats.items():
+        requests = stats["requests"]
+        snapshot[node] = {
+            **stats,
+            "avg_wait_ms": round(stats["total_wait_ms"] / requests, 3) if requests else 0.0,
+            "avg_request_ms": round(stats["total_request_ms"] / requests, 3) if requests else 0.0,
+        }
+    return snapshot
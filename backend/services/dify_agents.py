@@ -1,6 +1,10 @@
 import os
-import httpx
+import time
 import json
+import random
+import asyncio
+import importlib.util
+import httpx
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -18,54 +22,238 @@ DIFY_AGENT_3_API_KEY = os.getenv("DIFY_AGENT_3_API_KEY")
 DIFY_AGENT_4_API_URL = os.getenv("DIFY_AGENT_4_API_URL")
 DIFY_AGENT_4_API_KEY = os.getenv("DIFY_AGENT_4_API_KEY")
 
+# --- HTTP client settings ---
+DIFY_TIMEOUT_SECONDS = float(os.getenv("DIFY_TIMEOUT_SECONDS", "120"))
+DIFY_MAX_CONNECTIONS = int(os.getenv("DIFY_MAX_CONNECTIONS", "10"))
+DIFY_HTTP2 = os.getenv("DIFY_HTTP2", "false").lower() in ("1", "true", "yes")
+DIFY_MAX_RETRIES = int(os.getenv("DIFY_MAX_RETRIES", "3"))
+DIFY_RETRY_BASE_DELAY = float(os.getenv("DIFY_RETRY_BASE_DELAY", "1"))
+DIFY_RETRY_MAX_DELAY = float(os.getenv("DIFY_RETRY_MAX_DELAY", "30"))
+DIFY_CIRCUIT_THRESHOLD = int(os.getenv("DIFY_CIRCUIT_THRESHOLD", "5"))
+DIFY_CIRCUIT_RESET_SECONDS = float(os.getenv("DIFY_CIRCUIT_RESET_SECONDS", "30"))
+DIFY_LOG_BODY_CHARS = int(os.getenv("DIFY_LOG_BODY_CHARS", "500"))
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+
+
+class CircuitOpenError(RuntimeError):
+    """Raised without calling Dify while an agent's circuit breaker is open."""
+
+
+class CircuitBreaker:
+    """
+    Opens after `threshold` consecutive failed calls and fails fast for
+    `reset_seconds`; then lets one trial call through (half-open).
+
+    allow() returns a token (None when the call must fail fast) that the call
+    passes back with its outcome. Once the circuit is open, only the trial's
+    token can close it, reopen it or free the half-open slot; outcomes of
+    calls that started before it opened are ignored.
+    """
+
+    def __init__(self, threshold: int, reset_seconds: float):
+        self.threshold = threshold
+        self.reset_seconds = reset_seconds
+        self.failures = 0
+        self.opened_at: float | None = None
+        self._trial: object | None = None  # token of the half-open trial call
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        return "half-open" if time.monotonic() - self.opened_at >= self.reset_seconds else "open"
+
+    def allow(self) -> object | None:
+        state = self.state
+        if state == "closed":
+            return object()
+        if state == "half-open" and self._trial is None:
+            self._trial = object()
+            return self._trial
+        return None
+
+    def _stale(self, token: object) -> bool:
+        return self.opened_at is not None and token is not self._trial
+
+    def record_success(self, token: object):
+        if self._stale(token):
+            return
+        self.failures = 0
+        self.opened_at = None
+        self._trial = None
+
+    def record_failure(self, token: object):
+        if self._stale(token):
+            return
+        self.failures += 1
+        self._trial = None
+        if self.opened_at is not None or self.failures >= self.threshold:
+            self.opened_at = time.monotonic()
+
+    def release_trial(self, token: object):
+        """Frees the half-open slot if `token` holds it and ended without an outcome (e.g. cancelled)."""
+        if token is self._trial:
+            self._trial = None
+
+
+# One long-lived client, breaker and stats entry per agent
+_clients: dict[str, httpx.AsyncClient] = {}
+_breakers: dict[str, CircuitBreaker] = {}
+_agent_stats: dict[str, dict] = {}
+
+
+def _get_client(agent: str) -> httpx.AsyncClient:
+    client = _clients.get(agent)
+    if client is None or client.is_closed:
+        http2 = DIFY_HTTP2 and importlib.util.find_spec("h2") is not None
+        if DIFY_HTTP2 and not http2:
+            print("[DIFY WARN] DIFY_HTTP2 is set but the 'h2' package is not installed; using HTTP/1.1.")
+        client = _clients[agent] = httpx.AsyncClient(
+            timeout=httpx.Timeout(DIFY_TIMEOUT_SECONDS, connect=10.0),
+            limits=httpx.Limits(
+                max_connections=DIFY_MAX_CONNECTIONS,
+                max_keepalive_connections=DIFY_MAX_CONNECTIONS,
+                keepalive_expiry=60.0,
+            ),
+            http2=http2,
+        )
+    return client
 
-async def _safe_post(url: str, payload: dict, api_key: str):
-    """Safely performs a POST request with the correct authentication for each agent."""
+
+def _stats_for(agent: str) -> dict:
+    return _agent_stats.setdefault(agent, {
+        "calls": 0, "errors": 0, "retries": 0, "rejected_open_circuit": 0,
+        "latency_ms_total": 0.0, "latency_ms_max": 0.0,
+    })
+
+
+def _retry_delay(attempt: int, response: httpx.Response | None) -> float:
+    """Honours Retry-After when Dify sends one, else full-jitter exponential backoff."""
+    if response is not None:
+        retry_after = response.headers.get("Retry-After")
+        if retry_after and retry_after.isdigit():
+            return min(float(retry_after), DIFY_RETRY_MAX_DELAY)
+    return random.uniform(0, min(DIFY_RETRY_MAX_DELAY, DIFY_RETRY_BASE_DELAY * 2 ** attempt))
+
+
+def _truncate(text: str) -> str:
+    if len(text) <= DIFY_LOG_BODY_CHARS:
+        return text
+    return f"{text[:DIFY_LOG_BODY_CHARS]}... [{len(text) - DIFY_LOG_BODY_CHARS} more chars]"
+
+
+async def _safe_post(agent: str, url: str, payload: dict, api_key: str):
+    """
+    Safely performs a POST request with the correct authentication for each agent.
+    Retries 429/5xx and connection errors with jittered backoff, and fails fast
+    while the agent's circuit breaker is open.
+    """
     if not url or not api_key:
         raise ValueError("Dify agent URL or API Key is not configured in .env file.")
 
+    stats = _stats_for(agent)
+    breaker = _breakers.setdefault(agent, CircuitBreaker(DIFY_CIRCUIT_THRESHOLD, DIFY_CIRCUIT_RESET_SECONDS))
+    token = breaker.allow()
+    if token is None:
+        stats["rejected_open_circuit"] += 1
+        raise CircuitOpenError(f"Dify {agent} is failing; circuit open, not calling {url}")
+
     headers = {
         "Authorization": f"Bearer {api_key}",
         "Content-Type": "application/json"
     }
+    client = _get_client(agent)
+    stats["calls"] += 1
+    started = time.perf_counter()
+
+    try:
+        for attempt in range(DIFY_MAX_RETRIES + 1):
+            response = None
+            try:
+                response = await client.post(url, headers=headers, json=payload)
+                if response.status_code not in RETRYABLE_STATUS_CODES or attempt == DIFY_MAX_RETRIES:
+                    break
+            except (httpx.ConnectError, httpx.ConnectTimeout, httpx.RemoteProtocolError) as e:
+                if attempt == DIFY_MAX_RETRIES:
+                    raise
+                print(f"[DIFY] {agent} connection error: {e}")
+            stats["retries"] += 1
+            delay = _retry_delay(attempt, response)
+            print(f"[DIFY] {agent} retry {attempt + 1}/{DIFY_MAX_RETRIES} in {delay:.1f}s"
+                  + (f" (HTTP {response.status_code})" if response is not None else ""))
+            await asyncio.sleep(delay)
+
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        print(f"[DIFY] {agent} HTTP {response.status_code} in {elapsed_ms:.0f} ms, {len(response.content)} bytes")
+        response.raise_for_status()
+
+        data = response.json()
+        if data.get("status") == "failed":
+            raise RuntimeError(f"Dify agent at {url} failed with error: {data.get('error')}")
+
+        breaker.record_success(token)
+        return data
+
+    except httpx.HTTPStatusError as e:
+        _record_failure(agent, breaker, token, e.response.status_code)
+        raise RuntimeError(f"HTTP error {e.response.status_code} for URL {url}: {_truncate(e.response.text)}")
+    except json.JSONDecodeError:
+        _record_failure(agent, breaker, token)
+        raise ValueError(f"Invalid JSON from Dify for URL {url}. Raw response:\n{_truncate(repr(response.text))}")
+    except Exception as e:
+        _record_failure(agent, breaker, token)
+        raise RuntimeError(f"An unexpected error occurred while calling Dify agent at {url}: {e}")
+    finally:
+        # No-op after record_success/record_failure; unwedges half-open on cancellation
+        breaker.release_trial(token)
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        stats["latency_ms_total"] += elapsed_ms
+        stats["latency_ms_max"] = max(stats["latency_ms_max"], elapsed_ms)
+
+
+def _record_failure(agent: str, breaker: CircuitBreaker, token: object, status_code: int | None = None):
+    _stats_for(agent)["errors"] += 1
+    # 4xx other than 429 means a bad request, not a degraded Dify
+    if status_code is None or status_code == 429 or status_code >= 500:
+        breaker.record_failure(token)
+    else:
+        breaker.record_success(token)
+
+
+async def close_dify_clients():
+    """Closes the pooled agent clients on shutdown."""
+    for client in _clients.values():
+        await client.aclose()
+    _clients.clear()
+
 
-    async with httpx.AsyncClient(timeout=120.0) as client:
-        try:
-            response = await client.post(url, headers=headers, json=payload)
-            print("\n--- Dify Raw Response ---")
-            print(f"URL: {url}")
-            print(f"Status Code: {response.status_code}")
-            print(f"Response Body: {response.text}")
-            print("-------------------------\n")
-            response.raise_for_status()
-            
-            data = response.json()
-            if data.get("status") == "failed":
-                raise RuntimeError(f"Dify agent at {url} failed with error: {data.get('error')}")
-            
-            return data
-
-        except httpx.HTTPStatusError as e:
-            raise RuntimeError(f"HTTP error {e.response.status_code} for URL {url}: {e.response.text}")
-        except json.JSONDecodeError:
-            raise ValueError(f"Invalid JSON from Dify for URL {url}. Raw response:\n{repr(response.text)}")
-        except Exception as e:
-            raise RuntimeError(f"An unexpected error occurred while calling Dify agent at {url}: {e}")
+def dify_stats() -> dict:
+    """Per-agent call, error, retry and latency counters plus breaker state."""
+    snapshot = {}
+    for agent, stats in _agent_stats.items():
+        breaker = _breakers.get(agent)
+        calls = stats["calls"]
+        snapshot[agent] = {
+            **stats,
+            "latency_ms_avg": round(stats["latency_ms_total"] / calls, 1) if calls else 0.0,
+            "circuit": breaker.state if breaker else "closed",
+        }
+    return snapshot
 
 
 # (trigger_agent_1, trigger_agent_2_breakdown, trigger_agent_3_testcases remain the same)
 # ...
 async def trigger_agent_1(Topic: str, difficulty: str, user_id: str):
     payload = { "inputs": { "Topic": Topic, "difficulty": difficulty }, "response_mode": "blocking", "user": user_id }
-    return await _safe_post(DIFY_AGENT_1_API_URL, payload, DIFY_AGENT_1_API_KEY)
+    return await _safe_post("agent_1", DIFY_AGENT_1_API_URL, payload, DIFY_AGENT_1_API_KEY)
 
 async def trigger_agent_2_breakdown(statement: str, user_id: str):
     payload = { "inputs": { "statement": statement }, "response_mode": "blocking", "user": user_id }
-    return await _safe_post(DIFY_AGENT_2_API_URL, payload, DIFY_AGENT_2_API_KEY)
+    return await _safe_post("agent_2", DIFY_AGENT_2_API_URL, payload, DIFY_AGENT_2_API_KEY)
 
 async def trigger_agent_3_testcases(prompt: str, user_id: str):
     payload = { "inputs": { "prompt": prompt }, "response_mode": "blocking", "user": user_id }
-    return await _safe_post(DIFY_AGENT_3_API_URL, payload, DIFY_AGENT_3_API_KEY)
+    return await _safe_post("agent_3", DIFY_AGENT_3_API_URL, payload, DIFY_AGENT_3_API_KEY)
 
 
 # --- Agent 4: Evaluate Submission (UPDATED) ---
@@ -82,4 +270,4 @@ async def trigger_agent_4_evaluation(user_code: str, test_cases: str, user_id: s
         "response_mode": "blocking",
         "user": user_id
     }
-    return await _safe_post(DIFY_AGENT_4_API_URL, payload, DIFY_AGENT_4_API_KEY)
\ No newline at end of file
+    return await _safe_post("agent_4", DIFY_AGENT_4_API_URL, payload, DIFY_AGENT_4_API_KEY)
\ No newline at end of file
@@ -1,5 +1,7 @@
 import os
-from github import Github, GithubException
+import time
+import asyncio
+from github import Auth, Github, GithubException
 from dotenv import load_dotenv
 from typing import Dict, Optional
 
@@ -8,14 +10,145 @@ load_dotenv()
 GITHUB_ACCESS_TOKEN = os.getenv("GITHUB_ACCESS_TOKEN")
 WEBHOOK_URL = os.getenv("WEBHOOK_URL")
 WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET")
+# Point at a local fake (utils/fake_github_api.py) to exercise provisioning offline
+GITHUB_API_URL = os.getenv("GITHUB_API_URL", "https://api.github.com")
+
+# Repos provisioned at once; each runs its PyGithub calls in a worker thread
+GITHUB_CONCURRENCY = int(os.getenv("GITHUB_CONCURRENCY", "4"))
+# GitHub's secondary limits allow ~80 content-creating requests a minute
+GITHUB_WRITES_PER_MINUTE = float(os.getenv("GITHUB_WRITES_PER_MINUTE", "60"))
+GITHUB_WRITE_BURST = int(os.getenv("GITHUB_WRITE_BURST", "10"))
+# Stop spending the primary (hourly) budget when this few requests remain
+GITHUB_MIN_REMAINING = int(os.getenv("GITHUB_MIN_REMAINING", "50"))
+GITHUB_MAX_RATE_LIMIT_RETRIES = int(os.getenv("GITHUB_MAX_RATE_LIMIT_RETRIES", "5"))
+
+# Writes made per member: create repo, add collaborator, create webhook
+WRITES_PER_REPO = 3
+
+# Throttling is done by GitHubRateLimiter, so PyGithub's own sleeps and
+# retries are off; pool_size lets worker threads share one client.
+g = Github(
+    auth=Auth.Token(GITHUB_ACCESS_TOKEN),
+    base_url=GITHUB_API_URL,
+    pool_size=GITHUB_CONCURRENCY,
+    retry=None,
+    seconds_between_requests=None,
+    seconds_between_writes=None,
+) if GITHUB_ACCESS_TOKEN else None
+_owner_login: Optional[str] = None
+
+
+class GitHubRateLimited(Exception):
+    """GitHub asked us to back off; `retry_after` is in seconds."""
+
+    def __init__(self, retry_after: float, message: str = ""):
+        super().__init__(message or f"GitHub rate limited; retry after {retry_after:.0f}s")
+        self.retry_after = retry_after
+
+
+class GitHubRateLimiter:
+    """
+    Token bucket for GitHub writes, refilled at GITHUB_WRITES_PER_MINUTE.
+
+    Response headers feed it: a Retry-After, or a primary budget at or
+    below GITHUB_MIN_REMAINING, pauses every caller until GitHub's stated
+    time instead of sleeping a fixed amount per request.
+    """
+
+    def __init__(self, per_minute: float, burst: int):
+        self.rate = per_minute / 60.0
+        self.capacity = float(burst)
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self.remaining: Optional[int] = None
+        self.limit: Optional[int] = None
+        self.counters = {"acquired": 0, "waited_seconds": 0.0, "pauses": 0}
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self, tokens: float = 1.0):
+        tokens = min(tokens, self.capacity)
+        started = time.monotonic()
+        # One waiter at a time keeps the bucket FIFO
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self.paused_until:
+                    await asyncio.sleep(self.paused_until - now)
+                    continue
+                self._refill()
+                if self.tokens >= tokens:
+                    self.tokens -= tokens
+                    break
+                await asyncio.sleep((tokens - self.tokens) / self.rate)
+        self.counters["acquired"] += 1
+        self.counters["waited_seconds"] += time.monotonic() - started
+
+    def pause(self, seconds: float):
+        until = time.monotonic() + max(0.0, seconds)
+        if until > self.paused_until:
+            self.paused_until = until
+            self.counters["pauses"] += 1
+            print(f"[GITHUB] Rate limited; pausing all provisioning for {seconds:.0f}s.")
+
+    def observe(self, remaining: Optional[int], limit: Optional[int], reset_at: Optional[float]):
+        """Records the primary rate limit from the latest response headers."""
+        if remaining is None or remaining < 0:
+            return
+        self.remaining, self.limit = remaining, limit
+        if remaining <= GITHUB_MIN_REMAINING and reset_at:
+            self.pause(reset_at - time.time())
+
+    def stats(self) -> Dict:
+        self._refill()
+        return {
+            "tokens": round(self.tokens, 2),
+            "paused_for_seconds": round(max(0.0, self.paused_until - time.monotonic()), 1),
+            "rate_limit_remaining": self.remaining,
+            "rate_limit": self.limit,
+            **{k: round(v, 1) if isinstance(v, float) else v for k, v in self.counters.items()},
+        }
+
+
+rate_limiter = GitHubRateLimiter(GITHUB_WRITES_PER_MINUTE, GITHUB_WRITE_BURST)
+
+
+def _retry_after(e: GithubException) -> Optional[float]:
+    """Seconds to wait if the exception is a primary or secondary rate limit."""
+    headers = {k.lower(): v for k, v in (e.headers or {}).items()}
+    if e.status not in (403, 429):
+        return None
+    if "retry-after" in headers:
+        return float(headers["retry-after"])
+    if headers.get("x-ratelimit-remaining") == "0" and "x-ratelimit-reset" in headers:
+        return max(0.0, float(headers["x-ratelimit-reset"]) - time.time())
+    if "rate limit" in str(e.data).lower():
+        return 60.0  # secondary limit without a hint: GitHub suggests waiting a minute
+    return None
+
+
+def _owner() -> str:
+    global _owner_login
+    if _owner_login is None:
+        _owner_login = g.get_user().login
+    return _owner_login
 
-g = Github(GITHUB_ACCESS_TOKEN) if GITHUB_ACCESS_TOKEN else None
 
 def create_challenge_repository_and_invite(
     challenge_id: str,
     user_id: str,
     collaborator_username: str
 ) -> Optional[Dict[str, str]]:
+    """
+    Creates (or reuses) the member's repo, invites them and ensures the webhook.
+    Blocking; safe to repeat. Raises GitHubRateLimited when GitHub says to back
+    off, and returns None on other GitHub errors.
+    """
     if not g or not WEBHOOK_URL or not WEBHOOK_SECRET:
         print("[ERROR] GitHub env vars TOKEN, URL, SECRET not configured.")
         return None
@@ -30,32 +163,66 @@ def create_challenge_repository_and_invite(
     events = ["push", "pull_request", "issues"]
 
     try:
-        auth_user = g.get_user()
-        repo = auth_user.create_repo(
-            name=repo_name,
-            private=True,
-            auto_init=True,
-            description=f"Dojo submission repo for challenge {challenge_id}"
-        )
-        print(f"✅ Created repo: {repo.full_name}")
+        try:
+            repo = g.get_user().create_repo(
+                name=repo_name,
+                private=True,
+                auto_init=True,
+                description=f"Dojo submission repo for challenge {challenge_id}"
+            )
+            print(f"✅ Created repo: {repo.full_name}")
+        except GithubException as e:
+            if e.status != 422 or "name already exists" not in str(e.data):
+                raise
+            print(f"[WARN] Repo exists: {repo_name}")
+            repo = g.get_repo(f"{_owner()}/{repo_name}")
+
         repo.add_to_collaborators(collaborator_username, permission="push")
         print(f"🧑‍💻 Added collaborator: {collaborator_username}")
 
-        repo.create_hook("web", config=config, events=events, active=True)
-        print(f"🔔 Webhook created on {repo.full_name}")
+        try:
+            repo.create_hook("web", config=config, events=events, active=True)
+            print(f"🔔 Webhook created on {repo.full_name}")
+        except GithubException as e:
+            if e.status != 422 or "already exists" not in str(e.data):
+                raise
+            print(f"🔔 Webhook already present on {repo.full_name}")
 
         return {"repo_name": repo.full_name, "clone_url": repo.clone_url}
 
     except GithubException as e:
-        if e.status == 422 and "name already exists" in str(e.data):
-            print(f"[WARN] Repo exists: {repo_name}")
-            try:
-                existing_repo = g.get_repo(f"{auth_user.login}/{repo_name}")
-                existing_repo.create_hook("web", config=config, events=events, active=True)
-                print(f"🔔 Webhook ensured on existing repo {existing_repo.full_name}")
-                return {"repo_name": existing_repo.full_name, "clone_url": existing_repo.clone_url}
-            except GithubException as get_e:
-                print(f"❌ Failed existing repo fetch: {get_e.data}")
-        else:
-            print(f"❌ GitHub API error: {e.data}")
+        retry_after = _retry_after(e)
+        if retry_after is not None:
+            raise GitHubRateLimited(retry_after, f"GitHub rate limit ({e.status}): {e.data}")
+        print(f"❌ GitHub API error: {e.data}")
         return None
+
+    finally:
+        if g is not None:
+            remaining, limit = g.requester.rate_limiting
+            rate_limiter.observe(remaining, limit, g.requester.rate_limiting_resettime)
+
+
+async def provision_challenge_repo(
+    challenge_id: str,
+    user_id: str,
+    collaborator_username: str
+) -> Optional[Dict[str, str]]:
+    """
+    create_challenge_repository_and_invite off the event loop, paced by the
+    shared rate limiter and retried after GitHub's back-off hints.
+    """
+    for attempt in range(GITHUB_MAX_RATE_LIMIT_RETRIES + 1):
+        await rate_limiter.acquire(WRITES_PER_REPO)
+        try:
+            return await asyncio.to_thread(
+                create_challenge_repository_and_invite, challenge_id, user_id, collaborator_username
+            )
+        except GitHubRateLimited as e:
+            if attempt == GITHUB_MAX_RATE_LIMIT_RETRIES:
+                raise
+            rate_limiter.pause(e.retry_after)
+
+
+def github_stats() -> Dict:
+    return {"concurrency": GITHUB_CONCURRENCY, "api_url": GITHUB_API_URL, **rate_limiter.stats()}
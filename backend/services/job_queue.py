@@ -0,0 +1,453 @@
+import os
+import random
+import asyncio
+import traceback
+from uuid import uuid4
+from datetime import datetime, timezone, timedelta
+from typing import Awaitable, Callable, Optional
+from elasticsearch import ApiError, ConflictError, NotFoundError, TransportError
+from search.connection import get_es
+
+JOB_INDEX = "jobs"
+
+JOB_INDEX_MAPPING = {
+    "queue": {"type": "keyword"},
+    "status": {"type": "keyword"},  # queued | running | dead | done
+    "payload": {"type": "object", "enabled": False},
+    "attempts": {"type": "integer"},
+    "max_attempts": {"type": "integer"},
+    "run_at": {"type": "date"},
+    "lease_expires_at": {"type": "date"},
+    "last_error": {"type": "text", "index": False},
+    "created_at": {"type": "date"},
+    "updated_at": {"type": "date"},
+}
+
+# Longest an idle worker waits between polls for jobs enqueued by other processes
+JOB_QUEUE_MAX_POLL_SECONDS = float(os.getenv("JOB_QUEUE_MAX_POLL_SECONDS", "10"))
+
+# Every queue registers itself here so /metrics/queues can report on it
+_registry: dict[str, "JobQueue"] = {}
+
+
+class PermanentJobError(Exception):
+    """Raised by a handler when retrying cannot help; the job is dead-lettered at once."""
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+class JobQueue:
+    """
+    Durable job queue stored in the Elasticsearch `jobs` index, drained by N
+    async workers per process.
+
+    A worker claims a job by moving it to `running` with an optimistic-concurrency
+    update (if_seq_no), which sets a lease. The lease is extended while the
+    handler runs; if the process dies the lease expires and another worker
+    re-claims the job. Failures are retried with exponential backoff and
+    dead-lettered (status `dead`) after max_attempts. Completed jobs are deleted.
+
+    Handlers receive the job payload and must be idempotent: a job can run more
+    than once if its lease is lost.
+
+    Idle workers poll every poll_interval, doubling up to max_poll_interval
+    while nothing is found; an enqueue in this process wakes them at once (or
+    when a delayed job falls due).
+
+    With a batch_handler, a worker claims up to batch_size jobs at once and
+    passes their payloads in one call; it returns one exception (or None for
+    success) per payload, and each job is retried or completed on its own.
+    keep_completed leaves finished jobs as status `done` (without their
+    payload), so their ids keep deduplicating later enqueues; with
+    completed_retention they are purged that many seconds after finishing.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        handler: Optional[Callable[[dict], Awaitable[None]]] = None,
+        workers: int = 4,
+        visibility_timeout: float = 300.0,
+        max_attempts: int = 5,
+        backoff_base: float = 5.0,
+        backoff_max: float = 600.0,
+        poll_interval: float = 1.0,
+        max_poll_interval: float = JOB_QUEUE_MAX_POLL_SECONDS,
+        permanent_errors: tuple[type[Exception], ...] = (),
+        on_dead_letter: Optional[Callable[[dict, str], Awaitable[None]]] = None,
+        batch_handler: Optional[Callable[[list[dict]], Awaitable[list[Optional[Exception]]]]] = None,
+        batch_size: int = 1,
+        keep_completed: bool = False,
+        completed_retention: Optional[float] = None,
+    ):
+        self.name = name
+        self.handler = handler
+        self.workers = workers
+        self.visibility_timeout = visibility_timeout
+        self.max_attempts = max_attempts
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.poll_interval = poll_interval
+        self.max_poll_interval = max(max_poll_interval, poll_interval)
+        self.permanent_errors = (PermanentJobError, *permanent_errors)
+        self.on_dead_letter = on_dead_letter
+        self.batch_handler = batch_handler
+        self.batch_size = batch_size if batch_handler else 1
+        self.keep_completed = keep_completed
+        self.completed_retention = completed_retention
+        self.counters = {"enqueued": 0, "completed": 0, "retried": 0, "dead_lettered": 0, "lost_leases": 0, "write_errors": 0, "purged": 0}
+        self._tasks: list[asyncio.Task] = []
+        self._sweeper: Optional[asyncio.Task] = None
+        self._stopping = asyncio.Event()
+        self._wake = asyncio.Event()
+        _registry[name] = self
+
+    # --- Producer side ---
+    async def enqueue(self, payload: dict, job_id: Optional[str] = None, delay: float = 0.0) -> str:
+        """
+        Persists a job and returns its id. Passing job_id makes enqueueing
+        idempotent: a second enqueue with the same id is a no-op.
+        """
+        job_id = job_id or str(uuid4())
+        if not await self.enqueue_once(payload, job_id, delay):
+            print(f"[QUEUE:{self.name}] Job {job_id} already enqueued.")
+        return job_id
+
+    async def enqueue_once(self, payload: dict, job_id: str, delay: float = 0.0) -> bool:
+        """Like enqueue with a job_id, but returns False if that id already exists."""
+        now = _now()
+        doc = {
+            "queue": self.name,
+            "status": "queued",
+            "payload": payload,
+            "attempts": 0,
+            "max_attempts": self.max_attempts,
+            "run_at": (now + timedelta(seconds=delay)).isoformat(),
+            "lease_expires_at": None,
+            "last_error": None,
+            "created_at": now.isoformat(),
+            "updated_at": now.isoformat(),
+        }
+        try:
+            await get_es().create(index=JOB_INDEX, id=job_id, document=doc)
+        except ConflictError:
+            return False
+        self.counters["enqueued"] += 1
+        if delay > 0:
+            asyncio.get_running_loop().call_later(delay, self._wake.set)
+        else:
+            self._wake.set()
+        return True
+
+    async def cancel(self, job_id: str) -> bool:
+        """Deletes a job that has not been claimed yet; returns False if it is running or gone."""
+        try:
+            res = await get_es().get(index=JOB_INDEX, id=job_id)
+            if res["_source"].get("status") != "queued":
+                return False
+            await get_es().delete(
+                index=JOB_INDEX, id=job_id,
+                if_seq_no=res["_seq_no"], if_primary_term=res["_primary_term"],
+            )
+        except (ConflictError, NotFoundError):
+            return False
+        return True
+
+    # --- Lifecycle ---
+    async def start(self):
+        es = get_es()
+        if not await es.indices.exists(index=JOB_INDEX):
+            try:
+                await es.indices.create(index=JOB_INDEX, mappings={"properties": JOB_INDEX_MAPPING})
+            except Exception as e:
+                # Another worker may have created it first
+                print(f"[QUEUE] Could not create '{JOB_INDEX}' index: {e}")
+        self._stopping.clear()
+        self._tasks = [asyncio.create_task(self._worker(i)) for i in range(self.workers)]
+        if self.keep_completed and self.completed_retention:
+            self._sweeper = asyncio.create_task(self._sweep_completed())
+        print(f"[QUEUE:{self.name}] Started {self.workers} workers.")
+
+    async def stop(self):
+        """Stops claiming new jobs; in-flight jobs are cancelled and their leases expire."""
+        self._stopping.set()
+        tasks = self._tasks + ([self._sweeper] if self._sweeper else [])
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._tasks, self._sweeper = [], None
+
+    def live_workers(self) -> int:
+        return sum(1 for task in self._tasks if not task.done())
+
+    # --- Retention ---
+    async def purge_completed(self) -> int:
+        """Deletes this queue's `done` jobs older than completed_retention; returns how many."""
+        cutoff = (_now() - timedelta(seconds=self.completed_retention)).isoformat()
+        res = await get_es().delete_by_query(
+            index=JOB_INDEX,
+            query={"bool": {"filter": [
+                {"term": {"queue": self.name}},
+                {"term": {"status": "done"}},
+                {"range": {"updated_at": {"lt": cutoff}}},
+            ]}},
+            conflicts="proceed",  # another process may be sweeping too
+        )
+        deleted = res.get("deleted", 0)
+        self.counters["purged"] += deleted
+        return deleted
+
+    async def _sweep_completed(self):
+        interval = min(self.completed_retention, 3600)
+        while not self._stopping.is_set():
+            try:
+                deleted = await self.purge_completed()
+                if deleted:
+                    print(f"[QUEUE:{self.name}] Purged {deleted} completed jobs.")
+            except Exception as e:
+                print(f"[QUEUE:{self.name}] Purge of completed jobs failed: {e}")
+            try:
+                await asyncio.wait_for(self._stopping.wait(), timeout=interval)
+            except asyncio.TimeoutError:
+                pass
+
+    # --- Worker side ---
+    async def _idle(self, delay: float) -> bool:
+        """Sleeps up to `delay`; returns True if woken early by an enqueue."""
+        try:
+            await asyncio.wait_for(self._wake.wait(), timeout=delay)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+    async def _worker(self, n: int):
+        idle = self.poll_interval
+        while not self._stopping.is_set():
+            self._wake.clear()
+            try:
+                jobs = await self._claim(self.batch_size)
+            except Exception as e:
+                print(f"[QUEUE:{self.name}] Claim failed: {e}")
+                jobs = []
+            if not jobs:
+                # After a wake-up poll again soon: the new job may not be searchable yet
+                woken = await self._idle(idle)
+                idle = self.poll_interval if woken else min(idle * 2, self.max_poll_interval)
+                continue
+            idle = self.poll_interval
+            try:
+                await self._run(jobs)
+            except Exception as e:
+                # Unsettled jobs keep their lease and are re-claimed once it expires
+                print(f"[QUEUE:{self.name}] Worker {n} failed running {len(jobs)} job(s): {e}")
+                await asyncio.sleep(self.poll_interval)
+
+    async def _claim(self, limit: int = 1) -> list[dict]:
+        query = {
+            "bool": {
+                "filter": [{"term": {"queue": self.name}}],
+                "should": [
+                    {"bool": {"filter": [
+                        {"term": {"status": "queued"}},
+                        {"range": {"run_at": {"lte": "now"}}},
+                    ]}},
+                    # Running jobs whose worker stopped renewing the lease
+                    {"bool": {"filter": [
+                        {"term": {"status": "running"}},
+                        {"range": {"lease_expires_at": {"lte": "now"}}},
+                    ]}},
+                ],
+                "minimum_should_match": 1,
+            }
+        }
+        res = await get_es().search(
+            index=JOB_INDEX, query=query, size=max(10, limit * 2),
+            sort=[{"run_at": "asc"}], seq_no_primary_term=True,
+        )
+        hits = res["hits"]["hits"]
+        random.shuffle(hits)  # spread workers across candidates to cut conflicts
+
+        claimed = []
+        for hit in hits:
+            if len(claimed) == limit:
+                break
+            src = hit["_source"]
+            attempts = src.get("attempts", 0) + 1
+            now = _now()
+            update = {
+                "status": "running",
+                "attempts": attempts,
+                "lease_expires_at": (now + timedelta(seconds=self.visibility_timeout)).isoformat(),
+                "updated_at": now.isoformat(),
+            }
+            try:
+                res = await get_es().update(
+                    index=JOB_INDEX, id=hit["_id"], doc=update,
+                    if_seq_no=hit["_seq_no"], if_primary_term=hit["_primary_term"],
+                )
+            except (ConflictError, NotFoundError):
+                continue  # another worker got it first
+            claimed.append({
+                **src, **update,
+                "id": hit["_id"],
+                "_seq_no": res["_seq_no"],
+                "_primary_term": res["_primary_term"],
+                "_lock": asyncio.Lock(),
+            })
+        return claimed
+
+    async def _run(self, jobs: list[dict]):
+        runnable = []
+        for job in jobs:
+            if job["attempts"] > job.get("max_attempts", self.max_attempts):
+                # Lease expired on the final attempt (e.g. the worker crashed)
+                await self._dead_letter(job, job.get("last_error") or "Lease expired on final attempt")
+            else:
+                runnable.append(job)
+        if not runnable:
+            return
+
+        done = asyncio.Event()
+        heartbeats = [asyncio.create_task(self._heartbeat(job, done)) for job in runnable]
+        try:
+            try:
+                if self.batch_handler:
+                    errors = await self.batch_handler([job["payload"] for job in runnable])
+                else:
+                    await self.handler(runnable[0]["payload"])
+                    errors = [None]
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                errors = [e] * len(runnable)
+            for job, error in zip(runnable, errors):
+                await self._settle(job, error)
+        finally:
+            done.set()
+            await asyncio.gather(*heartbeats, return_exceptions=True)
+
+    async def _settle(self, job: dict, error: Optional[Exception]):
+        if error is None:
+            await self._complete(job)
+        elif isinstance(error, self.permanent_errors):
+            await self._dead_letter(job, f"{type(error).__name__}: {error}")
+        else:
+            print(f"[QUEUE:{self.name}] Job {job['id']} failed (attempt {job['attempts']}): {error}")
+            print("".join(traceback.format_exception(type(error), error, error.__traceback__)))
+            if job["attempts"] >= job.get("max_attempts", self.max_attempts):
+                await self._dead_letter(job, f"{type(error).__name__}: {error}")
+            else:
+                await self._retry(job, f"{type(error).__name__}: {error}")
+
+    async def _heartbeat(self, job: dict, done: asyncio.Event):
+        """Extends the lease every third of the visibility timeout until done."""
+        while True:
+            try:
+                await asyncio.wait_for(done.wait(), timeout=self.visibility_timeout / 3)
+                return
+            except asyncio.TimeoutError:
+                pass
+            lease = (_now() + timedelta(seconds=self.visibility_timeout)).isoformat()
+            if await self._write(job, {"lease_expires_at": lease}) is False:
+                return  # lease lost; on an ES error (None) try again next beat
+
+    async def _write(self, job: dict, doc: dict, delete: bool = False) -> Optional[bool]:
+        """
+        Updates (or deletes) the job only if we still hold its lease. Returns
+        False if the lease was lost and None if Elasticsearch failed; in
+        either case the job is left to be re-claimed when its lease expires.
+        """
+        async with job["_lock"]:
+            try:
+                if delete:
+                    await get_es().delete(
+                        index=JOB_INDEX, id=job["id"],
+                        if_seq_no=job["_seq_no"], if_primary_term=job["_primary_term"],
+                    )
+                    return True
+                res = await get_es().update(
+                    index=JOB_INDEX, id=job["id"], doc={**doc, "updated_at": _now().isoformat()},
+                    if_seq_no=job["_seq_no"], if_primary_term=job["_primary_term"],
+                )
+                job["_seq_no"], job["_primary_term"] = res["_seq_no"], res["_primary_term"]
+                return True
+            except (ConflictError, NotFoundError):
+                self.counters["lost_leases"] += 1
+                print(f"[QUEUE:{self.name}] Lost lease on job {job['id']}; another worker owns it now.")
+                return False
+            except (ApiError, TransportError) as e:
+                self.counters["write_errors"] += 1
+                print(f"[QUEUE:{self.name}] Could not update job {job['id']}: {e}")
+                return None
+
+    async def _complete(self, job: dict):
+        if self.keep_completed:
+            # Only the id is needed to deduplicate, so the payload is dropped
+            written = await self._write(job, {"status": "done", "payload": None, "lease_expires_at": None, "last_error": None})
+        else:
+            written = await self._write(job, {}, delete=True)
+        if written:
+            self.counters["completed"] += 1
+
+    async def _retry(self, job: dict, error: str):
+        delay = min(self.backoff_max, self.backoff_base * 2 ** (job["attempts"] - 1))
+        delay *= random.uniform(0.8, 1.2)
+        run_at = (_now() + timedelta(seconds=delay)).isoformat()
+        if await self._write(job, {"status": "queued", "run_at": run_at, "lease_expires_at": None, "last_error": error}):
+            self.counters["retried"] += 1
+            print(f"[QUEUE:{self.name}] Job {job['id']} retrying in {delay:.0f}s.")
+
+    async def _dead_letter(self, job: dict, error: str):
+        if not await self._write(job, {"status": "dead", "lease_expires_at": None, "last_error": error}):
+            return
+        self.counters["dead_lettered"] += 1
+        print(f"[QUEUE:{self.name}] ❌ Job {job['id']} dead-lettered: {error}")
+        if self.on_dead_letter:
+            try:
+                await self.on_dead_letter(job["payload"], error)
+            except Exception as e:
+                print(f"[QUEUE:{self.name}] Dead-letter callback failed for {job['id']}: {e}")
+
+    # --- Metrics ---
+    async def stats(self) -> dict:
+        res = await get_es().search(
+            index=JOB_INDEX, size=0,
+            query={"term": {"queue": self.name}},
+            aggs={
+                "status": {"terms": {"field": "status"}},
+                "queued": {
+                    # Due jobs only, aged from run_at: a delayed job is not late until then
+                    "filter": {"bool": {"filter": [
+                        {"term": {"status": "queued"}},
+                        {"range": {"run_at": {"lte": "now"}}},
+                    ]}},
+                    "aggs": {"oldest": {"min": {"field": "run_at"}}},
+                },
+            },
+        )
+        aggs = res["aggregations"]
+        by_status = {bucket["key"]: bucket["doc_count"] for bucket in aggs["status"]["buckets"]}
+        oldest_ms = aggs["queued"]["oldest"]["value"]
+        oldest_age = _now().timestamp() - oldest_ms / 1000 if oldest_ms else 0.0
+        return {
+            "workers": self.live_workers(),
+            "depth": by_status.get("queued", 0),
+            "running": by_status.get("running", 0),
+            "dead": by_status.get("dead", 0),
+            "done": by_status.get("done", 0),
+            "oldest_queued_age_seconds": round(oldest_age, 1),
+            **self.counters,
+        }
+
+
+async def queue_stats() -> dict:
+    """Stats for every registered queue, keyed by queue name."""
+    stats = {}
+    for name, queue in _registry.items():
+        try:
+            stats[name] = await queue.stats()
+        except NotFoundError:
+            stats[name] = {"workers": queue.live_workers(), **queue.counters}
+    return stats
@@ -1,10 +1,13 @@
 import os
+import time
+import hashlib
 from datetime import datetime, timedelta
 from jose import jwt, JWTError
 from dotenv import load_dotenv
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 from schemas.schemas import TokenData
+from utils.cache import TTLCache
 # DO NOT import from manager.auth_manager at the top level to avoid circular imports.
 
 load_dotenv()
@@ -14,6 +17,16 @@ ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 60
 REFRESH_TOKEN_EXPIRE_MINUTES = 60 * 24 * 7  # 7 days
 
+# Caches for the authenticated-request path. Entries are dropped explicitly
+# when a user is updated or deleted; the TTLs bound staleness across workers.
+USER_CACHE_TTL_SECONDS = float(os.getenv("USER_CACHE_TTL_SECONDS", "30"))
+TOKEN_CACHE_TTL_SECONDS = float(os.getenv("TOKEN_CACHE_TTL_SECONDS", "300"))
+user_cache = TTLCache("auth_users", maxsize=10000, ttl=USER_CACHE_TTL_SECONDS)
+token_cache = TTLCache("auth_tokens", maxsize=10000, ttl=TOKEN_CACHE_TTL_SECONDS)
+
+# User ids allowed to call admin endpoints (bulk exports), comma-separated
+ADMIN_USER_IDS = {uid.strip() for uid in os.getenv("ADMIN_USER_IDS", "").split(",") if uid.strip()}
+
 # Used by Swagger UI's "Authorize" button
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/auth/login")
 
@@ -36,15 +49,32 @@ def create_refresh_token(user_id: str, email: str) -> str:
     )
 
 def decode_token(token: str) -> TokenData | None:
+    token_key = hashlib.sha256(token.encode()).hexdigest()
+    cached = token_cache.get(token_key)
+    if cached is not None:
+        return cached
+
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        return TokenData(
-            user_id=payload.get("user_id"),
-            email=payload.get("email"),
-        )
     except JWTError:
         return None
 
+    token_data = TokenData(
+        user_id=payload.get("user_id"),
+        email=payload.get("email"),
+    )
+    # Never keep a token cached past its own expiry
+    exp = payload.get("exp")
+    ttl = min(TOKEN_CACHE_TTL_SECONDS, exp - time.time()) if exp else TOKEN_CACHE_TTL_SECONDS
+    if ttl > 0:
+        token_cache.set(token_key, token_data, ttl=ttl)
+    return token_data
+
+def invalidate_user_cache(user_id: str):
+    """Drops the cached user and decoded tokens for user_id. Call on any user write."""
+    user_cache.invalidate(user_id)
+    token_cache.invalidate_where(lambda _, token_data: token_data.user_id == user_id)
+
 async def get_current_user(token: str = Depends(oauth2_scheme)):
     """
     Decodes the JWT token, validates it, and fetches the current user.
@@ -62,11 +92,21 @@ async def get_current_user(token: str = Depends(oauth2_scheme)):
     if not token_data or not token_data.email:
         raise credentials_exception
 
-    user = await get_user_by_email(token_data.email)
-    if not user:
-        raise credentials_exception
+    # Cached by user_id; the email check guards against a token/user mismatch
+    user = user_cache.get(token_data.user_id) if token_data.user_id else None
+    if user is None or user.get("email") != token_data.email:
+        user = await get_user_by_email(token_data.email)
+        if not user:
+            raise credentials_exception
+        user_cache.set(user["id"], user)
 
     # --- FIX: Return the entire user document from the manager ---
     # This ensures that other parts of the app (like api/challenges.py)
     # can access the user's "id" with the correct key.
-    return user
\ No newline at end of file
+    return dict(user)
+
+async def get_admin_user(user=Depends(get_current_user)):
+    """Like get_current_user, but only for users listed in ADMIN_USER_IDS."""
+    if user.get("id") not in ADMIN_USER_IDS:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Admin access required")
+    return user
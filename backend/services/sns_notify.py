@@ -1,29 +1,70 @@
 import os
+import asyncio
 import boto3
 from dotenv import load_dotenv
 from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+from services.job_queue import JobQueue, PermanentJobError
+from utils.cache import TTLCache
 
 load_dotenv()
 
-# Initialize the Boto3 SNS client using credentials from environment variables
+# Initialize the Boto3 SNS client using credentials from environment variables.
+# SNS_ENDPOINT_URL points it at a local stand-in (moto_server, LocalStack).
 sns = boto3.client(
     "sns",
     region_name=os.getenv("AWS_REGION"),
     aws_access_key_id=os.getenv("AWS_ACCESS_KEY_ID"),
     aws_secret_access_key=os.getenv("AWS_SECRET_ACCESS_KEY"),
+    endpoint_url=os.getenv("SNS_ENDPOINT_URL") or None,
 )
 
 SNS_TOPIC_ARN = os.getenv("SNS_TOPIC_ARN")
 
+# PublishBatch accepts at most 10 entries per call
+SNS_BATCH_SIZE = 10
+SNS_OUTBOX_WORKERS = int(os.getenv("SNS_OUTBOX_WORKERS", "1"))
+SNS_OUTBOX_MAX_ATTEMPTS = int(os.getenv("SNS_OUTBOX_MAX_ATTEMPTS", "6"))
+# How long sent notifications keep deduplicating before they are purged
+SNS_OUTBOX_RETENTION_SECONDS = float(os.getenv("SNS_OUTBOX_RETENTION_SECONDS", str(7 * 24 * 3600)))
+SNS_SUBSCRIPTION_CACHE_TTL = float(os.getenv("SNS_SUBSCRIPTION_CACHE_TTL", "600"))
+
+# Topic ARN -> set of subscribed email endpoints (lower-cased)
+_subscriptions = TTLCache("sns_subscriptions", maxsize=4, ttl=SNS_SUBSCRIPTION_CACHE_TTL)
+_subscriptions_lock = asyncio.Lock()
+
+
+def _list_subscribed_emails(topic_arn: str) -> set[str]:
+    """Every email endpoint on the topic, following NextToken through all pages."""
+    emails = set()
+    paginator = sns.get_paginator("list_subscriptions_by_topic")
+    for page in paginator.paginate(TopicArn=topic_arn):
+        for sub in page.get("Subscriptions", []):
+            if sub["Protocol"] == "email":
+                emails.add(sub["Endpoint"].lower())
+    return emails
+
+
+async def _subscribed_emails() -> set[str]:
+    emails = _subscriptions.get(SNS_TOPIC_ARN)
+    if emails is not None:
+        return emails
+    async with _subscriptions_lock:  # one listing at a time, however many callers miss
+        emails = _subscriptions.get(SNS_TOPIC_ARN)
+        if emails is None:
+            emails = await asyncio.to_thread(_list_subscribed_emails, SNS_TOPIC_ARN)
+            _subscriptions.set(SNS_TOPIC_ARN, emails)
+            print(f"[SNS] Cached {len(emails)} topic subscriptions.")
+    return emails
+
 
 # ✅ Check if email is already subscribed
-def is_email_subscribed(email: str) -> bool:
-    try:
-        response = sns.list_subscriptions_by_topic(TopicArn=SNS_TOPIC_ARN)
-        for sub in response.get("Subscriptions", []):
-            if sub["Protocol"] == "email" and sub["Endpoint"] == email:
-                return True
+async def is_email_subscribed(email: str) -> bool:
+    """Answered from the cached subscription set, refreshed every SNS_SUBSCRIPTION_CACHE_TTL."""
+    if not SNS_TOPIC_ARN:
         return False
+    try:
+        return email.lower() in await _subscribed_emails()
     except Exception as e:
         print(f"[SNS ERROR] Failed to check subscriptions: {e}")
         return False
@@ -31,41 +72,31 @@ def is_email_subscribed(email: str) -> bool:
 
 # ✅ Subscribe user to SNS topic
 def subscribe_user_to_topic(email: str):
-    if not SNS_TOPIC_ARN:
-        print("[SNS ERROR] SNS_TOPIC_ARN is not configured in .env file.")
-        return None
-    try:
-        print(f"[SNS] Subscribing {email} to SNS topic...")
-        response = sns.subscribe(
-            TopicArn=SNS_TOPIC_ARN,
-            Protocol="email",
-            Endpoint=email,
-            ReturnSubscriptionArn=False  # They need to confirm manually
-        )
-        print(f"[SNS] Subscription request sent to {email}")
-        return response
-    except Exception as e:
-        print(f"[SNS ERROR] Could not subscribe {email}: {e}")
-        return None
+    """Blocking; raises on SNS errors so the outbox can retry."""
+    print(f"[SNS] Subscribing {email} to SNS topic...")
+    response = sns.subscribe(
+        TopicArn=SNS_TOPIC_ARN,
+        Protocol="email",
+        Endpoint=email,
+        ReturnSubscriptionArn=False  # They need to confirm manually
+    )
+    print(f"[SNS] Subscription request sent to {email}")
+    return response
 
 
 # 🔔 Challenge repo notification
-def notify_member_of_new_repo(
+def build_repo_notification(
     email: str,
     challenge_title: str,
     repo_name: str,
     clone_url: str | None,
     api_description: str | None = None  # ← Added optional param
-):
+) -> tuple[str, str]:
     """
-    Sends a personalized email to a single user about their challenge.
+    Builds the (subject, message) of a personalized email about a challenge.
     The message content changes based on whether the repo was created successfully.
     Also includes API list if provided.
     """
-    if not SNS_TOPIC_ARN:
-        print("[SNS ERROR] SNS_TOPIC_ARN is not configured in .env file.")
-        return None
-
     deadline = (datetime.utcnow() + timedelta(hours=8)).strftime('%Y-%m-%d %H:%M UTC')
 
     # ✅ FIX: Subject must be ASCII and max 100 characters
@@ -104,15 +135,129 @@ Good luck!
 - The Dojo Team
 """
 
-    try:
-        print(f"[SNS] Sending personalized repo notification to topic for user {email}")
-        response = sns.publish(
-            TopicArn=SNS_TOPIC_ARN,
-            Subject=subject,
-            Message=message
-        )
-        print(f"[SNS Success] Sent notification regarding repo {repo_name}.")
-        return response
-    except Exception as e:
-        print(f"[SNS ERROR] Could not send personalized notification: {e}")
-        return None
+    return subject, message
+
+
+def publish_batch(entries: List[Dict]) -> List[Optional[Exception]]:
+    """
+    Publishes up to SNS_BATCH_SIZE {subject, message, dedupe_key} entries in
+    one PublishBatch call. Blocking; returns one error (or None) per entry.
+    """
+    fifo = SNS_TOPIC_ARN.endswith(".fifo")
+    request = []
+    for i, entry in enumerate(entries):
+        item = {"Id": str(i), "Subject": entry["subject"], "Message": entry["message"]}
+        if fifo:
+            item.update(MessageDeduplicationId=entry["dedupe_key"][:128], MessageGroupId="notifications")
+        request.append(item)
+
+    response = sns.publish_batch(TopicArn=SNS_TOPIC_ARN, PublishBatchRequestEntries=request)
+    errors: List[Optional[Exception]] = [None] * len(entries)
+    for failed in response.get("Failed", []):
+        error_cls = PermanentJobError if failed.get("SenderFault") else RuntimeError
+        errors[int(failed["Id"])] = error_cls(f"{failed.get('Code')}: {failed.get('Message')}")
+    return errors
+
+
+# --- Outbox ---
+async def _subscribe(email: str):
+    if await is_email_subscribed(email):
+        print(f"[SNS] {email} is already subscribed.")
+        return
+    await asyncio.to_thread(subscribe_user_to_topic, email)
+    emails = _subscriptions.get(SNS_TOPIC_ARN)
+    if emails is not None:
+        emails.add(email.lower())
+
+
+async def send_notification_batch(payloads: List[Dict]) -> List[Optional[Exception]]:
+    """
+    Outbox batch handler: repo notifications go out in one PublishBatch call,
+    subscriptions one by one (SNS has no batch subscribe).
+    """
+    errors: List[Optional[Exception]] = [None] * len(payloads)
+    publish = [i for i, p in enumerate(payloads) if p["kind"] == "publish"]
+    if publish:
+        try:
+            results = await asyncio.to_thread(publish_batch, [payloads[i] for i in publish])
+        except Exception as e:
+            results = [e] * len(publish)
+        for i, error in zip(publish, results):
+            errors[i] = error
+        sent = len(publish) - sum(1 for error in results if error)
+        print(f"[SNS] Published {sent}/{len(publish)} notifications in one batch.")
+
+    for i, payload in enumerate(payloads):
+        if payload["kind"] == "subscribe":
+            try:
+                await _subscribe(payload["email"])
+            except Exception as e:
+                errors[i] = e
+    return errors
+
+
+async def _log_dead_notification(payload: Dict, error: str):
+    print(f"[SNS ERROR] Gave up on {payload['kind']} ({payload.get('dedupe_key')}): {error}")
+    if payload["kind"] == "publish" and payload.get("challenge_id"):
+        # Imported here: repo provisioning imports this module
+        from manager.repo_provisioning import mark_notification_failed
+        await mark_notification_failed(payload["challenge_id"], payload["user_id"], payload.get("attempt", 1), error)
+
+
+notification_queue = JobQueue(
+    "notifications",
+    batch_handler=send_notification_batch,
+    batch_size=SNS_BATCH_SIZE,
+    workers=SNS_OUTBOX_WORKERS,
+    visibility_timeout=60,
+    max_attempts=SNS_OUTBOX_MAX_ATTEMPTS,
+    backoff_base=10,
+    keep_completed=True,  # the job id is the dedupe key, so finished jobs stay
+    completed_retention=SNS_OUTBOX_RETENTION_SECONDS,
+    on_dead_letter=_log_dead_notification,
+)
+
+
+async def _enqueue_notification(payload: Dict) -> bool:
+    if not SNS_TOPIC_ARN:
+        print("[SNS ERROR] SNS_TOPIC_ARN is not configured in .env file.")
+        return False
+    await notification_queue.enqueue(payload, job_id=f"sns:{payload['dedupe_key']}")
+    return True
+
+
+async def queue_repo_notification(
+    challenge_id: str,
+    user_id: str,
+    email: str,
+    challenge_title: str,
+    repo_name: str,
+    clone_url: str | None,
+    api_description: str | None = None,
+    attempt: int = 1
+) -> bool:
+    """
+    Durably queues the repo email for the outbox; returns False if SNS is not
+    configured. Queueing the same (challenge, user, provisioning attempt)
+    twice sends one email. If the outbox gives up, the member's provisioning
+    result is marked unnotified again.
+    """
+    subject, message = build_repo_notification(email, challenge_title, repo_name, clone_url, api_description)
+    return await _enqueue_notification({
+        "kind": "publish",
+        "dedupe_key": f"repo:{challenge_id}:{user_id}:{attempt}",
+        "challenge_id": challenge_id,
+        "user_id": user_id,
+        "attempt": attempt,
+        "subject": subject,
+        "message": message,
+    })
+
+
+async def queue_subscription(email: str) -> bool:
+    """Durably queues a topic subscription for the email."""
+    return await _enqueue_notification({
+        "kind": "subscribe",
+        "dedupe_key": f"subscribe:{email.lower()}",
+        "email": email,
+    })
@@ -0,0 +1,44 @@
+"""
+Copies each document's _id into its `id` field where it is missing, in the
+groups, challenges and submissions indices. Paged lists tiebreak on
+id.keyword, so older documents without `id` can otherwise be skipped or
+repeated between pages.
+
+Run once after deploying cursor-paginated lists:
+
+    python -m utils.backfill_doc_ids
+
+Safe to re-run: only documents without an `id` are touched.
+"""
+import asyncio
+from search.connection import get_es, close_es
+
+INDICES = ["groups", "challenges", "submissions"]
+
+
+async def backfill_doc_ids():
+    es = get_es()
+    for index in INDICES:
+        if not await es.indices.exists(index=index):
+            print(f"[SKIP] Index does not exist: {index}")
+            continue
+        res = await es.update_by_query(
+            index=index,
+            query={"bool": {"must_not": [{"exists": {"field": "id"}}]}},
+            script={"source": "ctx._source.id = ctx._id", "lang": "painless"},
+            conflicts="proceed",
+            refresh=True,
+        )
+        for failure in res.get("failures", []):
+            print(f"[ERROR] {index}: {failure}")
+        print(f"[OK] {index}: set id on {res.get('updated', 0)} documents.")
+
+
+async def main():
+    try:
+        await backfill_doc_ids()
+    finally:
+        await close_es()
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,80 @@
+"""
+Builds the submission_summaries index from existing submissions.
+
+Run once after deploying per-(challenge, user) summaries, ideally while no
+evaluations are running:
+
+    python -m utils.backfill_submission_summaries
+
+Safe to re-run: each summary is rebuilt from scratch and overwritten.
+"""
+import asyncio
+from elasticsearch.helpers import async_scan, async_streaming_bulk
+from search.connection import get_es, close_es
+from manager.submission_manager import (
+    SUBMISSION_INDEX,
+    SUMMARY_INDEX,
+    SUMMARY_INDEX_MAPPING,
+    RECENT_FEEDBACK_SIZE,
+    summary_id,
+)
+from utils.init_indices import create_index
+
+SOURCE_FIELDS = ["challenge_id", "user_id", "status", "score", "commit_hash", "processed_at"]
+
+
+async def _collect_summaries() -> dict:
+    # (challenge_id, user_id) -> finished submissions
+    finished: dict[tuple[str, str], list[dict]] = {}
+    query = {"query": {"terms": {"status": ["completed", "error"]}}}
+    async for hit in async_scan(get_es(), index=SUBMISSION_INDEX, query=query, _source=SOURCE_FIELDS):
+        src = hit["_source"]
+        if not src.get("challenge_id") or not src.get("user_id"):
+            continue
+        finished.setdefault((src["challenge_id"], src["user_id"]), []).append({**src, "id": hit["_id"]})
+
+    summaries = {}
+    for (challenge_id, user_id), subs in finished.items():
+        subs.sort(key=lambda s: s.get("processed_at") or "")
+        completed = [s for s in subs if s["status"] == "completed"]
+        last = subs[-1]
+        summaries[summary_id(challenge_id, user_id)] = {
+            "challenge_id": challenge_id,
+            "user_id": user_id,
+            "attempts": len(subs),
+            "completed": len(completed),
+            "best_score": max((s.get("score") or 0.0 for s in completed), default=None),
+            "last_status": last["status"],
+            "last_score": completed[-1].get("score") if completed else None,
+            "last_submission_id": last["id"],
+            "last_commit": last.get("commit_hash"),
+            "last_processed_at": last.get("processed_at"),
+            "last_completed_at": completed[-1].get("processed_at") if completed else None,
+            "recent_feedback": [s["id"] for s in reversed(completed[-RECENT_FEEDBACK_SIZE:])],
+        }
+    return summaries
+
+
+async def backfill_submission_summaries():
+    await create_index(SUMMARY_INDEX, SUMMARY_INDEX_MAPPING)
+    summaries = await _collect_summaries()
+
+    actions = ({"_index": SUMMARY_INDEX, "_id": doc_id, "_source": doc} for doc_id, doc in summaries.items())
+    written = 0
+    async for ok, item in async_streaming_bulk(get_es(), actions, raise_on_error=False):
+        if ok:
+            written += 1
+        else:
+            print(f"[ERROR] {item['index']['_id']}: {item['index'].get('error')}")
+
+    print(f"[OK] Wrote {written} submission summaries.")
+
+
+async def main():
+    try:
+        await backfill_submission_summaries()
+    finally:
+        await close_es()
+
+if __name__ == "__main__":
+    asyncio.run(main())
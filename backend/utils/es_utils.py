@@ -1,24 +1,35 @@
 import os
 from typing import Dict, List, Optional
-from elasticsearch import AsyncElasticsearch, NotFoundError
+from elasticsearch import NotFoundError
 from elasticsearch.exceptions import RequestError
-from dotenv import load_dotenv
-
-load_dotenv()
+from search.connection import get_es
+from manager.leaderboard_engine import leaderboard_engine
+from manager.evaluation_cache import invalidate_challenge_evaluations
+from utils.cache import TTLCache
 
 # --- Configuration ---
-ES_HOST = os.getenv("ES_HOST", "http://localhost:9200")
 CHALLENGE_INDEX = "challenges"
+BREAKDOWN_INDEX = "breakdowns"
+TESTCASE_INDEX = "testcases"
 SUBMISSION_INDEX = "submissions"
 LEADERBOARD_INDEX = "leaderboard"
 
-# --- Elasticsearch Client Initialization ---
-es = AsyncElasticsearch(ES_HOST)
+# Challenge metadata never changes after creation, so the scoring path reads
+# it from here instead of doing an ES get per submission.
+CHALLENGE_META_FIELDS = ["group_id", "difficulty", "created_by"]
+challenge_meta_cache = TTLCache(
+    "challenge_meta",
+    maxsize=int(os.getenv("CHALLENGE_CACHE_SIZE", "10000")),
+    ttl=float(os.getenv("CHALLENGE_CACHE_TTL", "3600")),
+)
 
+# Deepest rank the global leaderboard can page to (bounded by search.max_buckets)
+MAX_LEADERBOARD_DEPTH = 10000
 
 # --- Index Initialization ---
 async def init_indices():
     """Ensures all indices exist with proper mappings."""
+    es = get_es()
     # Leaderboard index with explicit mapping
     if not await es.indices.exists(index=LEADERBOARD_INDEX):
         await es.indices.create(
@@ -41,15 +52,105 @@ async def init_indices():
 async def save_challenge(challenge: Dict) -> str:
     """Saves a challenge document to Elasticsearch."""
     challenge_id = challenge["id"]
-    res = await es.index(index=CHALLENGE_INDEX, id=challenge_id, document=challenge)
+    res = await get_es().index(index=CHALLENGE_INDEX, id=challenge_id, document=challenge)
     print("Challenge save response:", res)
+    challenge_meta_cache.set(challenge_id, {field: challenge.get(field) for field in CHALLENGE_META_FIELDS})
     return res["_id"]
 
 
+async def save_generated_challenge(challenge: Dict, breakdown: str, testcases: str):
+    """
+    Writes a freshly generated challenge, its breakdown and its test cases in
+    one _bulk request. Raises RuntimeError if any of the three writes failed.
+    """
+    challenge_id = challenge["id"]
+    operations = [
+        {"index": {"_index": CHALLENGE_INDEX, "_id": challenge_id}}, challenge,
+        {"index": {"_index": BREAKDOWN_INDEX, "_id": challenge_id}}, {"challenge_id": challenge_id, "breakdown": breakdown},
+        {"index": {"_index": TESTCASE_INDEX, "_id": challenge_id}}, {"challenge_id": challenge_id, "testcases": testcases},
+    ]
+    await _bulk_challenge(challenge_id, operations)
+    challenge_meta_cache.set(challenge_id, {field: challenge.get(field) for field in CHALLENGE_META_FIELDS})
+    invalidate_challenge_evaluations(challenge_id)
+
+
+async def finish_generated_challenge(challenge_id: str, fields: Dict, breakdown: str, testcases: str):
+    """
+    Completes a live generation in one _bulk request: updates the existing
+    challenge with `fields` and writes its breakdown and test cases. Raises
+    RuntimeError if any of the three writes failed.
+    """
+    operations = [
+        {"update": {"_index": CHALLENGE_INDEX, "_id": challenge_id, "retry_on_conflict": 5}}, {"doc": fields},
+        {"index": {"_index": BREAKDOWN_INDEX, "_id": challenge_id}}, {"challenge_id": challenge_id, "breakdown": breakdown},
+        {"index": {"_index": TESTCASE_INDEX, "_id": challenge_id}}, {"challenge_id": challenge_id, "testcases": testcases},
+    ]
+    await _bulk_challenge(challenge_id, operations)
+    invalidate_challenge_evaluations(challenge_id)
+
+
+async def _bulk_challenge(challenge_id: str, operations: list):
+    res = await get_es().bulk(operations=operations)
+    if res["errors"]:
+        failed = [
+            f"{result['_index']}: {result.get('error')}"
+            for item in res["items"] for result in item.values() if result.get("error")
+        ]
+        raise RuntimeError(f"Failed to save challenge {challenge_id}: {failed}")
+
+
+async def get_challenge_meta(challenge_id: str) -> Dict | None:
+    """
+    Returns a challenge's group_id, difficulty and created_by, served from
+    challenge_meta_cache after the first read.
+    """
+    meta = challenge_meta_cache.get(challenge_id)
+    if meta is not None:
+        return meta
+    try:
+        res = await get_es().get(index=CHALLENGE_INDEX, id=challenge_id, source_includes=CHALLENGE_META_FIELDS)
+    except NotFoundError:
+        return None
+    source = res.get("_source", {})
+    meta = {field: source.get(field) for field in CHALLENGE_META_FIELDS}
+    challenge_meta_cache.set(challenge_id, meta)
+    return meta
+
+
+async def delete_challenge(challenge_id: str) -> bool:
+    """
+    Deletes a challenge with its breakdown and test cases.
+    Returns False if the challenge does not exist.
+    """
+    challenge_meta_cache.invalidate(challenge_id)
+    invalidate_challenge_evaluations(challenge_id)
+    es = get_es()
+    try:
+        try:
+            await es.delete(index=CHALLENGE_INDEX, id=challenge_id)
+        except NotFoundError:
+            return False
+        for index in (BREAKDOWN_INDEX, TESTCASE_INDEX):
+            try:
+                await es.delete(index=index, id=challenge_id)
+            except NotFoundError:
+                pass
+        return True
+    finally:
+        # Again once deleted: a read during the deletes may have re-cached it
+        challenge_meta_cache.invalidate(challenge_id)
+        invalidate_challenge_evaluations(challenge_id)
+
+
+def invalidate_group_challenges(group_id: str):
+    """Drops cached metadata for every challenge of a deleted group."""
+    challenge_meta_cache.invalidate_where(lambda _, meta: meta.get("group_id") == group_id)
+
+
 async def get_challenge_by_id(challenge_id: str) -> Dict | None:
     """Retrieves a challenge document by its ID."""
     try:
-        res = await es.get(index=CHALLENGE_INDEX, id=challenge_id)
+        res = await get_es().get(index=CHALLENGE_INDEX, id=challenge_id)
         return res.get("_source")
     except NotFoundError:
         return None
@@ -61,7 +162,7 @@ async def save_submission(submission: Dict) -> str:
     Saves a submission document to Elasticsearch.
     Crucially, this function now assumes 'username' is part of the 'submission' dictionary.
     """
-    res = await es.index(index=SUBMISSION_INDEX, document=submission)
+    res = await get_es().index(index=SUBMISSION_INDEX, document=submission)
     print(f"[✅] Submission saved: {res['_id']}")
 
     # Automatically update leaderboard XP if completed
@@ -89,7 +190,7 @@ async def save_submission(submission: Dict) -> str:
 async def get_submission_by_id(submission_id: str) -> Dict | None:
     """Retrieves a submission document by its ID."""
     try:
-        res = await es.get(index=SUBMISSION_INDEX, id=submission_id)
+        res = await get_es().get(index=SUBMISSION_INDEX, id=submission_id)
         return res.get("_source")
     except NotFoundError:
         return None
@@ -108,15 +209,11 @@ async def update_leaderboard_xp(user_id: str, challenge_id: str, xp_to_add: int,
         print("[WARN] Cannot update leaderboard for an unknown user.")
         return
 
-    try:
-        challenge_doc = await es.get(index=CHALLENGE_INDEX, id=challenge_id)
-        group_id = challenge_doc["_source"].get("group_id")
-        # THIS IS THE KEY CHANGE: REMOVE THE OLD PROBLEMATIC LINE BELOW!
-        # if not username:
-        #     username = user_id  # Placeholder until real user fetch
-    except NotFoundError:
+    challenge_meta = await get_challenge_meta(challenge_id)
+    if challenge_meta is None:
         print(f"[ERROR] Cannot update leaderboard: Challenge {challenge_id} not found.")
         return
+    group_id = challenge_meta.get("group_id")
 
     if not group_id:
         print(f"[WARN] Challenge {challenge_id} has no group_id. Skipping leaderboard update.")
@@ -144,8 +241,10 @@ async def update_leaderboard_xp(user_id: str, challenge_id: str, xp_to_add: int,
     }
 
     try:
-        await es.update(index=LEADERBOARD_INDEX, id=doc_id, script=script, upsert=upsert_doc)
+        await get_es().update(index=LEADERBOARD_INDEX, id=doc_id, script=script, upsert=upsert_doc)
         print(f"[✅] XP updated in leaderboard for {final_username_for_upsert}: {doc_id}")
+        # Keep the in-memory ranking in step with the write that just succeeded
+        leaderboard_engine.apply_xp(group_id, user_id, xp_to_add, final_username_for_upsert)
     except RequestError as e:
         print("[ERROR] Failed to update leaderboard entry:", e)
 
@@ -156,9 +255,50 @@ async def get_leaderboard(group_id=None):
     else:
         query = {"match_all": {}}
 
-    results = await es.search(index="leaderboard", body={"query": query})
+    results = await get_es().search(index="leaderboard", body={"query": query})
     
     # ✅ FIX: Return only the _source fields
     return [hit["_source"] for hit in results["hits"]["hits"]]
 
 
+async def get_global_leaderboard(limit: int = 50, offset: int = 0) -> tuple[List[Dict], bool]:
+    """
+    Sums XP per user across all groups inside Elasticsearch, ordered by total XP
+    with user_id as a stable tie-break. Returns one page of rows and whether
+    another page follows.
+    """
+    offset = min(offset, MAX_LEADERBOARD_DEPTH)
+    body = {
+        "size": 0,
+        "aggs": {
+            "users": {
+                "terms": {
+                    "field": "user_id",
+                    # One extra bucket tells us whether there is a next page
+                    "size": offset + limit + 1,
+                    "order": [{"total_xp": "desc"}, {"_key": "asc"}],
+                },
+                "aggs": {
+                    "total_xp": {"sum": {"field": "xp"}},
+                    "user": {"top_hits": {"size": 1, "_source": ["username"]}},
+                    "page": {"bucket_sort": {"from": offset, "size": limit + 1}},
+                },
+            }
+        },
+    }
+
+    results = await get_es().search(index=LEADERBOARD_INDEX, body=body)
+    buckets = results["aggregations"]["users"]["buckets"]
+
+    rows = []
+    for bucket in buckets[:limit]:
+        hits = bucket["user"]["hits"]["hits"]
+        username = hits[0]["_source"].get("username") if hits else None
+        rows.append({
+            "user_id": bucket["key"],
+            "username": username or "Unknown",
+            "xp": bucket["total_xp"]["value"],
+        })
+
+    has_more = len(buckets) > limit and offset + limit < MAX_LEADERBOARD_DEPTH
+    return rows, has_more
@@ -0,0 +1,65 @@
+"""
+Exports submissions, challenges or the leaderboard as (gzipped) NDJSON,
+straight from Elasticsearch:
+
+    python -m utils.export_data submissions --group <group_id> --since 2026-01-01 -o subs.ndjson.gz
+    python -m utils.export_data leaderboard -o - --no-gzip | jq .
+
+Same filters and format as GET /admin/export/{kind}; reads one page at a
+time, so memory stays constant however large the export.
+"""
+import sys
+import asyncio
+import argparse
+from contextlib import redirect_stdout
+from datetime import datetime
+from search.connection import close_es
+from manager.export_manager import EXPORTS, build_export_query, export_ndjson, gzip_stream
+
+
+def _parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("kind", choices=list(EXPORTS))
+    parser.add_argument("--group", dest="group_id")
+    parser.add_argument("--challenge", dest="challenge_id")
+    parser.add_argument("--since", type=datetime.fromisoformat, help="inclusive, ISO 8601")
+    parser.add_argument("--until", type=datetime.fromisoformat, help="exclusive, ISO 8601")
+    parser.add_argument("-o", "--output", default="-", help="file path, or - for stdout (default)")
+    parser.add_argument("--no-gzip", dest="compress", action="store_false")
+    return parser.parse_args(argv)
+
+
+async def export_data(args: argparse.Namespace, stdout) -> int:
+    query = await build_export_query(args.kind, args.group_id, args.challenge_id, args.since, args.until)
+    chunks = export_ndjson(args.kind, query)
+    if args.compress:
+        chunks = gzip_stream(chunks)
+
+    out = stdout if args.output == "-" else open(args.output, "wb")
+    written = 0
+    try:
+        async for chunk in chunks:
+            out.write(chunk)
+            written += len(chunk)
+    finally:
+        if out is not stdout:
+            out.close()
+    return written
+
+
+async def main(argv=None):
+    args = _parse_args(argv)
+    stdout = sys.stdout.buffer
+    # Log lines go to stderr so `-o -` output stays valid NDJSON / gzip
+    with redirect_stdout(sys.stderr):
+        try:
+            written = await export_data(args, stdout)
+            print(f"[OK] Exported {args.kind}: {written} bytes")
+        except ValueError as e:
+            print(f"[ERROR] {e}")
+            sys.exit(2)
+        finally:
+            await close_es()
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,134 @@
+"""
+Minimal fake of the GitHub REST endpoints used by repo provisioning, with
+primary rate-limit headers and injectable secondary rate limits.
+
+    uvicorn utils.fake_github_api:app --port 9000
+    GITHUB_API_URL=http://localhost:9000 GITHUB_ACCESS_TOKEN=fake ...
+
+FAKE_GITHUB_RATE_LIMIT sets the primary budget per FAKE_GITHUB_RESET_SECONDS
+window; every FAKE_GITHUB_SECONDARY_EVERY-th write answers 403 with
+Retry-After: FAKE_GITHUB_RETRY_AFTER (0 disables). GET /_state shows what was
+created.
+"""
+import os
+import time
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+RATE_LIMIT = int(os.getenv("FAKE_GITHUB_RATE_LIMIT", "5000"))
+RESET_SECONDS = int(os.getenv("FAKE_GITHUB_RESET_SECONDS", "3600"))
+SECONDARY_EVERY = int(os.getenv("FAKE_GITHUB_SECONDARY_EVERY", "0"))
+RETRY_AFTER = int(os.getenv("FAKE_GITHUB_RETRY_AFTER", "2"))
+OWNER = "dojo-bot"
+
+app = FastAPI(title="Fake GitHub API")
+
+state = {
+    "repos": {},   # name -> {"collaborators": set, "hooks": int}
+    "writes": 0,
+    "window_start": time.time(),
+    "used": 0,
+    "secondary_limited": 0,
+}
+
+
+def _headers() -> dict:
+    reset = int(state["window_start"] + RESET_SECONDS)
+    return {
+        "X-RateLimit-Limit": str(RATE_LIMIT),
+        "X-RateLimit-Remaining": str(max(0, RATE_LIMIT - state["used"])),
+        "X-RateLimit-Reset": str(reset),
+    }
+
+
+def _reply(status: int, body: dict) -> JSONResponse:
+    return JSONResponse(status_code=status, content=body, headers=_headers())
+
+
+def _repo_json(request: Request, name: str) -> dict:
+    base = str(request.base_url).rstrip("/")
+    return {
+        "id": abs(hash(name)) % 10**8,
+        "name": name,
+        "full_name": f"{OWNER}/{name}",
+        "private": True,
+        "owner": {"login": OWNER},
+        "url": f"{base}/repos/{OWNER}/{name}",
+        "clone_url": f"https://github.com/{OWNER}/{name}.git",
+    }
+
+
+@app.middleware("http")
+async def rate_limit(request: Request, call_next):
+    if request.url.path.startswith("/_"):
+        return await call_next(request)
+    if time.time() >= state["window_start"] + RESET_SECONDS:
+        state["window_start"], state["used"] = time.time(), 0
+    if state["used"] >= RATE_LIMIT:
+        return _reply(403, {"message": "API rate limit exceeded"})
+    state["used"] += 1
+
+    if request.method in ("POST", "PUT", "PATCH", "DELETE"):
+        state["writes"] += 1
+        if SECONDARY_EVERY and state["writes"] % SECONDARY_EVERY == 0:
+            state["secondary_limited"] += 1
+            response = _reply(403, {"message": "You have exceeded a secondary rate limit."})
+            response.headers["Retry-After"] = str(RETRY_AFTER)
+            return response
+
+    response = await call_next(request)
+    response.headers.update(_headers())
+    return response
+
+
+@app.get("/user")
+async def get_user():
+    return _reply(200, {"login": OWNER, "id": 1, "type": "User"})
+
+
+@app.post("/user/repos")
+async def create_repo(request: Request):
+    name = (await request.json())["name"]
+    if name in state["repos"]:
+        return _reply(422, {
+            "message": "Repository creation failed.",
+            "errors": [{"resource": "Repository", "field": "name", "message": "name already exists on this account"}],
+        })
+    state["repos"][name] = {"collaborators": set(), "hooks": 0}
+    return _reply(201, _repo_json(request, name))
+
+
+@app.get("/repos/{owner}/{name}")
+async def get_repo(owner: str, name: str, request: Request):
+    if name not in state["repos"]:
+        return _reply(404, {"message": "Not Found"})
+    return _reply(200, _repo_json(request, name))
+
+
+@app.put("/repos/{owner}/{name}/collaborators/{username}")
+async def add_collaborator(owner: str, name: str, username: str):
+    if name not in state["repos"]:
+        return _reply(404, {"message": "Not Found"})
+    state["repos"][name]["collaborators"].add(username)
+    return _reply(201, {"id": 1, "permissions": "write"})
+
+
+@app.post("/repos/{owner}/{name}/hooks")
+async def create_hook(owner: str, name: str):
+    repo = state["repos"].get(name)
+    if repo is None:
+        return _reply(404, {"message": "Not Found"})
+    if repo["hooks"]:
+        return _reply(422, {"message": "Validation Failed", "errors": [{"message": "Hook already exists on this repository"}]})
+    repo["hooks"] += 1
+    return _reply(201, {"id": repo["hooks"], "name": "web", "active": True, "events": ["push"], "config": {}})
+
+
+@app.get("/_state")
+async def get_state():
+    return {
+        "repos": {name: {"collaborators": sorted(r["collaborators"]), "hooks": r["hooks"]} for name, r in state["repos"].items()},
+        "writes": state["writes"],
+        "used": state["used"],
+        "secondary_limited": state["secondary_limited"],
+    }
@@ -1,7 +1,42 @@
-import subprocess
 import os
+import re
+import time
+import shutil
+import asyncio
+import tarfile
 import tempfile
-from pathlib import Path
+from collections import OrderedDict
+
+# --- Checkout limits ---
+# Clones are I/O heavy; cap how many run at once per worker so a push storm
+# cannot starve request handling.
+GIT_MAX_CONCURRENT_CHECKOUTS = int(os.getenv("GIT_MAX_CONCURRENT_CHECKOUTS", "4"))
+GIT_STEP_TIMEOUT_SECONDS = float(os.getenv("GIT_STEP_TIMEOUT_SECONDS", "120"))
+
+_checkout_slots = asyncio.Semaphore(GIT_MAX_CONCURRENT_CHECKOUTS)
+
+# --- Mirror cache ---
+# One bare repo per challenge repo, reused across pushes so only new commits
+# are downloaded. Least recently used mirrors are evicted past the size budget.
+GIT_MIRROR_ENABLED = os.getenv("GIT_MIRROR_ENABLED", "true").lower() in ("1", "true", "yes")
+GIT_MIRROR_DIR = os.getenv("GIT_MIRROR_DIR", os.path.join(tempfile.gettempdir(), "dojo-mirrors"))
+GIT_MIRROR_MAX_BYTES = int(float(os.getenv("GIT_MIRROR_MAX_MB", "2048")) * 1024 * 1024)
+
+_repo_locks: dict[str, asyncio.Lock] = {}
+_mirror_sizes: OrderedDict[str, int] | None = None  # repo key -> bytes, LRU order
+_mirror_stats = {"hits": 0, "fetches": 0, "fallbacks": 0, "evictions": 0}
+_extraction_totals: dict[str, int] = {}
+
+# --- Extraction budgets ---
+# Keep what we send to Agent 4 bounded even if a repo vendors dependencies.
+CODE_MAX_FILE_BYTES = int(os.getenv("CODE_MAX_FILE_BYTES", str(128 * 1024)))
+CODE_MAX_TOTAL_BYTES = int(os.getenv("CODE_MAX_TOTAL_BYTES", str(512 * 1024)))
+
+# Directories never worth reading, pruned without descending
+IGNORED_DIRS = {
+    ".git", "node_modules", "vendor", "__pycache__", ".venv", "venv", "env",
+    "dist", "build", "target", ".next", ".idea", ".vscode",
+}
 
 # --- List of common code file extensions to look for ---
 CODE_FILE_EXTENSIONS = [
@@ -25,59 +60,363 @@ CODE_FILE_EXTENSIONS = [
     "*.kt",      # Kotlin
     "*.rs",      # Rust
 ]
+CODE_FILE_SUFFIXES = {pattern[1:] for pattern in CODE_FILE_EXTENSIONS}
 
-def get_code_from_repo(clone_url: str, commit_hash: str) -> str:
+async def _run_git(*args: str, cwd: str | None = None, check: bool = True) -> str:
     """
-    Clones a Git repository to a temporary directory, checks out a specific commit,
-    and reads the content of all recognized coding files.
+    Runs one git command without blocking the event loop. The process is killed
+    if it exceeds GIT_STEP_TIMEOUT_SECONDS or the calling task is cancelled.
+    Returns stdout.
+    """
+    proc = await asyncio.create_subprocess_exec(
+        "git", *args,
+        cwd=cwd,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE,
+        env={**os.environ, "GIT_TERMINAL_PROMPT": "0"},  # never wait for credentials
+    )
+    try:
+        stdout, stderr = await asyncio.wait_for(proc.communicate(), timeout=GIT_STEP_TIMEOUT_SECONDS)
+    except asyncio.TimeoutError:
+        proc.kill()
+        await proc.wait()
+        raise RuntimeError(f"Git command timed out after {GIT_STEP_TIMEOUT_SECONDS}s: git {' '.join(args)}")
+    except asyncio.CancelledError:
+        proc.kill()
+        raise
 
-    Returns the concatenated content of all found files as a single string.
+    if check and proc.returncode != 0:
+        # Provide a more detailed error message if a Git command fails
+        raise RuntimeError(
+            f"Git command failed: git {' '.join(args)}\n"
+            f"--- STDOUT ---\n{stdout.decode(errors='replace')}\n"
+            f"--- STDERR ---\n{stderr.decode(errors='replace')}"
+        )
+    return stdout.decode(errors="replace")
+
+
+def _gitignore_rules(gitignore: str, base: str) -> list[tuple[re.Pattern, bool, bool]]:
+    """
+    Compiles a .gitignore found at repo-relative directory `base` into
+    (regex, negated, dir_only) rules matched against repo-relative paths.
+    Covers the common syntax: comments, !negation, trailing /, anchoring, * ? **.
     """
-    with tempfile.TemporaryDirectory() as temp_dir:
-        print(f"Cloning {clone_url} into temporary directory {temp_dir}...")
+    rules = []
+    try:
+        with open(gitignore, encoding="utf-8", errors="replace") as f:
+            lines = f.read().splitlines()
+    except OSError:
+        return rules
+
+    prefix = re.escape(f"{base}/") if base else ""
+    for line in lines:
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+        negated = line.startswith("!")
+        line = line.lstrip("!")
+        dir_only = line.endswith("/")
+        line = line.rstrip("/")
+        anchored = "/" in line  # a leading or inner slash anchors to the .gitignore's dir
+        line = line.lstrip("/")
+        if not line:
+            continue
+
+        pattern = ""
+        i = 0
+        while i < len(line):
+            if line.startswith("**/", i):
+                pattern += "(?:.*/)?"
+                i += 3
+            elif line.startswith("**", i):
+                pattern += ".*"
+                i += 2
+            elif line[i] == "*":
+                pattern += "[^/]*"
+                i += 1
+            elif line[i] == "?":
+                pattern += "[^/]"
+                i += 1
+            else:
+                pattern += re.escape(line[i])
+                i += 1
+
+        regex = f"^{prefix}{pattern}$" if anchored else f"^{prefix}(?:.*/)?{pattern}$"
+        rules.append((re.compile(regex), negated, dir_only))
+    return rules
+
+
+def _is_ignored(rel_path: str, is_dir: bool, rules: list[tuple[re.Pattern, bool, bool]]) -> bool:
+    ignored = False
+    for regex, negated, dir_only in rules:
+        if dir_only and not is_dir:
+            continue
+        if regex.match(rel_path):
+            ignored = not negated  # last matching rule wins
+    return ignored
+
 
+def _read_code_files(repo_dir: str) -> tuple[str, dict]:
+    """
+    Reads recognized code files under repo_dir into one string in a single
+    sorted os.scandir walk. Ignored directories are pruned, .gitignore rules are
+    honored, and binary, oversized or over-budget files are skipped.
+
+    Returns the code and stats for the walk.
+    """
+    stats = {
+        "files_scanned": 0,
+        "files_kept": 0,
+        "bytes_kept": 0,
+        "dirs_pruned": 0,
+        "skipped_ignored": 0,
+        "skipped_binary": 0,
+        "skipped_large": 0,
+        "skipped_budget": 0,
+    }
+    all_code = []
+    stack = [("", _gitignore_rules(os.path.join(repo_dir, ".gitignore"), ""))]
+
+    while stack:
+        rel_dir, rules = stack.pop()
+        abs_dir = os.path.join(repo_dir, rel_dir)
         try:
-            # --- Git Clone ---
-            # Using --depth 1 is efficient but requires fetching the specific commit later
-            subprocess.run(
-                ["git", "clone", "--depth", "1", clone_url, temp_dir], 
-                check=True, capture_output=True, text=True
-            )
-
-            # --- Git Fetch & Checkout ---
-            # Fetch the specific commit hash since a shallow clone might not include it
-            subprocess.run(
-                ["git", "fetch", "origin", commit_hash],
-                cwd=temp_dir, check=False, capture_output=True, text=True # Use check=False to ignore errors if commit is already present
-            )
-            
-            subprocess.run(
-                ["git", "checkout", commit_hash], 
-                cwd=temp_dir, check=True, capture_output=True, text=True
-            )
+            with os.scandir(abs_dir) as it:
+                entries = sorted(it, key=lambda e: e.name)
+        except OSError as e:
+            print(f"⚠ Could not list {abs_dir}: {e}")
+            continue
 
-            print(f"✅ Successfully checked out commit {commit_hash}.")
-        except subprocess.CalledProcessError as e:
-            # Provide a more detailed error message if a Git command fails
-            raise RuntimeError(f"Git command failed:\n--- STDOUT ---\n{e.stdout}\n--- STDERR ---\n{e.stderr}")
-
-        # --- Read File Contents ---
-        all_code = []
-        temp_path = Path(temp_dir)
-        
-        for extension in CODE_FILE_EXTENSIONS:
-            for code_file in temp_path.rglob(extension):
-                # Exclude files in .git directory
-                if ".git" in str(code_file):
+        subdirs = []
+        for entry in entries:
+            rel_path = f"{rel_dir}/{entry.name}" if rel_dir else entry.name
+            if entry.is_dir(follow_symlinks=False):
+                if entry.name in IGNORED_DIRS or _is_ignored(rel_path, True, rules):
+                    stats["dirs_pruned"] += 1
                     continue
+                nested = os.path.join(entry.path, ".gitignore")
+                subdirs.append((rel_path, rules + _gitignore_rules(nested, rel_path)))
+                continue
+            if not entry.is_file(follow_symlinks=False):
+                continue
+            if os.path.splitext(entry.name)[1].lower() not in CODE_FILE_SUFFIXES:
+                continue
+
+            stats["files_scanned"] += 1
+            if _is_ignored(rel_path, False, rules):
+                stats["skipped_ignored"] += 1
+                continue
+            size = entry.stat(follow_symlinks=False).st_size
+            if size > CODE_MAX_FILE_BYTES:
+                stats["skipped_large"] += 1
+                continue
+            if stats["bytes_kept"] + size > CODE_MAX_TOTAL_BYTES:
+                stats["skipped_budget"] += 1
+                continue
+            try:
+                with open(entry.path, "rb") as f:
+                    raw = f.read(CODE_MAX_FILE_BYTES + 1)
+                if b"\0" in raw[:8192]:
+                    stats["skipped_binary"] += 1
+                    continue
+                content = raw.decode("utf-8")
+            except UnicodeDecodeError:
+                stats["skipped_binary"] += 1
+                continue
+            except OSError as e:
+                print(f"⚠ Could not read file {entry.path}: {e}")
+                continue
+
+            header = f"# --- File: {rel_path} ---\n"
+            all_code.append(header + content)
+            stats["files_kept"] += 1
+            stats["bytes_kept"] += len(raw)
+
+        # Reversed so the stack visits subdirectories in name order
+        stack.extend(reversed(subdirs))
+
+    if not all_code:
+        raise ValueError("❌ No recognized code files found in the repository.")
+
+    return "\n\n".join(all_code), stats
+
+
+async def _git_succeeds(*args: str, cwd: str | None = None) -> bool:
+    try:
+        await _run_git(*args, cwd=cwd)
+        return True
+    except RuntimeError:
+        return False
+
+
+def _repo_key(repo_name: str | None, clone_url: str) -> str:
+    """Filesystem-safe mirror name from the repo full name (owner/repo)."""
+    if not repo_name:
+        # https://github.com/owner/repo.git -> owner/repo
+        path = re.sub(r"\.git$", "", clone_url.rstrip("/"))
+        repo_name = "/".join(re.split(r"[/:]", path)[-2:])
+    return re.sub(r"[^A-Za-z0-9._-]", "_", repo_name.replace("/", "__"))
+
+
+def _mirror_path(key: str) -> str:
+    return os.path.join(GIT_MIRROR_DIR, f"{key}.git")
+
+
+def _dir_size(path: str) -> int:
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.lstat(os.path.join(root, name)).st_size
+            except OSError:
+                pass
+    return total
+
+
+def _scan_mirrors() -> OrderedDict[str, int]:
+    """Rebuilds the LRU index from disk, oldest mirror first."""
+    os.makedirs(GIT_MIRROR_DIR, exist_ok=True)
+    mirrors = []
+    for entry in os.scandir(GIT_MIRROR_DIR):
+        if entry.is_dir() and entry.name.endswith(".git"):
+            mirrors.append((entry.stat().st_mtime, entry.name[:-4], _dir_size(entry.path)))
+    return OrderedDict((key, size) for _, key, size in sorted(mirrors))
+
+
+def _extract_tar(archive: str, dest: str):
+    with tarfile.open(archive) as tar:
+        tar.extractall(dest, filter="data")
+
+
+async def _touch_mirror(key: str):
+    """Marks a mirror most recently used and records its current size."""
+    global _mirror_sizes
+    if _mirror_sizes is None:
+        _mirror_sizes = await asyncio.to_thread(_scan_mirrors)
+    path = _mirror_path(key)
+    _mirror_sizes[key] = await asyncio.to_thread(_dir_size, path)
+    _mirror_sizes.move_to_end(key)
+    os.utime(path)
+
+
+async def _evict_mirrors():
+    """Removes least recently used mirrors until the cache fits GIT_MIRROR_MAX_BYTES."""
+    if _mirror_sizes is None:
+        return
+    total = sum(_mirror_sizes.values())
+    for key in list(_mirror_sizes):
+        if total <= GIT_MIRROR_MAX_BYTES:
+            break
+        lock = _repo_locks.setdefault(key, asyncio.Lock())
+        if lock.locked():
+            continue  # in use right now; try older ones first
+        async with lock:
+            total -= _mirror_sizes.pop(key, 0)
+            await asyncio.to_thread(shutil.rmtree, _mirror_path(key), True)
+            _mirror_stats["evictions"] += 1
+            print(f"[GIT] Evicted mirror {key}")
+
+
+async def _checkout_from_mirror(key: str, clone_url: str, commit_hash: str, dest: str):
+    """
+    Fetches commit_hash into the repo's bare mirror if it is not already there,
+    then materializes the tree into dest with git archive (no checkout).
+    """
+    mirror = _mirror_path(key)
+    async with _repo_locks.setdefault(key, asyncio.Lock()):
+        if not os.path.isdir(mirror):
+            os.makedirs(GIT_MIRROR_DIR, exist_ok=True)
+            await _run_git("init", "--bare", "--quiet", mirror)
+
+        if await _git_succeeds("cat-file", "-e", f"{commit_hash}^{{commit}}", cwd=mirror):
+            _mirror_stats["hits"] += 1
+        else:
+            _mirror_stats["fetches"] += 1
+            # Only the pushed commit is downloaded; older objects stay in the mirror
+            await _run_git("fetch", "--quiet", "--depth", "1", clone_url, commit_hash, cwd=mirror, check=False)
+            if not await _git_succeeds("cat-file", "-e", f"{commit_hash}^{{commit}}", cwd=mirror):
+                # Server refused a fetch by SHA; fall back to fetching the branches
+                await _run_git("fetch", "--quiet", clone_url, "+refs/heads/*:refs/heads/*", cwd=mirror)
+
+        archive = os.path.join(os.path.dirname(dest), "tree.tar")
+        await _run_git("archive", "--format=tar", "-o", archive, commit_hash, cwd=mirror)
+        await _touch_mirror(key)
+
+    await asyncio.to_thread(_extract_tar, archive, dest)
+    await _evict_mirrors()
+
+
+async def _checkout_fresh(clone_url: str, commit_hash: str, dest: str):
+    """Shallow clone into dest and check out commit_hash."""
+    # --- Git Clone ---
+    # Using --depth 1 is efficient but requires fetching the specific commit later
+    await _run_git("clone", "--depth", "1", clone_url, dest)
+
+    # --- Git Fetch & Checkout ---
+    # Fetch the specific commit hash since a shallow clone might not include it.
+    # check=False ignores errors if the commit is already present.
+    await _run_git("fetch", "--depth", "1", "origin", commit_hash, cwd=dest, check=False)
+    await _run_git("checkout", commit_hash, cwd=dest)
+
+
+async def get_code_from_repo(clone_url: str, commit_hash: str, repo_name: str | None = None) -> str:
+    """
+    Materializes a specific commit of a Git repository in a temporary directory
+    and reads the content of all recognized coding files.
+
+    The commit comes from the repo's persistent bare mirror when the cache is
+    enabled (repo_name is its key), falling back to a fresh shallow clone if the
+    mirror cannot produce it. Runs at most GIT_MAX_CONCURRENT_CHECKOUTS at a
+    time; the temporary directory is removed even if the task is cancelled.
+
+    Returns the concatenated content of all found files as a single string.
+    """
+    async with _checkout_slots:
+        temp_dir = tempfile.mkdtemp(prefix="dojo-checkout-")
+        try:
+            src_dir = os.path.join(temp_dir, "src")
+            checked_out = False
+            if GIT_MIRROR_ENABLED:
+                key = _repo_key(repo_name, clone_url)
                 try:
-                    header = f"# --- File: {code_file.relative_to(temp_dir)} ---\n"
-                    content = code_file.read_text(encoding="utf-8")
-                    all_code.append(header + content)
-                except Exception as e:
-                    print(f"⚠ Could not read file {code_file}: {e}")
+                    await _checkout_from_mirror(key, clone_url, commit_hash, src_dir)
+                    checked_out = True
+                except (RuntimeError, OSError, tarfile.TarError) as e:
+                    _mirror_stats["fallbacks"] += 1
+                    print(f"⚠ Mirror checkout failed for {key}, cloning fresh: {e}")
+                    await asyncio.to_thread(shutil.rmtree, src_dir, True)
+
+            if not checked_out:
+                print(f"Cloning {clone_url} into temporary directory {src_dir}...")
+                await _checkout_fresh(clone_url, commit_hash, src_dir)
+            print(f"✅ Successfully checked out commit {commit_hash}.")
+
+            # --- Read File Contents ---
+            code, stats = await asyncio.to_thread(_read_code_files, src_dir)
+            for name, value in stats.items():
+                _extraction_totals[name] = _extraction_totals.get(name, 0) + value
+            print(f"📄 Extracted {stats['files_kept']}/{stats['files_scanned']} files, {stats['bytes_kept']} bytes: {stats}")
+            return code
+        finally:
+            # Shielded so cleanup still finishes if we are cancelled mid-await
+            await asyncio.shield(asyncio.to_thread(shutil.rmtree, temp_dir, True))
+
+
+def git_mirror_stats() -> dict:
+    sizes = _mirror_sizes or {}
+    return {
+        **_mirror_stats,
+        "enabled": GIT_MIRROR_ENABLED,
+        "mirrors": len(sizes),
+        "bytes": sum(sizes.values()),
+        "max_bytes": GIT_MIRROR_MAX_BYTES,
+    }
 
-        if not all_code:
-            raise ValueError("❌ No recognized code files found in the repository.")
 
-        return "\n\n".join(all_code)
\ No newline at end of file
+def code_extraction_stats() -> dict:
+    """Cumulative extraction counters plus the configured budgets."""
+    return {
+        **_extraction_totals,
+        "max_file_bytes": CODE_MAX_FILE_BYTES,
+        "max_total_bytes": CODE_MAX_TOTAL_BYTES,
+    }
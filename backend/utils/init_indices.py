@@ -1,24 +1,35 @@
-from elasticsearch import Elasticsearch
+import asyncio
+from search.connection import get_es, close_es
+from services.job_queue import JOB_INDEX, JOB_INDEX_MAPPING
+from manager.challenge_pool import CHALLENGE_POOL_INDEX, CHALLENGE_POOL_MAPPING
+from manager.repo_provisioning import PROVISIONING_INDEX, PROVISIONING_INDEX_MAPPING
+from manager.submission_manager import SUMMARY_INDEX, SUMMARY_INDEX_MAPPING
 
-es = Elasticsearch("http://localhost:9200")
 
-
-def create_index(index_name: str, mapping: dict):
-    if not es.indices.exists(index=index_name):
-        es.indices.create(index=index_name, body={"mappings": {"properties": mapping}})
+async def create_index(index_name: str, mapping: dict):
+    es = get_es()
+    if not await es.indices.exists(index=index_name):
+        await es.indices.create(index=index_name, body={"mappings": {"properties": mapping}})
         print(f"[OK] Created index: {index_name}")
     else:
         print(f"[SKIP] Index already exists: {index_name}")
 
-def initialize_all_indexes():
-    create_index("users", {
+async def initialize_all_indexes():
+    await create_index("users", {
         "username": {"type": "keyword"},
         "email": {"type": "keyword"},
         "hashed_password": {"type": "keyword"},
         "created_at": {"type": "date"}
     })
 
-    create_index("groups", {
+    # email -> user_id lookup, document ID is the lowercased email
+    await create_index("user_emails", {
+        "user_id": {"type": "keyword"},
+        "email": {"type": "keyword"}
+    })
+
+    await create_index("groups", {
+        "id": {"type": "text", "fields": {"keyword": {"type": "keyword"}}},  # id.keyword: paged-list tiebreaker
         "name": {"type": "text", "fields": {"keyword": {"type": "keyword"}}},
         "description": {"type": "text"},
         "created_by": {"type": "keyword"},
@@ -26,44 +37,76 @@ def initialize_all_indexes():
         "members": {"type": "keyword"} # To store a list of user_ids
     })
 
-    create_index("challenges", {
+    await create_index("challenges", {
+        "id": {"type": "text", "fields": {"keyword": {"type": "keyword"}}},
         "topic": {"type": "text"},
         "difficulty": {"type": "keyword"},
         "group_id": {"type": "keyword"},
         "created_by": {"type": "keyword"},
         "created_at": {"type": "date"},
-        "problem_statement": {"type": "text"}
+        "problem_statement": {"type": "text"},
+        "status": {"type": "keyword"},  # generating | ready | failed
+        "generation_steps": {"type": "object", "enabled": False},
+        "generation_error": {"type": "text", "index": False},
+        "generation_run": {"type": "integer"},
+        "generated_at": {"type": "date"},
+        "repos_status": {"type": "keyword"},  # pending | provisioning | provisioned | failed
+        "repos_run": {"type": "integer"}
     })
 
     # This index is for the Agent 2 breakdown output
-    create_index("breakdowns", {
+    await create_index("breakdowns", {
         "challenge_id": {"type": "keyword"},
         "breakdown": {"type": "text"}
     })
 
     # --- UPDATED MAPPING ---
-    create_index("testcases", {
+    await create_index("testcases", {
         "challenge_id": {"type": "keyword"},
         # Storing the (potentially large) string of test cases from Agent 3
         "testcases": {"type": "text", "index": False} # 'index: False' saves space if you don't need to search this text
     })
 
-    create_index("submissions", {
+    await create_index("submissions", {
+        "id": {"type": "text", "fields": {"keyword": {"type": "keyword"}}},
         "challenge_id": {"type": "keyword"},
         "user_id": {"type": "keyword"},
         "username": {"type": "keyword"},
         "status": {"type": "keyword"},
         "score": {"type": "float"},
         "feedback": {"type": "text", "index": False},
+        "source": {"type": "keyword"},
+        "delivery_id": {"type": "keyword"},  # X-GitHub-Delivery of webhook submissions
+        "created_at": {"type": "date"},
+        "pushed_at": {"type": "date"},
+        "superseded_by": {"type": "keyword"},
         "submitted_at": {"type": "date"}
     })
 
-    create_index("leaderboard", {
+    await create_index("leaderboard", {
         "user_id": {"type": "keyword"},
         "username": {"type": "keyword"},
         "group_id": {"type": "keyword"},
         "xp": {"type": "float"}
     })
 
+    # Durable job queues (submission evaluation, webhook events, ...)
+    await create_index(JOB_INDEX, JOB_INDEX_MAPPING)
+
+    # Pre-generated challenges waiting to be claimed
+    await create_index(CHALLENGE_POOL_INDEX, CHALLENGE_POOL_MAPPING)
+
+    # Per-member GitHub repo provisioning results
+    await create_index(PROVISIONING_INDEX, PROVISIONING_INDEX_MAPPING)
+
+    # Per-(challenge, user) submission summaries
+    await create_index(SUMMARY_INDEX, SUMMARY_INDEX_MAPPING)
+
+async def main():
+    try:
+        await initialize_all_indexes()
+    finally:
+        await close_es()
+
 if __name__ == "__main__":
-    initialize_all_indexes()
\ No newline at end of file
+    asyncio.run(main())
\ No newline at end of file
@@ -0,0 +1,59 @@
+"""
+Backfills the user_emails lookup index from existing users documents.
+
+Run once after deploying email-keyed lookups:
+
+    python -m utils.migrate_user_emails
+
+Safe to re-run: lookups are written with op_type=create, so existing ones are
+left alone. If two legacy users share an email, the first one scanned keeps
+the lookup. Once it has run, set USER_EMAIL_SEARCH_FALLBACK=false.
+"""
+import asyncio
+from elasticsearch.helpers import async_scan, async_streaming_bulk
+from search.connection import get_es, close_es
+from manager.auth_manager import USER_INDEX, USER_EMAIL_INDEX, email_key
+from utils.init_indices import create_index
+
+
+async def _lookup_actions():
+    async for hit in async_scan(get_es(), index=USER_INDEX, query={"query": {"match_all": {}}}, _source=["email"]):
+        email = hit["_source"].get("email")
+        if not email:
+            print(f"[SKIP] User {hit['_id']} has no email")
+            continue
+        yield {
+            "_op_type": "create",
+            "_index": USER_EMAIL_INDEX,
+            "_id": email_key(email),
+            "_source": {"user_id": hit["_id"], "email": email},
+        }
+
+
+async def migrate_user_emails():
+    await create_index(USER_EMAIL_INDEX, {
+        "user_id": {"type": "keyword"},
+        "email": {"type": "keyword"}
+    })
+
+    created = existing = 0
+    async for ok, item in async_streaming_bulk(get_es(), _lookup_actions(), raise_on_error=False):
+        result = item["create"]
+        if ok:
+            created += 1
+        elif result.get("status") == 409:
+            existing += 1
+        else:
+            print(f"[ERROR] {result['_id']}: {result.get('error')}")
+
+    print(f"[OK] Created {created} email lookups, {existing} already present.")
+
+
+async def main():
+    try:
+        await migrate_user_emails()
+    finally:
+        await close_es()
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,111 @@
+import os
+import json
+import base64
+from typing import AsyncIterator, List, Optional, Tuple
+from search.connection import get_es
+
+# How long a full scan keeps its point in time open between batches
+PAGINATION_PIT_KEEP_ALIVE = os.getenv("PAGINATION_PIT_KEEP_ALIVE", "5m")
+
+
+def encode_cursor(state: dict) -> str:
+    """Packs paging state into an opaque, URL-safe cursor string."""
+    raw = json.dumps(state, separators=(",", ":"), default=str).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> dict:
+    """
+    Unpacks a cursor produced by encode_cursor.
+    Raises ValueError if the cursor is malformed.
+    """
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        state = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except Exception:
+        raise ValueError(f"Invalid cursor: {cursor!r}")
+    if not isinstance(state, dict):
+        raise ValueError(f"Invalid cursor: {cursor!r}")
+    return state
+
+
+async def search_page(
+    index: str,
+    query: dict,
+    sort: list,
+    limit: int,
+    after: Optional[str] = None,
+    source_includes: Optional[List[str]] = None,
+    source_excludes: Optional[List[str]] = None,
+    tiebreaker: str = "id.keyword",
+) -> Tuple[List[dict], Optional[str]]:
+    """
+    One page of hits in `sort` order and the cursor for the next page (None
+    on the last page). Pages are read with search_after on `sort` plus the
+    unique keyword field `tiebreaker` (the keyword sub-field of `id`, as
+    dynamic mapping creates it), so each request costs `limit` hits however
+    deep it goes and no search context is held open between pages. Documents
+    without an `id` are backfilled by utils.backfill_doc_ids. Raises
+    ValueError for a malformed cursor.
+    """
+    state = decode_cursor(after) if after else {}
+    if after and not isinstance(state.get("after"), list):
+        raise ValueError(f"Invalid cursor: {after!r}")
+
+    res = await get_es().search(
+        index=index,
+        query=query,
+        sort=[*sort, {tiebreaker: {"order": "asc", "unmapped_type": "keyword"}}],
+        size=limit + 1,  # one extra hit tells whether another page exists
+        search_after=state.get("after"),
+        source_includes=source_includes,
+        source_excludes=source_excludes,
+        track_total_hits=False,
+    )
+    hits = res["hits"]["hits"]
+    if len(hits) > limit:
+        hits = hits[:limit]
+        return hits, encode_cursor({"after": hits[-1]["sort"]})
+    return hits, None
+
+
+async def scan_pit(
+    index: str,
+    query: dict,
+    batch_size: int = 1000,
+    source_includes: Optional[List[str]] = None,
+    source_excludes: Optional[List[str]] = None,
+) -> AsyncIterator[dict]:
+    """
+    Yields every hit matching `query` in index order, reading `batch_size`
+    at a time with search_after inside a point in time, so memory stays
+    constant however many documents match. The point in time is closed when
+    the generator finishes or is closed early.
+    """
+    es = get_es()
+    pit_id = (await es.open_point_in_time(index=index, keep_alive=PAGINATION_PIT_KEEP_ALIVE))["id"]
+    search_after = None
+    try:
+        while True:
+            res = await es.search(
+                pit={"id": pit_id, "keep_alive": PAGINATION_PIT_KEEP_ALIVE},
+                query=query,
+                sort=[{"_shard_doc": "asc"}],  # cheapest order for a full scan
+                size=batch_size,
+                search_after=search_after,
+                source_includes=source_includes,
+                source_excludes=source_excludes,
+                track_total_hits=False,
+            )
+            pit_id = res.get("pit_id", pit_id)
+            hits = res["hits"]["hits"]
+            for hit in hits:
+                yield hit
+            if len(hits) < batch_size:
+                return
+            search_after = hits[-1]["sort"]
+    finally:
+        try:
+            await es.close_point_in_time(id=pit_id)
+        except Exception as e:
+            print(f"[PAGINATION WARN] Could not close point in time: {e}")
@@ -1,9 +1,64 @@
+import os
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
 from passlib.context import CryptContext
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# Changing BCRYPT_ROUNDS makes existing hashes "need update"; they are
+# rehashed transparently on the user's next successful login.
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", "4"))
+PASSWORD_HASH_MAX_QUEUE = int(os.getenv("PASSWORD_HASH_MAX_QUEUE", "64"))
+
+pwd_context = CryptContext(
+    schemes=["bcrypt"],
+    deprecated="auto",
+    bcrypt__default_rounds=BCRYPT_ROUNDS,
+    bcrypt__min_rounds=BCRYPT_ROUNDS,
+    bcrypt__max_rounds=BCRYPT_ROUNDS,
+)
+
+# bcrypt releases the GIL, so a small thread pool keeps hashing off the event loop
+_executor = ThreadPoolExecutor(max_workers=PASSWORD_HASH_WORKERS, thread_name_prefix="bcrypt")
+_pending = 0
+
+
+class PasswordPoolBusy(Exception):
+    """Raised when too many hash/verify calls are already queued."""
+
 
 def hash_password(password: str) -> str:
     return pwd_context.hash(password)
 
 def verify_password(plain: str, hashed: str) -> bool:
     return pwd_context.verify(plain, hashed)
+
+
+async def _run_in_pool(fn, *args):
+    global _pending
+    if _pending >= PASSWORD_HASH_MAX_QUEUE:
+        raise PasswordPoolBusy(f"{_pending} password operations already queued")
+    _pending += 1
+    try:
+        return await asyncio.get_running_loop().run_in_executor(_executor, fn, *args)
+    finally:
+        _pending -= 1
+
+async def hash_password_async(password: str) -> str:
+    """hash_password on the bcrypt pool. Raises PasswordPoolBusy when saturated."""
+    return await _run_in_pool(hash_password, password)
+
+async def verify_password_async(plain: str, hashed: str) -> tuple[bool, str | None]:
+    """
+    Verifies on the bcrypt pool. Returns (valid, new_hash); new_hash is set when
+    the stored hash uses an outdated cost factor and should be replaced.
+    Raises PasswordPoolBusy when saturated.
+    """
+    return await _run_in_pool(pwd_context.verify_and_update, plain, hashed)
+
+def password_pool_stats() -> dict:
+    return {
+        "workers": PASSWORD_HASH_WORKERS,
+        "max_queue": PASSWORD_HASH_MAX_QUEUE,
+        "pending": _pending,
+        "bcrypt_rounds": BCRYPT_ROUNDS,
+    }
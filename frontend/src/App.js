@@ -334,8 +334,7 @@ const handleFeedbackClick = async (userId) => {
   const fetchData = async () => {
     setLoading(true);
     try {
-      const groups = await api.getGroups();
-      const selectedGroup = groups.find((g) => (g.id || g.group_id) === groupId);
+      const selectedGroup = await api.getGroup(groupId).catch(() => null);
 
       if (!selectedGroup) {
         setError("Group not found");
@@ -362,8 +361,7 @@ useEffect(() => {
   async function loadGroupData() {
     setLoading(true);
     try {
-      const groupRes = await api.getGroups();
-      const groupData = groupRes.find((g) => g.id === groupId);
+      const groupData = await api.getGroup(groupId).catch(() => undefined);
       setGroup(groupData);
 
       const leaderboardRes = await api.getGroupLeaderboard(groupId);
@@ -583,8 +581,7 @@ useEffect(() => {
             </tr>
           </thead>
           <tbody>
-          {[...challengeHistory.slice(-5)]  // clone last 5
-            .reverse()                      // now reverse
+          {challengeHistory.slice(0, 5)  // newest first from the API
             .map((ch, idx) => (
               <tr key={idx} className="text-white border-t border-gray-700">
                 <td className="p-3">{idx + 1}</td>
@@ -1,7 +1,8 @@
 const API_BASE_URL = 'http://127.0.0.1:8000'; 
 
 const api = {
-  async request(endpoint, { body, method = 'GET', ...customConfig } = {}) {
+  // withCursor: resolve to { data, nextCursor } for cursor-paginated lists
+  async request(endpoint, { body, method = 'GET', withCursor = false, ...customConfig } = {}) {
     const token = localStorage.getItem('dojo_token');
     const headers = { 'Content-Type': 'application/json' };
 
@@ -25,7 +26,8 @@ const api = {
         const errorData = await response.json().catch(() => ({}));
         throw new Error(errorData.detail || 'Something went wrong');
       }
-      return response.status === 204 ? {} : response.json();
+      const data = response.status === 204 ? {} : await response.json();
+      return withCursor ? { data, nextCursor: response.headers.get('X-Next-Cursor') } : data;
     } catch (error) {
       console.error('API Error:', error);
       throw error;
@@ -63,7 +65,20 @@ const api = {
       body: { github_username },
     }),
 
-  getGroups: () => api.request('/groups/'),
+  // Follows X-Next-Cursor until every page of groups is loaded
+  getGroups: async () => {
+    let groups = [];
+    let after = null;
+    do {
+      const query = after ? `?limit=500&after=${encodeURIComponent(after)}` : '?limit=500';
+      const { data, nextCursor } = await api.request(`/groups/${query}`, { withCursor: true });
+      groups = groups.concat(data);
+      after = nextCursor;
+    } while (after);
+    return groups;
+  },
+
+  getGroup: (groupId) => api.request(`/groups/${groupId}`),
 
   createGroup: (name, description) =>
     api.request('/groups/', {